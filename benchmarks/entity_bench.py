@@ -0,0 +1,82 @@
+"""
+Benchmark: startup cost and scene size of coins and crabs, built the old
+way (a loadModel per part per entity) vs one flattened prototype per kind
+
+Run from the repository root:
+    python benchmarks/entity_bench.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from panda3d.core import loadPrcFileData
+
+loadPrcFileData('', 'window-type offscreen\naudio-library-name null')
+
+from direct.showbase.ShowBase import ShowBase
+from components.batching import batch_stats
+from components.coins import CoinManager
+from components.obstacles import ObstacleManager
+
+COUNTS = [50, 500, 2000]
+
+# Places every entity, so each run builds the same ones
+RNG = random.Random(1234)
+
+def build_per_part(base, manager_class, count, create):
+    """The pre-prototype path: every entity loads and keeps all of its parts"""
+    manager = manager_class.__new__(manager_class)
+    manager.loader = base.loader
+    root = base.render.attachNewNode("per_part")
+    manager.coin_root = manager.crab_root = root
+    for _ in range(count):
+        create(manager)(RNG.uniform(15, 185), RNG.uniform(15, 185), 1.0)
+    return root
+
+def build_prototype(base, manager_class, count, instanced):
+    """The current path: one prototype, drawn per entity"""
+    if manager_class is CoinManager:
+        manager = CoinManager(base.loader, base.render, num_coins=count, instanced=instanced, rng=RNG)
+        return manager.coin_root
+    manager = ObstacleManager(base.loader, base.render, num_obstacles=count, instanced=instanced, rng=RNG)
+    return manager.crab_root
+
+def measure(base, build):
+    """Build time in milliseconds and the resulting node/draw call counts"""
+    start = time.perf_counter()
+    root = build()
+    elapsed = (time.perf_counter() - start) * 1000
+    stats = batch_stats(root)
+    root.removeNode()
+    return elapsed, stats
+
+def main():
+    base = ShowBase()
+    
+    kinds = [
+        ('coins', CoinManager, lambda manager: manager._create_coin),
+        ('crabs', ObstacleManager, lambda manager: manager._create_crab),
+    ]
+    modes = [
+        ('per part', lambda cls, count, create: build_per_part(base, cls, count, create)),
+        ('prototype', lambda cls, count, create: build_prototype(base, cls, count, False)),
+        ('instanced', lambda cls, count, create: build_prototype(base, cls, count, True)),
+    ]
+    
+    print(f"{'kind':>6} {'count':>6} {'mode':>10} {'startup ms':>11} {'nodes':>8} {'draw calls':>11}")
+    for name, cls, create in kinds:
+        for count in COUNTS:
+            for mode, build in modes:
+                elapsed, stats = measure(base, lambda: build(cls, count, create))
+                print(
+                    f"{name:>6} {count:>6} {mode:>10} {elapsed:>11.1f}"
+                    f" {stats['nodes']:>8} {stats['draw_calls']:>11}"
+                )
+    
+    base.destroy()
+
+if __name__ == "__main__":
+    main()
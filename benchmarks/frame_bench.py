@@ -0,0 +1,274 @@
+"""
+Benchmark: per-frame times of the full game along scripted input paths
+
+Starts TerrainExplorer offscreen with a fixed seed and a fixed timestep,
+drives the player along each path and records, for every frame:
+    update  game logic, visuals and camera (TerrainExplorer.advance)
+    ui      HUD text updates plus culling and drawing the 2D layer
+    cull    culling the 3D scene
+    draw    issuing the 3D scene's draw calls (CPU side)
+    flip    the rest of renderFrame (buffer swap, driver sync)
+    frame   all of the above
+plus the average number of HUD text rebuilds per frame (ui rebuilds) and of
+triangles submitted for trees (tree tris).
+
+Run from the repository root:
+    python benchmarks/frame_bench.py --out bench.json
+    python benchmarks/frame_bench.py --tiny --scene large --path circle
+    python benchmarks/frame_bench.py --scene large --no-tree-lod
+    python benchmarks/frame_bench.py --scene large --shadows
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+# Entities spawn across each scene's terrain (num_tiles tiles of 40 m)
+SCENES = {
+    'small': {'num_tiles': 3, 'num_trees': 20, 'num_coins': 25, 'num_obstacles': 3},
+    'default': {'num_tiles': 5, 'num_trees': 40, 'num_coins': 50, 'num_obstacles': 5},
+    'large': {'num_tiles': 8, 'num_trees': 400, 'num_coins': 500, 'num_obstacles': 40},
+}
+
+AREAS = ['update', 'ui', 'cull', 'draw', 'flip', 'frame']
+
+def keys_for(forward=False, backward=False, left=False, right=False):
+    return {'forward': forward, 'backward': backward, 'left': left, 'right': right}
+
+# Scripted input: frame number -> key states
+PATHS = {
+    'straight': lambda frame: keys_for(forward=True),
+    'circle': lambda frame: keys_for(forward=True, left=True),
+    'zigzag': lambda frame: keys_for(forward=True, left=(frame // 60) % 2 == 0,
+                                     right=(frame // 60) % 2 == 1),
+    'spin': lambda frame: keys_for(right=True),
+}
+
+class FrameTimer:
+    """Times culling and drawing of each display region through callbacks"""
+    
+    def __init__(self, game):
+        from panda3d.core import PythonCallbackObject
+        
+        self.times = dict.fromkeys(AREAS, 0.0)
+        for region in game.win.getDisplayRegions():
+            camera = region.getCamera()
+            if camera.isEmpty():
+                continue
+            is_ui = camera == game.cam2d
+            region.setCullCallback(PythonCallbackObject(self._timed('ui' if is_ui else 'cull')))
+            region.setDrawCallback(PythonCallbackObject(self._timed('ui' if is_ui else 'draw')))
+    
+    def _timed(self, area):
+        def callback(data):
+            start = time.perf_counter()
+            data.upcall()
+            self.times[area] += time.perf_counter() - start
+        return callback
+    
+    def reset(self):
+        for area in self.times:
+            self.times[area] = 0.0
+
+def percentiles(samples):
+    """Summary statistics in milliseconds"""
+    ms = np.array(samples) * 1000
+    return {
+        'mean': round(float(ms.mean()), 4),
+        'p50': round(float(np.percentile(ms, 50)), 4),
+        'p95': round(float(np.percentile(ms, 95)), 4),
+        'p99': round(float(np.percentile(ms, 99)), 4),
+        'max': round(float(ms.max()), 4),
+    }
+
+def check_scene(game):
+    """Fail unless every coin, crab and tree stands on the scene's terrain"""
+    size = game.terrain.size
+    for name, xy in (
+        ('coins', game.coins.positions[:, :2]),
+        ('crabs', game.obstacles.positions[:, :2]),
+        ('trees', np.array(game.trees.trees).reshape(-1, 2)),
+    ):
+        if len(xy) and (xy.min() < 0 or xy.max() > size):
+            raise SystemExit(f"{name} spawned off the {size} m terrain")
+
+def run_path(game, timer, path, frames, warmup):
+    """Drive one scripted path and collect per-frame area times"""
+    samples = {area: [] for area in AREAS}
+    script = PATHS[path]
+    dt = 1.0 / 60.0
+    rebuilds = 0
+    triangles = 0
+    
+    for frame in range(warmup + frames):
+        if game.game_over:
+            game.restart_game()
+        game.keys.update(script(frame))
+        timer.reset()
+        rebuilds_before = game.ui.rebuilds
+        
+        start = time.perf_counter()
+        game.advance(dt)
+        game.update_shadows()
+        after_update = time.perf_counter()
+        game.update_ui()
+        after_ui = time.perf_counter()
+        game.graphicsEngine.renderFrame()
+        end = time.perf_counter()
+        
+        if frame < warmup:
+            continue
+        render = end - after_ui
+        samples['update'].append(after_update - start)
+        samples['ui'].append(after_ui - after_update + timer.times['ui'])
+        samples['cull'].append(timer.times['cull'])
+        samples['draw'].append(timer.times['draw'])
+        samples['flip'].append(render - timer.times['ui'] - timer.times['cull'] - timer.times['draw'])
+        samples['frame'].append(end - start)
+        rebuilds += game.ui.rebuilds - rebuilds_before
+        triangles += sum(game.trees.get_triangle_count(game.cam).values())
+    
+    results = {area: percentiles(values) for area, values in samples.items()}
+    results['ui_rebuilds'] = round(rebuilds / frames, 4)
+    results['tree_triangles'] = round(triangles / frames)
+    return results
+
+def run_scene(scene, paths, frames, warmup, seed, hud_rate=None, tree_lod=None, shadows=False):
+    """Start the game for one scene and benchmark each path from the world as it was loaded"""
+    from terrain_game import TerrainExplorer
+    
+    game = TerrainExplorer(
+        seed=seed, hud_rate=hud_rate, tree_lod_distances=tree_lod, shadows=shadows, **SCENES[scene]
+    )
+    while not game.loaded:
+        game.taskMgr.step()
+    check_scene(game)
+    
+    # The harness owns the frame loop
+    game.taskMgr.remove("update")
+    timer = FrameTimer(game)
+    
+    results = {}
+    for path in paths:
+        # Coins, crabs, score and camera all start over, so paths don't depend on their order
+        game.reset_session()
+        results[path] = run_path(game, timer, path, frames, warmup)
+    
+    info = {
+        'pipe': game.pipe.getInterfaceName(),
+        'renderer': game.win.getGsg().getDriverRenderer(),
+    }
+    game.destroy()
+    return results, info
+
+def git_commit():
+    """Current commit, so result files can be told apart"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_in_subprocess(scene, paths, args):
+    """Benchmark one scene in a fresh process and read back its results"""
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "scene.json")
+        command = [
+            sys.executable, os.path.abspath(__file__), "--scene", scene,
+            "--frames", str(args.frames), "--warmup", str(args.warmup),
+            "--seed", str(args.seed), "--size", args.size, "--out", out,
+        ]
+        if args.hud_rate:
+            command += ["--hud-rate", str(args.hud_rate)]
+        if args.no_tree_lod:
+            command.append("--no-tree-lod")
+        else:
+            command += ["--tree-lod"] + [str(distance) for distance in args.tree_lod]
+        if args.shadows:
+            command.append("--shadows")
+        for path in paths:
+            command += ["--path", path]
+        if args.tiny:
+            command.append("--tiny")
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        with open(out) as result:
+            return json.load(result)['scenes'][scene]
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame-time benchmark")
+    parser.add_argument("--scene", choices=sorted(SCENES), action="append")
+    parser.add_argument("--path", choices=sorted(PATHS), action="append")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--warmup", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--size", default="800 600", help="offscreen buffer size")
+    parser.add_argument("--tiny", action="store_true", help="use the TinyDisplay software renderer")
+    parser.add_argument("--hud-rate", type=float, help="limit position HUD refreshes per second")
+    parser.add_argument("--tree-lod", type=float, nargs=2, metavar=("LOW", "IMPOSTOR"),
+                        help="tree level-of-detail distances (the game's by default)")
+    parser.add_argument("--no-tree-lod", action="store_true", help="draw every tree at full detail")
+    parser.add_argument("--shadows", action="store_true", help="let the sun cast shadows")
+    parser.add_argument("--out", help="write results to this JSON file")
+    args = parser.parse_args()
+    
+    from components.trees import LOD_DISTANCES
+    
+    if args.tree_lod is None:
+        args.tree_lod = LOD_DISTANCES
+    tree_lod = None if args.no_tree_lod else tuple(args.tree_lod)
+    
+    from panda3d.core import loadPrcFileData
+    
+    config = f"window-type offscreen\naudio-library-name null\nwin-size {args.size}\nsync-video false"
+    if args.tiny:
+        config += "\nload-display p3tinydisplay"
+    loadPrcFileData('', config)
+    
+    scenes = args.scene or ['default']
+    paths = args.path or sorted(PATHS)
+    
+    report = {
+        'commit': git_commit(),
+        'seed': args.seed,
+        'frames': args.frames,
+        'size': args.size,
+        'hud_rate': args.hud_rate,
+        'tree_lod': tree_lod,
+        'shadows': args.shadows,
+        'scenes': {},
+    }
+    for scene in scenes:
+        # ShowBase can only be started once per process
+        if len(scenes) > 1:
+            report['scenes'][scene] = run_in_subprocess(scene, paths, args)
+            continue
+        results, info = run_scene(
+            scene, paths, args.frames, args.warmup, args.seed, args.hud_rate, tree_lod,
+            args.shadows
+        )
+        report['scenes'][scene] = {'params': SCENES[scene], 'paths': results, **info}
+    
+    for scene, result in report['scenes'].items():
+        print(f"{scene} ({result['renderer'] or result['pipe']})")
+        header = "".join(f"{area + ' p50/p99':>20}" for area in AREAS)
+        print(f"  {'path':<10}{header}{'ui rebuilds':>13}{'tree tris':>11}")
+        for path, areas in result['paths'].items():
+            cells = "".join(f"{areas[a]['p50']:>11.2f} /{areas[a]['p99']:>6.2f}" for a in AREAS)
+            print(f"  {path:<10}{cells}{areas['ui_rebuilds']:>13.2f}{areas['tree_triangles']:>11}")
+    
+    if args.out:
+        with open(args.out, 'w') as out:
+            json.dump(report, out, indent=2)
+        print(f"wrote {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark: a dedicated server under load from hundreds of bot clients
+
+Starts server.py on a free localhost port (or uses --connect), connects
+--bots clients that wander with random key presses, and after --seconds
+reports:
+    tick      server milliseconds per tick (simulation plus snapshots)
+    server    bytes per second sent to each client, as the server counts it
+    received  bytes per second each bot received (mean and worst)
+    snapshots snapshots per second each bot received
+    skipped   snapshots the server dropped for clients that fell behind
+
+Run from the repository root:
+    python benchmarks/net_load.py --bots 200 --seconds 20
+    python benchmarks/net_load.py --connect 127.0.0.1:7777 --bots 50
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from components.client import GameClient
+from components.simulation import RandomPolicy
+
+def free_port():
+    """A localhost port nothing is listening on right now"""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+def start_server(port, args):
+    """Launch server.py and wait until it listens"""
+    process = subprocess.Popen(
+        [sys.executable, "server.py", "--port", str(port), "--seed", str(args.seed),
+         "--tick-rate", str(args.tick_rate), "--snapshot-rate", str(args.snapshot_rate),
+         "--report", "3600"],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    for line in process.stdout:
+        if line.startswith("Listening"):
+            return process
+    raise RuntimeError("server exited before listening")
+
+async def run_bot(client, seed, seconds, input_rate):
+    """Wander: hold random key combinations, re-sending them input_rate times a second"""
+    policy = RandomPolicy(seed)
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        client.send_keys(policy(None))
+        await asyncio.sleep(1.0 / input_rate)
+
+async def load(host, port, args):
+    clients = []
+    for start in range(0, args.bots, 50):
+        batch = [GameClient() for _ in range(min(50, args.bots - start))]
+        await asyncio.gather(*(client.connect(host, port) for client in batch))
+        clients.extend(batch)
+    
+    # Count from after everyone has joined
+    for client in clients:
+        client.bytes_received = 0
+        client.snapshots = 0
+    began = time.perf_counter()
+    await asyncio.gather(*(
+        run_bot(client, args.seed + i, args.seconds, args.input_rate) for i, client in enumerate(clients)
+    ))
+    elapsed = time.perf_counter() - began
+    
+    stats = await clients[0].request_stats()
+    received = np.array([client.bytes_received for client in clients]) / elapsed
+    snapshots = np.array([client.snapshots for client in clients]) / elapsed
+    lost = sum(1 for client in clients if client.view.get_position('players', client.player_id) is None)
+    await asyncio.gather(*(client.close() for client in clients))
+    
+    print(f"{stats['players']} bots for {elapsed:.1f}s, {stats['ticks']} ticks")
+    print(
+        f"  tick       {stats['tick_ms_mean']:.2f} ms mean, {stats['tick_ms_p50']:.2f} p50,"
+        f" {stats['tick_ms_p99']:.2f} p99 (budget {stats['tick_budget_ms']:.1f} ms)"
+    )
+    print(f"  server     {stats['bytes_per_client_per_s'] / 1024:.2f} KiB/s per client")
+    print(f"  received   {received.mean() / 1024:.2f} KiB/s mean, {received.max() / 1024:.2f} worst")
+    print(f"  snapshots  {snapshots.mean():.1f}/s per bot")
+    print(f"  skipped    {stats['snapshots_skipped']}")
+    if lost:
+        print(f"  {lost} bots could not see themselves")
+
+def main():
+    parser = argparse.ArgumentParser(description="Multiplayer server load test")
+    parser.add_argument("--bots", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=15.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tick-rate", type=int, default=30)
+    parser.add_argument("--snapshot-rate", type=int, default=15)
+    parser.add_argument("--input-rate", type=float, default=10.0, help="inputs per second per bot")
+    parser.add_argument("--connect", help="host:port of a running server instead of starting one")
+    args = parser.parse_args()
+    
+    server = None
+    if args.connect:
+        host, port = args.connect.rsplit(":", 1)
+        port = int(port)
+    else:
+        host, port = "127.0.0.1", free_port()
+        server = start_server(port, args)
+    
+    try:
+        asyncio.run(load(host, port, args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Microbenchmark: per-frame proximity checks, brute force vs spatial hash,
+and the swept (segment) query used for pickups and crab hits
+
+Run from the repository root:
+    python benchmarks/spatial_bench.py
+"""
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.spatial import SpatialHash, segment_circle_hits
+
+WORLD_SIZE = 200.0
+RADIUS = 2.5
+FRAMES = 200
+COUNTS = [50, 500, 5000, 20000, 50000, 100000]
+
+def brute_force_frame(positions, px, py):
+    """What CoinManager.update used to do: test every entity"""
+    hits = []
+    for index, (x, y) in enumerate(positions):
+        dx = px - x
+        dy = py - y
+        if math.sqrt(dx * dx + dy * dy) < RADIUS:
+            hits.append(index)
+    return hits
+
+def grid_frame(grid, px, py):
+    """Test only entities in cells around the player"""
+    return grid.query('coins', px, py, RADIUS)
+
+def swept_frame(grid, px0, py0, px1, py1):
+    """Test entities against the player's whole movement this frame"""
+    return grid.query_segment('coins', px0, py0, px1, py1, RADIUS)
+
+def player_path(frames, rng):
+    """A wandering player path across the world"""
+    x, y, heading = WORLD_SIZE / 2, WORLD_SIZE / 2, 0.0
+    path = []
+    for _ in range(frames):
+        heading += rng.uniform(-0.3, 0.3)
+        x = min(WORLD_SIZE, max(0.0, x + math.sin(heading) * 0.33))
+        y = min(WORLD_SIZE, max(0.0, y + math.cos(heading) * 0.33))
+        path.append((x, y))
+    return path
+
+def time_frames(fn, path):
+    """Average milliseconds per frame"""
+    start = time.perf_counter()
+    for px, py in path:
+        fn(px, py)
+    return (time.perf_counter() - start) / len(path) * 1000
+
+def main():
+    rng = random.Random(1234)
+    path = player_path(FRAMES, rng)
+    
+    print(
+        f"{'entities':>10} {'brute ms/frame':>16} {'grid ms/frame':>15} {'speedup':>9}"
+        f" {'swept ms/frame':>16}"
+    )
+    for count in COUNTS:
+        positions = [(rng.uniform(0, WORLD_SIZE), rng.uniform(0, WORLD_SIZE)) for _ in range(count)]
+        grid = SpatialHash()
+        for index, (x, y) in enumerate(positions):
+            grid.insert('coins', index, x, y)
+        
+        # Same answers either way
+        px, py = path[0]
+        assert sorted(brute_force_frame(positions, px, py)) == sorted(grid_frame(grid, px, py))
+        
+        brute_ms = time_frames(lambda px, py: brute_force_frame(positions, px, py), path)
+        grid_ms = time_frames(lambda px, py: grid_frame(grid, px, py), path)
+        
+        # Swept queries find what a batched test of every entity finds
+        (px0, py0), (px1, py1) = path[0], path[1]
+        hits, _ = segment_circle_hits(positions, px0, py0, px1, py1, RADIUS)
+        assert sorted(swept_frame(grid, px0, py0, px1, py1)) == sorted(hits.nonzero()[0].tolist())
+        
+        segments = list(zip(path, path[1:] + path[:1]))
+        start = time.perf_counter()
+        for (px0, py0), (px1, py1) in segments:
+            swept_frame(grid, px0, py0, px1, py1)
+        swept_ms = (time.perf_counter() - start) / len(segments) * 1000
+        
+        print(
+            f"{count:>10} {brute_ms:>16.4f} {grid_ms:>15.4f} {brute_ms / grid_ms:>8.1f}x"
+            f" {swept_ms:>16.4f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark: frames per second of the vector environment as workers are added,
+against one Simulation stepped a frame at a time
+
+Every row steps the same worlds with the same random key presses; a frame
+is one world advanced one step. Workers beyond the machine's cores only
+add synchronisation.
+
+Run from the repository root:
+    python benchmarks/vecenv_bench.py --worlds 4096 --steps 300
+    python benchmarks/vecenv_bench.py --workers 0 1 2 4 8
+    python benchmarks/vecenv_bench.py --check 3600
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.simulation import Simulation
+from components.trees import NUM_TREES
+from components.vecenv import ParallelVectorEnv, compare_with_simulation
+
+def default_workers():
+    """0 (in process), then 1, 2, 4, ... up to the core count"""
+    cores = os.cpu_count() or 1
+    counts = [0, 1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector environment scaling")
+    parser.add_argument("--worlds", type=int, default=4096)
+    parser.add_argument("--steps", type=int, default=300)
+    parser.add_argument("--workers", type=int, nargs="+", default=None)
+    parser.add_argument("--endless", action="store_true")
+    parser.add_argument("--trees", type=int, default=NUM_TREES, help="trees planted (the game's count by default)")
+    parser.add_argument("--check", type=int, metavar="STEPS",
+                        help="first verify that world 0 plays like Simulation for this many steps")
+    args = parser.parse_args()
+    
+    if args.check:
+        mismatch = compare_with_simulation(args.check, endless=args.endless, num_trees=args.trees)
+        if mismatch is not None:
+            step, expected, actual = mismatch
+            sys.exit(f"step {step}: Simulation {expected} but VectorEnv {actual}")
+        print(f"world 0 matches Simulation for {args.check} steps")
+    
+    baseline = Simulation(seed=0, endless=args.endless, num_trees=args.trees).run(args.steps * 10)
+    print(f"{os.cpu_count()} cores; one Simulation: {baseline['fps']:.0f} frames/s")
+    print(f"{'workers':>8} {'frames/s':>12} {'speedup':>9} {'ms/step':>9}")
+    
+    first = None
+    for workers in args.workers or default_workers():
+        env = ParallelVectorEnv(
+            args.worlds, workers=workers, seed=0, endless=args.endless, num_trees=args.trees
+        )
+        try:
+            env.run(10)  # Warm up
+            stats = env.run(args.steps)
+        finally:
+            env.close()
+        if first is None:
+            first = stats['fps']
+        print(
+            f"{workers:>8} {stats['fps']:>12.0f} {stats['fps'] / first:>8.2f}x"
+            f" {stats['seconds'] / stats['steps'] * 1000:>9.2f}"
+        )
+
+if __name__ == "__main__":
+    main()
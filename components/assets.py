@@ -0,0 +1,133 @@
+"""
+Asset cache: load every model once, convert heavy ones to cached .bam files
+"""
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import threading
+from panda3d.core import Filename, Loader, LoaderOptions, NodePath
+
+# Converted models live here, named by the hash of their source file
+CACHE_DIR = ".asset_cache"
+
+# Formats that are slow to parse and are worth converting once
+CONVERTED_EXTENSIONS = ('.obj',)
+
+class CoreLoader:
+    """The part of ShowBase's loader AssetCache needs, without a ShowBase.
+    
+    Lets the game logic build its scene graph in a process that never opens
+    a window (see components/simulation.py).
+    """
+    
+    def loadModel(self, path, noCache=False):
+        """Load a model synchronously, raising IOError if it can't be found"""
+        options = LoaderOptions()
+        if noCache:
+            options.setFlags(options.getFlags() | LoaderOptions.LF_no_cache)
+        node = Loader.getGlobalPtr().loadSync(Filename(path), options)
+        if node is None:
+            raise IOError(f"Could not load model file(s): {[str(path)]}")
+        return NodePath(node)
+
+class AssetCache:
+    """Drop-in replacement for the loader's loadModel.
+    
+    Each path is loaded once; every later loadModel call returns a copy of
+    the cached model whose nodes are new but whose geoms are shared, so
+    building hundreds of boxes and spheres costs no file access at all.
+    
+    Models in CONVERTED_EXTENSIONS are written to CACHE_DIR as compressed
+    .bam files keyed by a hash of the source file, so they are only parsed
+    again after the file changes. preload() fetches models on a thread pool
+    so several slow assets load side by side while a loading screen runs.
+    """
+    
+    def __init__(self, loader, cache_dir=CACHE_DIR, workers=4):
+        self.loader = loader
+        self.cache_dir = cache_dir
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="asset")
+        self.models = {}
+        self.pending = {}  # path -> Future
+        
+        # Counters; loads and conversions are counted on worker threads
+        self.counter_lock = threading.Lock()
+        self.loads = 0
+        self.copies = 0
+        self.conversions = 0
+    
+    def loadModel(self, path):
+        """Copy of the model at path, loading it first if needed"""
+        model = self._get(path)
+        self.copies += 1
+        return NodePath(model.node().copySubgraph())
+    
+    def preload(self, paths):
+        """Start loading paths in the background"""
+        for path in paths:
+            if path not in self.models and path not in self.pending:
+                self.pending[path] = self.executor.submit(self._load, path)
+    
+    def get_progress(self):
+        """(finished, total) for everything requested through preload"""
+        done = sum(1 for future in self.pending.values() if future.done())
+        return len(self.models) + done, len(self.models) + len(self.pending)
+    
+    def is_ready(self):
+        """True once every preloaded model has finished loading"""
+        return all(future.done() for future in self.pending.values())
+    
+    def _get(self, path):
+        """The cached master copy, waiting for a background load if one is running"""
+        if path not in self.models:
+            future = self.pending.pop(path, None)
+            # A failed load raises here, like loader.loadModel would
+            self.models[path] = future.result() if future is not None else self._load(path)
+        return self.models[path]
+    
+    def _load(self, path):
+        """Read one model from disk (safe to run on a worker thread)"""
+        with self.counter_lock:
+            self.loads += 1
+        if path.lower().endswith(CONVERTED_EXTENSIONS) and os.path.isfile(path):
+            return self._load_converted(path)
+        return self.loader.loadModel(path, noCache=True)
+    
+    def _load_converted(self, path):
+        """Load a slow format through its cached .bam conversion"""
+        bam_path = self.get_cache_path(path)
+        if os.path.isfile(bam_path):
+            return self.loader.loadModel(Filename.fromOsSpecific(bam_path), noCache=True)
+        
+        model = self.loader.loadModel(path, noCache=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        
+        # Write under a temporary name so a crash never leaves half a file
+        partial = bam_path + ".partial.pz"
+        if model.writeBamFile(Filename.fromOsSpecific(partial)):
+            os.replace(partial, bam_path)
+            with self.counter_lock:
+                self.conversions += 1
+        return model
+    
+    def get_cache_path(self, path):
+        """Where the converted copy of path is stored"""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as source:
+            for block in iter(lambda: source.read(1 << 20), b''):
+                digest.update(block)
+        name = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(self.cache_dir, f"{name}-{digest.hexdigest()[:16]}.bam.pz")
+    
+    def get_stats(self):
+        """Cache counters"""
+        return {
+            'models': len(self.models),
+            'loads': self.loads,
+            'copies': self.copies,
+            'conversions': self.conversions,
+        }
+    
+    def shutdown(self):
+        """Stop the worker threads"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
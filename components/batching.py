@@ -0,0 +1,116 @@
+"""
+Static batching for scenery that never moves
+"""
+from panda3d.core import GeomNode, GeomTriangles, GeomVertexRewriter, NodePath, TransparencyAttrib
+
+def count_nodes(root):
+    """Count every node under root (including root itself)"""
+    return root.findAllMatches("**").getNumPaths() + 1
+
+def count_draw_calls(root):
+    """Count geoms under root - each one is a separate draw call"""
+    draw_calls = 0
+    for geom_np in root.findAllMatches("**/+GeomNode"):
+        draw_calls += geom_np.node().getNumGeoms()
+    if root.node().isGeomNode():
+        draw_calls += root.node().getNumGeoms()
+    return draw_calls
+
+def count_triangles(root):
+    """Count the triangles one draw of root submits (instancing not included)"""
+    triangles = 0
+    geom_nps = list(root.findAllMatches("**/+GeomNode"))
+    if root.node().isGeomNode():
+        geom_nps.append(root)
+    for geom_np in geom_nps:
+        node = geom_np.node()
+        for i in range(node.getNumGeoms()):
+            for prim in node.getGeom(i).decompose().getPrimitives():
+                if isinstance(prim, GeomTriangles):
+                    triangles += prim.getNumPrimitives()
+    return triangles
+
+def batch_stats(root):
+    """Snapshot node and draw call counts for a subtree"""
+    return {
+        'nodes': count_nodes(root),
+        'draw_calls': count_draw_calls(root),
+    }
+
+def flatten_static(root, label="static", groups=None):
+    """Merge a static subtree into as few geoms as possible.
+    
+    Colours set with setColor are baked into vertex colours, transforms are
+    baked into vertices, and geoms sharing a render state are merged, so the
+    whole subtree ends up as one geom per distinct state.
+    
+    groups are nodes under root to flatten separately instead, for subtrees
+    that must stay apart to be culled on their own (see culling.CellGrid).
+    """
+    before = batch_stats(root)
+    
+    # loadModel wraps every model in a ModelRoot which flatten won't remove
+    for group in (root,) if groups is None else groups:
+        group.clearModelNodes()
+        group.flattenStrong()
+    
+    after = batch_stats(root)
+    print(
+        f"[batching] {label}: {before['nodes']} nodes / {before['draw_calls']} draw calls"
+        f" -> {after['nodes']} nodes / {after['draw_calls']} draw calls"
+    )
+    return {'before': before, 'after': after}
+
+def build_prototype(name, build):
+    """Build a composite model once and flatten it into a reusable prototype.
+    
+    build(parent) attaches the separate parts around the origin. The result
+    has one geom per render state, with alpha-blended parts split off so
+    they are drawn after everything opaque (see split_transparent).
+    """
+    prototype = NodePath(name)
+    build(prototype)
+    prototype.clearModelNodes()
+    prototype.flattenStrong()
+    fill_missing_normals(prototype)
+    split_transparent(prototype)
+    return prototype
+
+def fill_missing_normals(root):
+    """Point zero normals left over from merging up along +Z.
+    
+    The sphere model has no normals, so once it is merged with the box its
+    vertices get zero normals and only pick up ambient light. Unmerged, GL
+    lights them as if they faced +Z; this keeps that look.
+    """
+    for geom_np in root.findAllMatches("**/+GeomNode"):
+        node = geom_np.node()
+        for i in range(node.getNumGeoms()):
+            vdata = node.modifyGeom(i).modifyVertexData()
+            if not vdata.hasColumn("normal"):
+                continue
+            normals = GeomVertexRewriter(vdata, "normal")
+            while not normals.isAtEnd():
+                normal = normals.getData3()
+                normals.setData3(normal if normal.lengthSquared() > 0 else (0, 0, 1))
+
+def split_transparent(root):
+    """Move alpha-blended geoms under root into their own node.
+    
+    The new node goes in the transparent bin without depth writes, so glow
+    shells never hide the opaque parts of other copies drawn after them.
+    """
+    transparent = GeomNode("transparent")
+    for geom_np in root.findAllMatches("**/+GeomNode"):
+        node = geom_np.node()
+        for i in reversed(range(node.getNumGeoms())):
+            state = node.getGeomState(i)
+            attrib = state.getAttrib(TransparencyAttrib)
+            if attrib is not None and attrib.getMode() != TransparencyAttrib.M_none:
+                transparent.addGeom(node.getGeom(i).makeCopy(), state)
+                node.removeGeom(i)
+    
+    if transparent.getNumGeoms():
+        transparent_np = root.attachNewNode(transparent)
+        transparent_np.setBin("transparent", 10)
+        transparent_np.setDepthWrite(False)
@@ -21,14 +21,23 @@ class CameraController:
         cam_y = player_pos.y - math.cos(rad) * self.distance
         cam_z = player_pos.z + self.height
         
-        # Smooth interpolation
+        # Smooth interpolation (exponential, so it settles the same way at any frame rate)
+        blend = 1.0 - math.exp(-self.smoothness * dt)
         current_pos = self.camera.getPos()
-        new_x = current_pos.x + (cam_x - current_pos.x) * self.smoothness * dt
-        new_y = current_pos.y + (cam_y - current_pos.y) * self.smoothness * dt
-        new_z = current_pos.z + (cam_z - current_pos.z) * self.smoothness * dt
+        new_x = current_pos.x + (cam_x - current_pos.x) * blend
+        new_y = current_pos.y + (cam_y - current_pos.y) * blend
+        new_z = current_pos.z + (cam_z - current_pos.z) * blend
         
         self.camera.setPos(new_x, new_y, new_z)
         
         # Look at player (slightly above center)
         look_at_pos = Vec3(player_pos.x, player_pos.y, player_pos.z + 2)
         self.camera.lookAt(look_at_pos)
+    
+    def snapshot(self):
+        """Camera pose, for restore"""
+        return {'pos': tuple(self.camera.getPos()), 'hpr': tuple(self.camera.getHpr())}
+    
+    def restore(self, state):
+        """Return to a snapshot"""
+        self.camera.setPosHpr(*state['pos'], *state['hpr'])
@@ -0,0 +1,77 @@
+"""
+Network client: joins a GameServer, sends key states, mirrors the nearby world
+"""
+import asyncio
+import json
+from components.protocol import (
+    FRAME, INPUT, MSG_INPUT, MSG_SNAPSHOT, MSG_STATS, MSG_WELCOME, WELCOME,
+    SnapshotDecoder, encode_frame, pack_keys, read_frame
+)
+
+class GameClient:
+    """One player's connection to a server.
+    
+    After connect(), snapshots are received in the background and applied
+    to view, a SnapshotDecoder holding every entity within the server's
+    interest radius of this player.
+    """
+    
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.player_id = None
+        self.tick_rate = None
+        self.interest_radius = None
+        self.view = SnapshotDecoder()
+        self.sequence = 0
+        self.receive_task = None
+        self.stats_requests = []  # Futures waiting for a stats reply, oldest first
+        
+        # Counters
+        self.bytes_received = 0
+        self.snapshots = 0
+    
+    async def connect(self, host, port):
+        """Join the server and start receiving snapshots"""
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        msg_type, payload = await read_frame(self.reader)
+        if msg_type != MSG_WELCOME:
+            raise ConnectionError(f"expected a welcome message, got type {msg_type}")
+        self.player_id, self.tick_rate, self.interest_radius = WELCOME.unpack(payload)
+        self.receive_task = asyncio.create_task(self._receive())
+    
+    def send_keys(self, keys):
+        """Tell the server which keys are held"""
+        self.sequence += 1
+        self.writer.write(encode_frame(MSG_INPUT, INPUT.pack(self.sequence, pack_keys(keys))))
+    
+    async def request_stats(self):
+        """The server's tick and traffic stats"""
+        future = asyncio.get_running_loop().create_future()
+        self.stats_requests.append(future)
+        self.writer.write(encode_frame(MSG_STATS))
+        return await future
+    
+    async def _receive(self):
+        """Apply snapshots as they arrive, until the connection closes"""
+        try:
+            while True:
+                msg_type, payload = await read_frame(self.reader)
+                self.bytes_received += FRAME.size + len(payload)
+                if msg_type == MSG_SNAPSHOT:
+                    self.view.decode(payload)
+                    self.snapshots += 1
+                elif msg_type == MSG_STATS and self.stats_requests:
+                    self.stats_requests.pop(0).set_result(json.loads(payload))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+    
+    async def close(self):
+        """Leave the server"""
+        self.writer.close()
+        if self.receive_task is not None:
+            self.receive_task.cancel()
+            try:
+                await self.receive_task
+            except asyncio.CancelledError:
+                pass
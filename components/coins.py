@@ -1,39 +1,144 @@
 """
 Coin/Cash collection system component
 """
+from collections import deque
+import math
 import random
+import numpy as np
 from panda3d.core import Vec3
+from components.batching import build_prototype
+from components.culling import CellGrid
+from components.events import CoinCollected, CoinRespawned, CoinsReset, EventBus
+from components.instancing import EntityInstances
+from components.shaders import COIN_MOTION, set_motion
+from components.spatial import SpatialHash
+from components.terrain import world_bounds
+
+# Closest a coin appears to the world's edge
+EDGE_MARGIN = 15
+
+# Coins float this far above the ground
+COIN_HEIGHT = 2.5
+
+# Pickup range, and where and when endless coins come back
+COLLECT_RADIUS = 2.5
+RESPAWN_DELAY = 3.0
+RESPAWN_DISTANCE = (15.0, 45.0)  # From the player
+
+def plan_coins(rng, num_coins, area, height_at):
+    """Scatter coin spots over area (low, high) on x and y"""
+    positions = np.zeros((num_coins, 3), dtype=np.float32)
+    for i in range(num_coins):
+        x = rng.uniform(*area)
+        y = rng.uniform(*area)
+        positions[i] = (x, y, height_at(x, y) + COIN_HEIGHT)
+    return positions
+
+def respawn_spot(rng, near_x, near_y, distance=RESPAWN_DISTANCE, bounds=None):
+    """(x, y) a random distance (low, high) from a point, kept within bounds if given"""
+    angle = rng.uniform(0, 2 * math.pi)
+    distance = rng.uniform(*distance)
+    x = near_x + math.cos(angle) * distance
+    y = near_y + math.sin(angle) * distance
+    if bounds is not None:
+        low, high = bounds
+        x = min(high, max(low, x))
+        y = min(high, max(low, y))
+    return x, y
 
 class CoinManager:
-    def __init__(self, loader, render):
+    """A fixed pool of coins.
+    
+    Coin state lives in parallel arrays with the live coins packed at the
+    front: collecting a coin swaps the last live coin into its slot, so
+    animation, rendering and pickup checks only ever touch the first
+    active_count entries. In endless mode every collected coin comes back
+    respawn_delay seconds later somewhere near the player, reusing its
+    slot and its scene nodes.
+    """
+    
+    def __init__(self, loader, render, num_coins=50, terrain=None, spatial=None, instanced=False,
+                 gpu_animation=False, rng=None, events=None, endless=False, respawn_delay=RESPAWN_DELAY,
+                 layout=None, view_distance=None, seed=None):
         self.loader = loader
         self.render = render
-        self.coins = []
+        self.num_coins = num_coins  # Pool capacity
+        self.terrain = terrain
+        self.spatial = spatial if spatial is not None else SpatialHash()
+        self.events = events if events is not None else EventBus()
+        self.instanced = instanced
+        self.gpu_animation = gpu_animation  # Spin and bob in the vertex shader
+        self.rng = rng if rng is not None else random.Random(seed)  # Seeded for repeatable runs
+        self.layout = layout  # Spawn positions; see get_layout
+        self.collect_radius = COLLECT_RADIUS
         self.collected_count = 0
+        
+        # Endless mode
+        self.endless = endless
+        self.respawn_delay = respawn_delay
+        self.respawn_distance = RESPAWN_DISTANCE
+        self.area = world_bounds(terrain, EDGE_MARGIN)  # Where coins are scattered
+        self.bounds = self.area  # Respawns are kept inside; None lets coins appear anywhere
+        self.respawn_queue = deque()  # Times at which pooled coins come back
+        self.time = 0.0
+        
+        # Coin state as parallel arrays (structure of arrays)
+        self.positions = np.zeros((num_coins, 3), dtype=np.float32)
+        self.rotation = np.zeros(num_coins, dtype=np.float32)
+        self.previous_rotation = np.zeros(num_coins, dtype=np.float32)
+        self.active_count = 0
+        
+        self.renderer = None
+        self.view_distance = view_distance  # Cells farther than this aren't drawn
+        self.coin_root = render.attachNewNode("coins")
+        self._dirty = True
         self._spawn_coins()
     
     def _spawn_coins(self):
         """Spawn coins across the terrain"""
-        num_coins = 50
-        
-        for i in range(num_coins):
-            x = random.uniform(15, 185)
-            y = random.uniform(15, 185)
-            
-            # Create coin
-            coin = self._create_coin(x, y)
-            
-            self.coins.append({
-                'model': coin,
-                'position': Vec3(x, y, 3),
-                'collected': False,
-                'rotation': 0
-            })
-    
-    def _create_coin(self, x, y):
+        if self.layout is None:
+            self.layout = {'positions': plan_coins(self.rng, self.num_coins, self.area, self._ground_z)}
+        self.positions[:] = self.layout['positions']
+        for i, (x, y, _) in enumerate(self.positions):
+            self.spatial.insert('coins', i, x, y)
+        self.active_count = self.num_coins
+        
+        # Separate coins are grouped into cells so culling skips whole cells
+        grid = None
+        if not self.instanced:
+            grid = CellGrid(self.coin_root, 40.0, self.view_distance, "coin_cells")
+        
+        # Build the coin once and draw a copy of it per pool slot
+        prototype = build_prototype("coin", lambda parent: self._create_coin(0, 0, 0, parent))
+        self.renderer = EntityInstances(
+            prototype, self.coin_root, self.positions, self.rotation,
+            hardware=self.instanced, gpu_animation=self.gpu_animation, name="coins",
+            grid=grid
+        )
+        
+        if self.gpu_animation:
+            set_motion(self.coin_root, **COIN_MOTION)
+    
+    def _place(self, index, x, y):
+        """Put a coin in a slot at (x, y) and index it"""
+        z = self._ground_z(x, y) + COIN_HEIGHT
+        self.positions[index] = (x, y, z)
+        x, y, _ = self.positions[index]  # Index the stored value, as restore does
+        self.spatial.insert('coins', index, x, y)
+    
+    def _ground_z(self, x, y):
+        """Height of the ground at a coin spawn"""
+        if self.terrain is None:
+            return 0.5
+        return self.terrain.height_at(x, y)
+    
+    def _create_coin(self, x, y, z, parent=None):
         """Create a single coin model"""
+        if parent is None:
+            parent = self.coin_root
+        
         # Main coin body (flat cylinder look using box)
-        coin_node = self.render.attachNewNode("coin")
+        coin_node = parent.attachNewNode("coin")
         
         # Gold coin disc
         coin_disc = self.loader.loadModel("models/misc/sphere")
@@ -79,57 +184,169 @@ class CoinManager:
         glow.reparentTo(coin_node)
         
         # Set the coin_node's position on terrain
-        coin_node.setPos(x, y, 3)
+        coin_node.setPos(x, y, z)
         return coin_node
     
-    def update(self, player_pos, dt):
-        """Update coins (rotation and collection check)"""
-        import math
-        
-        for coin_data in self.coins:
-            if coin_data['collected']:
-                continue
-            
-            # Rotate coin for visual effect (spin on Z axis)
-            coin_data['rotation'] += 180 * dt
-            coin_data['model'].setH(coin_data['rotation'])
-            
-            # Gentle bob up and down (stays near original position)
-            bob = math.sin(coin_data['rotation'] * 0.05) * 0.3
-            coin_pos = coin_data['position']
-            
-            # Keep coin at fixed X, Y position, only animate Z slightly
-            coin_data['model'].setPos(coin_pos.x, coin_pos.y, coin_pos.z + bob)
-            
-            # Check if player is close enough to collect
-            distance = self._distance_2d(player_pos, coin_pos)
-            
-            if distance < 2.5:  # Collection radius
-                self._collect_coin(coin_data)
-    
-    def _distance_2d(self, pos1, pos2):
-        """Calculate 2D distance between two positions"""
-        import math
-        dx = pos1.x - pos2.x
-        dy = pos1.y - pos2.y
-        return math.sqrt(dx * dx + dy * dy)
-    
-    def _collect_coin(self, coin_data):
-        """Collect a coin"""
-        coin_data['collected'] = True
+    def update(self, player_pos, dt, previous_pos=None):
+        """Advance coins one simulation step (rotation, collection, respawns).
+        
+        With previous_pos, every coin the player passed during the step is
+        collected, not just the ones near where it ended up.
+        """
+        self.advance(dt)
+        self.collect(player_pos, previous_pos)
+        self.respawn_due(near=player_pos)
+    
+    def advance(self, dt):
+        """Move the coin clock and spin on by one step"""
+        self.time += dt
+        active = self.active_count
+        
+        if not self.gpu_animation:
+            # Spin on Z for every live coin in one pass
+            self.previous_rotation[:active] = self.rotation[:active]
+            self.rotation[:active] += 180 * dt
+    
+    def collect(self, player_pos, previous_pos=None):
+        """Collect the coins a player touched this step; returns how many"""
+        # Check only the coins in cells near the player's path
+        if previous_pos is None:
+            previous_pos = player_pos
+        nearby = self.spatial.query_segment(
+            'coins', previous_pos.x, previous_pos.y, player_pos.x, player_pos.y, self.collect_radius
+        )
+        
+        # Highest slot first, so swapping a coin out never moves one still to collect
+        for index in sorted(nearby, reverse=True):
+            self._collect_coin(index)
+        return len(nearby)
+    
+    def respawn_due(self, near=None):
+        """Bring back every pooled coin whose respawn delay is over"""
+        while self.respawn_queue and self.respawn_queue[0] <= self.time:
+            self.respawn_queue.popleft()
+            self.respawn_coin(near=near)
+    
+    def sync_visuals(self, alpha=1.0):
+        """Send live coin transforms to the renderer, alpha of the way into the last step"""
+        active = self.active_count
+        if self.gpu_animation:
+            # Rotation is the animation phase and the shader adds time, so
+            # only collections and respawns need pushing
+            if self._dirty:
+                self._dirty = False
+                self.renderer.set_transforms(
+                    self.positions[:active], np.zeros(active), phases=self.rotation[:active]
+                )
+            return
+        
+        previous = self.previous_rotation[:active]
+        rotation = previous + (self.rotation[:active] - previous) * alpha
+        
+        # Gentle bob up and down (stays near original position)
+        positions = self.positions[:active].copy()
+        positions[:, 2] += np.sin(rotation * 0.05) * 0.3
+        self.renderer.set_transforms(positions, rotation)
+    
+    def _collect_coin(self, index):
+        """Collect a coin and return its slot to the pool"""
         self.collected_count += 1
+        self.events.publish(CoinCollected(int(index), self.collected_count, self.num_coins))
+        
+        # Keep live coins packed: the last one takes over the freed slot
+        last = self.active_count - 1
+        self.spatial.remove('coins', index)
+        if index != last:
+            self.spatial.remove('coins', last)
+            for array in (self.positions, self.rotation, self.previous_rotation):
+                array[index] = array[last]
+            x, y, _ = self.positions[index]
+            self.spatial.insert('coins', index, x, y)
+        self.active_count = last
+        self._dirty = True  # Hidden on the next sync_visuals
+        
+        if self.endless:
+            self.respawn_queue.append(self.time + self.respawn_delay)
+    
+    def respawn_coin(self, near=None):
+        """Bring a pooled coin back; returns its slot, or None if none are free.
         
-        # Animate collection (scale up and fade)
-        coin_data['model'].setScale(1.5)
+        The coin appears a random distance from near (usually the player),
+        or anywhere in the world if near is None.
+        """
+        if self.active_count >= self.num_coins:
+            return None
         
-        # Remove from scene after a brief moment
-        self._schedule_removal(coin_data['model'])
+        if near is None:
+            x = self.rng.uniform(*self.area)
+            y = self.rng.uniform(*self.area)
+        else:
+            x, y = respawn_spot(self.rng, near.x, near.y, self.respawn_distance, self.bounds)
+        
+        index = self.active_count
+        self._place(index, x, y)
+        self.previous_rotation[index] = self.rotation[index]
+        self.active_count += 1
+        self._dirty = True
+        self.events.publish(CoinRespawned(index))
+        return index
+    
+    def relocate(self, indices, near):
+        """Respawn live coins at once a random distance from near.
+        
+        A streamed world has no edge, so coins left behind in chunks that
+        were dropped come back around the player instead.
+        """
+        for index in indices:
+            self.spatial.remove('coins', index)
+            x, y = respawn_spot(self.rng, near.x, near.y, self.respawn_distance, self.bounds)
+            self._place(index, x, y)
+            self.events.publish(CoinRespawned(int(index)))
+        if len(indices):
+            self._dirty = True
+    
+    def snapshot(self):
+        """Copy of the pool state, for restore"""
+        return {
+            'positions': self.positions.copy(),
+            'rotation': self.rotation.copy(),
+            'previous_rotation': self.previous_rotation.copy(),
+            'active_count': self.active_count,
+            'collected_count': self.collected_count,
+            'respawn_queue': list(self.respawn_queue),
+            'time': self.time,
+        }
+    
+    def restore(self, state):
+        """Return to a snapshot, reusing the existing nodes"""
+        for i in range(self.active_count):
+            self.spatial.remove('coins', i)
+        
+        self.positions[:] = state['positions']
+        self.rotation[:] = state['rotation']
+        self.previous_rotation[:] = state['previous_rotation']
+        self.active_count = state['active_count']
+        self.collected_count = state['collected_count']
+        self.respawn_queue = deque(state['respawn_queue'])
+        self.time = state['time']
+        
+        for i in range(self.active_count):
+            x, y, _ = self.positions[i]
+            self.spatial.insert('coins', i, x, y)
+        self._dirty = True
+        self.events.publish(CoinsReset(self.collected_count, self.num_coins))
+    
+    def get_layout(self):
+        """Where the coins first spawned, as arrays"""
+        return self.layout
+    
+    def get_position(self, index):
+        """World position of a coin"""
+        return Vec3(*self.positions[index])
     
-    def _schedule_removal(self, coin_model):
-        """Schedule coin removal (simplified - immediate for now)"""
-        # In a real game, you'd use a timed interval here
-        # For now, hide it immediately
-        coin_model.hide()
+    def get_active_count(self):
+        """Number of coins currently in play"""
+        return self.active_count
     
     def get_collected_count(self):
         """Get number of coins collected"""
@@ -137,12 +354,4 @@ class CoinManager:
     
     def get_total_coins(self):
         """Get total number of coins"""
-        return len(self.coins)
-    
-    def respawn_coin(self, index):
-        """Respawn a specific coin (for endless gameplay)"""
-        if index < len(self.coins):
-            coin_data = self.coins[index]
-            coin_data['collected'] = False
-            coin_data['model'].show()
-            coin_data['model'].setScale(1.0)
+        return self.num_coins
@@ -0,0 +1,151 @@
+"""
+Visibility: scene cells with tight bounds, dropped where the fog hides them
+"""
+import math
+import numpy as np
+from panda3d.core import BoundingVolume, LODNode, PandaNode, Point3
+
+# Fog this close to opaque can't be told apart from the fog colour
+FOG_CUTOFF = 1.0 / 255
+
+def fog_distance(density, cutoff=FOG_CUTOFF):
+    """Distance past which exponential fog of the given density hides everything.
+    
+    Exponential fog keeps exp(-density * distance) of a surface's colour;
+    beyond the returned distance that is less than cutoff (one colour step
+    by default), so drawing the surface changes nothing on screen.
+    """
+    return math.log(1.0 / cutoff) / density
+
+def view_frustum(camera, other):
+    """Bounding volume of what camera (a NodePath with a Camera node) sees, in other's space"""
+    frustum = camera.node().getLens().makeBounds()
+    frustum.xform(camera.getMat(other))
+    return frustum
+
+class CellGrid:
+    """Nodes bucketed into square cells of the world.
+    
+    The cull pass tests each cell against the view frustum as one node with
+    an axis-aligned box around its contents, so a cell behind the camera
+    costs one test instead of one per child. With a view_distance each cell
+    is also an LODNode with a single level, and the whole cell is skipped
+    once the camera is farther than that from every point in it.
+    
+    With lod_distances a cell holds one content node per detail level
+    instead: level 0 is drawn up to lod_distances[0] from the camera, level
+    1 from there to lod_distances[1], and so on, the last level out to the
+    view distance. Distances are measured to the cell's centre and padded by
+    half its diagonal, so everything in a cell is at least as detailed as
+    its own distance asks for.
+    
+    Cells sit at the origin, so a node keeps its world position when it is
+    parented to one.
+    """
+    
+    def __init__(self, parent, cell_size, view_distance=None, name="cells", lod_distances=()):
+        self.root = parent.attachNewNode(name)
+        self.cell_size = cell_size
+        self.view_distance = view_distance
+        self.lod_distances = tuple(lod_distances)
+        self.name = name
+        self.cells = {}     # (cx, cy) -> NodePath of the cell's switch node
+        self.contents = {}  # (cx, cy) or ((cx, cy), level) -> NodePath children are attached to
+    
+    def key(self, x, y):
+        """Cell coordinates containing a world position"""
+        return int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size))
+    
+    def keys(self, positions):
+        """Cell coordinates for an (N, 2+) array of positions, as an (N, 2) array"""
+        positions = np.asarray(positions)
+        return np.floor(positions[:, :2] / self.cell_size).astype(np.int64)
+    
+    def cell(self, key, level=0):
+        """Node holding a cell's contents (at one detail level), creating the cell if needed"""
+        content_key = (key, level) if self.lod_distances else key
+        content = self.contents.get(content_key)
+        if content is not None:
+            return content
+        
+        cx, cy = key
+        name = f"{self.name}_{cx}_{cy}"
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self._make_cell(key, name)
+        
+        if not self.lod_distances:
+            contents = [(key, cell.attachNewNode(PandaNode(f"{name}_content")))]
+        else:
+            contents = [
+                ((key, index), cell.attachNewNode(PandaNode(f"{name}_lod{index}")))
+                for index in range(len(self.lod_distances) + 1)
+            ]
+        for each_key, each in contents:
+            each.node().setBoundsType(BoundingVolume.BT_box)
+            self.contents[each_key] = each
+        return self.contents[content_key]
+    
+    def _make_cell(self, key, name):
+        """A cell's switch node, with a switch per detail level"""
+        cx, cy = key
+        switches = self._switches()
+        if switches is None:
+            cell = self.root.attachNewNode(name)
+        else:
+            lod = LODNode(name)
+            for far, near in switches:
+                lod.addSwitch(far, near)
+            half = self.cell_size * 0.5
+            lod.setCenter(Point3(cx * self.cell_size + half, cy * self.cell_size + half, 0))
+            cell = self.root.attachNewNode(lod)
+        self.cells[key] = cell
+        return cell
+    
+    def _switches(self):
+        """(far, near) distances from a cell's centre for each level, or None to always draw"""
+        if self.view_distance is None and not self.lod_distances:
+            return None
+        
+        # Reach the far corner, so nothing is dropped or shown coarser too soon
+        reach = self.cell_size * math.sqrt(0.5)
+        last = math.inf if self.view_distance is None else self.view_distance
+        edges = [0.0] + [distance + reach for distance in self.lod_distances] + [last + reach]
+        return list(zip(edges[1:], edges[:-1]))
+    
+    def remove_cell(self, key):
+        """Drop a cell and everything in it"""
+        cell = self.cells.pop(key, None)
+        self.contents.pop(key, None)
+        for level in range(len(self.lod_distances) + 1 if self.lod_distances else 0):
+            self.contents.pop((key, level), None)
+        if cell is not None:
+            cell.removeNode()
+    
+    def drawn_contents(self, camera):
+        """Content nodes camera draws: cells in its view, at the level their distance picks.
+        
+        camera is a NodePath with a Camera node. Returns (key, level,
+        NodePath) for each.
+        """
+        frustum = view_frustum(camera, self.root)
+        eye = camera.getPos(self.root)
+        switches = self._switches()
+        half = self.cell_size * 0.5
+        
+        drawn = []
+        for content_key, content in self.contents.items():
+            key, level = content_key if self.lod_distances else (content_key, 0)
+            if switches is not None:
+                cx, cy = key
+                centre = Point3(cx * self.cell_size + half, cy * self.cell_size + half, 0)
+                far, near = switches[level]
+                if not near <= (eye - centre).length() < far:
+                    continue
+            if frustum.contains(content.getBounds()):
+                drawn.append((key, level, content))
+        return drawn
+    
+    def get_contents(self):
+        """Every cell's content node"""
+        return list(self.contents.values())
@@ -0,0 +1,66 @@
+"""
+Game event bus: subsystems publish what happened, others subscribe to it
+"""
+from dataclasses import dataclass
+
+@dataclass(frozen=True)
+class CoinCollected:
+    index: int
+    collected: int  # Coins collected so far, including this one
+    total: int
+
+@dataclass(frozen=True)
+class CoinRespawned:
+    index: int
+
+@dataclass(frozen=True)
+class CoinsReset:
+    collected: int  # Coin state was replaced wholesale (reset or restore)
+    total: int
+
+@dataclass(frozen=True)
+class PlayerHit:
+    obstacle: int  # Index of the crab the player touched
+
+@dataclass(frozen=True)
+class PlayerDied:
+    cause: str
+    coins: int
+
+@dataclass(frozen=True)
+class GameRestarted:
+    pass
+
+@dataclass(frozen=True)
+class ChunkLoaded:
+    key: tuple
+
+@dataclass(frozen=True)
+class ChunkUnloaded:
+    key: tuple
+
+class EventBus:
+    """Synchronous publish/subscribe keyed by event class.
+    
+    publish() calls every handler subscribed to the event's exact type, in
+    subscription order, before returning. Nothing is queued, so a frame
+    with no events costs nothing.
+    """
+    
+    def __init__(self):
+        self.handlers = {}  # event type -> list of callables
+    
+    def subscribe(self, event_type, handler):
+        """Call handler(event) whenever an event_type is published"""
+        self.handlers.setdefault(event_type, []).append(handler)
+    
+    def unsubscribe(self, event_type, handler):
+        """Stop calling handler for event_type"""
+        handlers = self.handlers.get(event_type, [])
+        if handler in handlers:
+            handlers.remove(handler)
+    
+    def publish(self, event):
+        """Deliver event to its subscribers"""
+        for handler in list(self.handlers.get(type(event), ())):
+            handler(event)
@@ -0,0 +1,290 @@
+"""
+Procedural heightfield: seeded gradient noise and chunk mesh building
+"""
+import math
+import numpy as np
+from panda3d.core import (
+    Geom, GeomNode, GeomTriangles, GeomVertexData, GeomVertexFormat, LODNode,
+    NodePath, Point3
+)
+
+# Unit gradients used by the noise lattice
+_GRADIENTS = np.array([
+    (1, 0), (-1, 0), (0, 1), (0, -1),
+    (0.7071, 0.7071), (-0.7071, 0.7071), (0.7071, -0.7071), (-0.7071, -0.7071),
+], dtype=np.float64)
+
+class HeightField:
+    """Seeded fractal gradient noise, evaluated with NumPy on whole grids.
+    
+    The field is defined everywhere, so it can be sampled for any chunk of an
+    arbitrarily large world. A region can be baked into a grid to make
+    height_at queries cheap.
+    """
+    
+    def __init__(self, seed=0, cell_size=1.25, amplitude=4.0, base_height=0.5, feature_size=60.0, octaves=4):
+        self.seed = seed
+        self.cell_size = cell_size
+        self.amplitude = amplitude
+        self.base_height = base_height
+        self.feature_size = feature_size
+        self.octaves = octaves
+        
+        rng = np.random.default_rng(seed)
+        perm = rng.permutation(256)
+        self._perm = np.concatenate([perm, perm])
+        self._octave_offsets = rng.uniform(0, 256, size=(octaves, 2))
+        
+        self._grid = None
+    
+    def _noise(self, x, y):
+        """Single octave of 2D gradient noise in roughly [-1, 1]"""
+        xi = np.floor(x).astype(np.int64)
+        yi = np.floor(y).astype(np.int64)
+        xf = x - xi
+        yf = y - yi
+        xi &= 255
+        yi &= 255
+        
+        perm = self._perm
+        
+        def corner(ix, iy, dx, dy):
+            g = _GRADIENTS[perm[perm[ix] + iy] & 7]
+            return g[..., 0] * dx + g[..., 1] * dy
+        
+        n00 = corner(xi, yi, xf, yf)
+        n10 = corner(xi + 1, yi, xf - 1, yf)
+        n01 = corner(xi, yi + 1, xf, yf - 1)
+        n11 = corner(xi + 1, yi + 1, xf - 1, yf - 1)
+        
+        # Quintic fade for smooth derivatives
+        u = xf * xf * xf * (xf * (xf * 6 - 15) + 10)
+        v = yf * yf * yf * (yf * (yf * 6 - 15) + 10)
+        nx0 = n00 + u * (n10 - n00)
+        nx1 = n01 + u * (n11 - n01)
+        return (nx0 + v * (nx1 - nx0)) * 1.4142
+    
+    def sample(self, xs, ys):
+        """Heights at arrays of world coordinates (any matching shapes)"""
+        xs = np.asarray(xs, dtype=np.float64) / self.feature_size
+        ys = np.asarray(ys, dtype=np.float64) / self.feature_size
+        
+        total = np.zeros(np.broadcast(xs, ys).shape)
+        weight = 0.5
+        frequency = 1.0
+        norm = 0.0
+        for ox, oy in self._octave_offsets:
+            total += self._noise(xs * frequency + ox, ys * frequency + oy) * weight
+            norm += weight
+            weight *= 0.5
+            frequency *= 2.0
+        return self.base_height + total / norm * self.amplitude
+    
+    def sample_grid(self, x0, y0, cells, cell_size):
+        """Heights on a (cells + 1) x (cells + 1) grid starting at (x0, y0)"""
+        coords = np.arange(cells + 1) * cell_size
+        xs, ys = np.meshgrid(x0 + coords, y0 + coords)
+        return self.sample(xs, ys)
+    
+    def bake(self, size):
+        """Precompute the grid covering [0, size] x [0, size]"""
+        cells = int(round(size / self.cell_size))
+        self._grid = self.sample_grid(0.0, 0.0, cells, self.cell_size)
+        return self._grid
+    
+    def use_grid(self, grid):
+        """Adopt a grid baked earlier, e.g. one loaded from a world file"""
+        self._grid = grid
+        return grid
+    
+    def height_at(self, x, y):
+        """Terrain surface height at a world position.
+        
+        Interpolates over the same triangles the meshes are built from, so
+        the result sits exactly on the rendered surface. Outside the baked
+        grid the four cell corners are sampled on the fly.
+        """
+        gx = x / self.cell_size
+        gy = y / self.cell_size
+        ix = int(gx // 1)
+        iy = int(gy // 1)
+        fx = gx - ix
+        fy = gy - iy
+        
+        grid = self._grid
+        if grid is not None and 0 <= ix < grid.shape[1] - 1 and 0 <= iy < grid.shape[0] - 1:
+            h00 = grid[iy, ix]
+            h10 = grid[iy, ix + 1]
+            h01 = grid[iy + 1, ix]
+            h11 = grid[iy + 1, ix + 1]
+        else:
+            cs = self.cell_size
+            x0 = ix * cs
+            y0 = iy * cs
+            h00, h10, h01, h11 = self.sample(
+                [x0, x0 + cs, x0, x0 + cs], [y0, y0, y0 + cs, y0 + cs]
+            )
+        
+        if fx >= fy:
+            return float(h00 + fx * (h10 - h00) + fy * (h11 - h10))
+        return float(h00 + fy * (h01 - h00) + fx * (h11 - h01))
+    
+    def heights_at(self, xs, ys):
+        """height_at for arrays of world coordinates (any matching shapes)"""
+        gx = np.asarray(xs, dtype=np.float64) / self.cell_size
+        gy = np.asarray(ys, dtype=np.float64) / self.cell_size
+        ix = np.floor(gx).astype(np.int64)
+        iy = np.floor(gy).astype(np.int64)
+        fx = gx - ix
+        fy = gy - iy
+        
+        grid = self._grid
+        inside = (
+            grid is not None
+            and (ix >= 0).all() and (ix < grid.shape[1] - 1).all()
+            and (iy >= 0).all() and (iy < grid.shape[0] - 1).all()
+        )
+        if inside:
+            h00 = grid[iy, ix]
+            h10 = grid[iy, ix + 1]
+            h01 = grid[iy + 1, ix]
+            h11 = grid[iy + 1, ix + 1]
+        else:
+            cs = self.cell_size
+            x0 = ix * cs
+            y0 = iy * cs
+            h00, h10, h01, h11 = self.sample(
+                np.stack([x0, x0 + cs, x0, x0 + cs]), np.stack([y0, y0, y0 + cs, y0 + cs])
+            )
+        
+        return np.where(
+            fx >= fy,
+            h00 + fx * (h10 - h00) + fy * (h11 - h10),
+            h00 + fy * (h01 - h00) + fx * (h11 - h01),
+        )
+
+class ChunkMeshBuilder:
+    """Turn heightfield chunks into LOD meshes.
+    
+    Every chunk has one vertex array at full resolution; each LOD level is
+    just a coarser index list into it. The index lists are identical for all
+    chunks, so they are built once and shared. Skirts hang down from the chunk
+    border to hide cracks where neighbouring chunks use different levels.
+    """
+    
+    def __init__(self, chunk_cells, cell_size, lod_distances=(120, 300, 700, 1400), skirt_depth=2.0,
+                 view_distance=None):
+        self.chunk_cells = chunk_cells
+        self.cell_size = cell_size
+        self.lod_distances = lod_distances
+        self.skirt_depth = skirt_depth
+        self.view_distance = view_distance  # Nothing is drawn past this (e.g. fog)
+        self.format = GeomVertexFormat.getV3n3c4()
+        self.vertex_dtype = np.dtype([('vertex', np.float32, 3), ('normal', np.float32, 3), ('color', np.uint8, 4)])
+        
+        # Level k samples every 2**k vertices; the step has to tile the chunk
+        self.lod_steps = []
+        for level in range(len(lod_distances)):
+            step = 2 ** level
+            if chunk_cells % step:
+                break
+            self.lod_steps.append(step)
+        self.lod_primitives = [self._build_indices(step) for step in self.lod_steps]
+    
+    def _build_indices(self, step):
+        """Shared triangle list for one LOD level"""
+        n = self.chunk_cells
+        row = n + 1
+        grid_count = row * row
+        
+        i = np.arange(0, n, step)
+        ii, jj = np.meshgrid(i, i)
+        v00 = (jj * row + ii).ravel()
+        v10 = v00 + step
+        v01 = v00 + step * row
+        v11 = v01 + step
+        quads = [np.stack([v00, v10, v11], axis=1), np.stack([v00, v11, v01], axis=1)]
+        
+        # Skirt vertices follow the grid vertices: bottom, top, left, right edges
+        k = np.arange(0, n, step)
+        edges = [
+            (k, k + step),                          # bottom row (j = 0)
+            (n * row + k, n * row + k + step),      # top row (j = n)
+            (k * row, (k + step) * row),            # left column (i = 0)
+            (k * row + n, (k + step) * row + n),    # right column (i = n)
+        ]
+        for side, (a, b) in enumerate(edges):
+            sa = grid_count + side * row + k
+            sb = sa + step
+            # Emit both windings so skirts show from either side
+            quads.append(np.stack([a, sb, b], axis=1))
+            quads.append(np.stack([a, sa, sb], axis=1))
+            quads.append(np.stack([a, b, sb], axis=1))
+            quads.append(np.stack([a, sb, sa], axis=1))
+        
+        indices = np.concatenate(quads).astype(np.uint32).ravel()
+        prim = GeomTriangles(Geom.UH_static)
+        prim.setIndexType(Geom.NT_uint32)
+        handle = prim.modifyVertices()
+        handle.unclean_set_num_rows(len(indices))
+        memoryview(handle).cast('B')[:] = indices.tobytes()
+        return prim
+    
+    def build_vertices(self, heights, colors, x0, y0):
+        """Pack one chunk's vertex array (pure NumPy, safe off the main thread).
+        
+        heights is the (cells + 1)^2 height grid, colors an RGBA uint8 grid of
+        the same shape.
+        """
+        n = self.chunk_cells
+        cs = self.cell_size
+        coords = np.arange(n + 1) * cs
+        xs, ys = np.meshgrid(x0 + coords, y0 + coords)
+        
+        # Normals from central differences of the height grid
+        dzdy, dzdx = np.gradient(heights, cs)
+        normals = np.stack([-dzdx, -dzdy, np.ones_like(heights)], axis=-1)
+        normals /= np.linalg.norm(normals, axis=-1, keepdims=True)
+        
+        grid = np.empty((n + 1) * (n + 1), dtype=self.vertex_dtype)
+        grid['vertex'] = np.stack([xs, ys, heights], axis=-1).reshape(-1, 3)
+        grid['normal'] = normals.reshape(-1, 3)
+        grid['color'] = colors.reshape(-1, 4)
+        
+        flat = grid.reshape(n + 1, n + 1)
+        skirt = np.concatenate([flat[0, :], flat[n, :], flat[:, 0], flat[:, n]])
+        skirt['vertex'][:, 2] -= self.skirt_depth
+        return np.concatenate([grid, skirt])
+    
+    def make_chunk_node(self, name, vertices):
+        """Wrap a packed vertex array in an LODNode (main thread only)"""
+        vdata = GeomVertexData(name, self.format, Geom.UH_static)
+        vdata.unclean_set_num_rows(len(vertices))
+        memoryview(vdata.modifyArray(0)).cast('B')[:] = vertices.tobytes()
+        
+        lod = LODNode(name)
+        lod_np = NodePath(lod)
+        # Measured from the chunk centre, so reach its far corner
+        reach = None
+        if self.view_distance is not None:
+            reach = self.view_distance + self.chunk_cells * self.cell_size * math.sqrt(0.5)
+        
+        near = 0.0
+        for step, prim, far in zip(self.lod_steps, self.lod_primitives, self.lod_distances):
+            if reach is not None:
+                if near >= reach:
+                    break
+                far = min(far, reach)
+            geom = Geom(vdata)
+            geom.addPrimitive(prim)
+            geom_node = GeomNode(f"{name}_lod{step}")
+            geom_node.addGeom(geom)
+            lod.addSwitch(far, near)
+            lod_np.attachNewNode(geom_node)
+            near = far
+        
+        # Switch levels on the distance to the middle of the chunk
+        xyz = vertices['vertex']
+        center = (xyz.min(axis=0) + xyz.max(axis=0)) * 0.5
+        lod.setCenter(Point3(*center))
+        return lod_np
@@ -0,0 +1,199 @@
+"""
+Hardware instancing: one template geom drawn many times in a single call
+"""
+import numpy as np
+from panda3d.core import (
+    Texture, GeomEnums, BoundingBox, Point3
+)
+from components.shaders import (
+    INSTANCE_TEXELS, set_default_motion, set_lit_shader
+)
+
+class InstancedBatch:
+    """Draw a flattened template once per instance.
+    
+    The template should already be flattened (see batching.build_prototype);
+    it is copied, not modified.
+    
+    Per-instance transforms and colours live in a packed float32 array that
+    is uploaded to a buffer texture; the vertex shader reads its own slot
+    using gl_InstanceID. Draw calls stay at one per template geom no matter
+    how many instances there are. shader names the lit shader to draw with
+    (see shaders.LIT_SHADERS); it has to read the same instance layout.
+    """
+    
+    def __init__(self, template, parent, capacity, name="instances", padding=0.5, shader='instanced'):
+        self.capacity = capacity
+        self.padding = padding  # Bounds headroom for GPU-side animation
+        self.count = 0
+        self.data = np.zeros((capacity, INSTANCE_TEXELS, 4), dtype=np.float32)
+        self.data[:, 1, :3] = 1.0  # unit scale
+        self.data[:, 2, :] = 1.0   # white tint
+        
+        self.buffer = Texture(f"{name}_data")
+        self.buffer.setupBufferTexture(
+            capacity * INSTANCE_TEXELS, Texture.T_float, Texture.F_rgba32,
+            GeomEnums.UH_dynamic
+        )
+        
+        self.template_radius = self._template_radius(template)
+        self.node = template.copyTo(parent)
+        self.node.setName(name)
+        set_lit_shader(self.node, shader)
+        self.node.setShaderInput("instance_data", self.buffer)
+        set_default_motion(self.node)
+        self.node.setInstanceCount(0)
+        
+        # The geoms' own bounds only cover the template at the origin
+        self.geom_nodes = [self.node] + list(self.node.findAllMatches("**/+GeomNode"))
+        for geom_np in self.geom_nodes:
+            geom_np.node().setFinal(True)
+        
+        self.upload()
+    
+    def _template_radius(self, template):
+        """Horizontal/vertical extent of the template around its origin"""
+        bounds = template.getTightBounds()
+        if not bounds:
+            return Point3(1, 1, 1)
+        low, high = bounds
+        reach = max(abs(low.x), abs(low.y), abs(high.x), abs(high.y))
+        return Point3(reach, reach, max(abs(low.z), abs(high.z)))
+    
+    def set_instances(self, positions, headings=None, scales=None, colors=None, phases=None):
+        """Replace all instances at once.
+        
+        positions is (N, 3); headings (N,) in degrees; scales (N,) or (N, 3);
+        colors (N, 4); phases (N,) animation phases. Missing arrays fall back
+        to identity values.
+        """
+        count = len(positions)
+        if count > self.capacity:
+            raise ValueError(f"{count} instances exceed capacity {self.capacity}")
+        
+        self.count = count
+        self.data[:count, 0, :3] = positions
+        self.data[:count, 0, 3] = 0.0 if headings is None else np.radians(headings)
+        if scales is None:
+            self.data[:count, 1, :3] = 1.0
+        else:
+            scales = np.asarray(scales, dtype=np.float32)
+            self.data[:count, 1, :3] = scales[:, None] if scales.ndim == 1 else scales
+        self.data[:count, 1, 3] = 0.0 if phases is None else phases
+        self.data[:count, 2, :] = 1.0 if colors is None else colors
+        self.upload()
+    
+    def upload(self):
+        """Push the live part of the instance array to the GPU and refresh bounds"""
+        live = self.data[:self.count]
+        memoryview(self.buffer.modifyRamImage())[:live.nbytes] = live.tobytes()
+        self.node.setInstanceCount(self.count)
+        self._update_bounds()
+    
+    def _update_bounds(self):
+        """Cover every instance so the batch is culled as a whole"""
+        if self.count == 0:
+            bounds = BoundingBox(Point3(0, 0, 0), Point3(0, 0, 0))
+        else:
+            active = self.data[:self.count]
+            reach = np.array(self.template_radius) * active[:, 1, :3].max() + self.padding
+            low = active[:, 0, :3].min(axis=0) - reach
+            high = active[:, 0, :3].max(axis=0) + reach
+            bounds = BoundingBox(Point3(*low), Point3(*high))
+        
+        for geom_np in self.geom_nodes:
+            geom_np.node().setBounds(bounds)
+    
+    def remove(self):
+        """Detach the batch from the scene"""
+        self.node.removeNode()
+
+class EntityInstances:
+    """Many copies of one prototype, drawn the cheapest way the GPU allows.
+    
+    With hardware instancing every copy is a slot in one InstancedBatch.
+    Otherwise each copy is a placeholder node sharing the prototype's geoms
+    through instanceTo, so nothing is loaded or duplicated per entity.
+    With gpu_animation the phases feed the shader's idle animation and
+    set_transforms only needs calling when something actually changes.
+    
+    Given a culling.CellGrid, placeholders live in the grid's cells instead
+    of directly under parent, moving to another cell when they cross into it.
+    """
+    
+    def __init__(self, prototype, parent, positions, phases=None, hardware=False,
+                 gpu_animation=False, name="entities", grid=None):
+        self.count = len(positions)
+        self.gpu_animation = gpu_animation
+        self.grid = grid
+        self.batch = None
+        self.placeholders = []
+        self.visible = np.ones(self.count, dtype=bool)
+        if phases is None:
+            phases = np.zeros(self.count, dtype=np.float32)
+        
+        if hardware:
+            self.batch = InstancedBatch(prototype, parent, max(self.count, 1), name)
+            self.batch.set_instances(positions, phases=phases if gpu_animation else None)
+            return
+        
+        if grid is not None:
+            self.cell_keys = grid.keys(positions)
+        for index, (x, y, z) in enumerate(positions):
+            cell = parent if grid is None else grid.cell(tuple(self.cell_keys[index]))
+            placeholder = cell.attachNewNode(f"{name}_{index}")
+            placeholder.setPos(x, y, z)
+            prototype.instanceTo(placeholder)
+            if gpu_animation:
+                set_lit_shader(placeholder, 'animated')
+                placeholder.setShaderInput("anim_phase", float(phases[index]))
+            self.placeholders.append(placeholder)
+    
+    def set_transforms(self, positions, headings, visible=None, phases=None):
+        """Push positions, headings (degrees) and visibility for the copies.
+        
+        Copies past len(positions) are hidden, so a pool can keep its live
+        entries packed at the front and pass only those. phases replaces the
+        animation phases given at construction.
+        """
+        active = len(positions)
+        if visible is None:
+            visible = np.ones(active, dtype=bool)
+        
+        if self.batch is not None:
+            # Bulk write into the instance buffer; hidden copies shrink to
+            # nothing and only the live prefix is drawn at all
+            data = self.batch.data[:active]
+            data[:, 0, :3] = positions
+            data[:, 0, 3] = np.radians(headings)
+            data[:, 1, :3] = np.where(visible, 1.0, 0.0)[:, None]
+            if phases is not None:
+                data[:, 1, 3] = phases
+            self.batch.count = active
+            self.batch.upload()
+            return
+        
+        visible = np.concatenate([visible, np.zeros(self.count - active, dtype=bool)])
+        if phases is not None and self.gpu_animation:
+            for index in range(active):
+                self.placeholders[index].setShaderInput("anim_phase", float(phases[index]))
+        
+        for index in np.flatnonzero(visible != self.visible):
+            if visible[index]:
+                self.placeholders[index].show()
+            else:
+                self.placeholders[index].hide()
+        self.visible = np.array(visible, dtype=bool)
+        
+        if self.grid is not None and active:
+            keys = self.grid.keys(positions)
+            for index in np.flatnonzero((keys != self.cell_keys[:active]).any(axis=1)):
+                self.placeholders[index].reparentTo(self.grid.cell(tuple(keys[index])))
+            self.cell_keys[:active] = keys
+        
+        for index in np.flatnonzero(self.visible):
+            x, y, z = positions[index]
+            if self.gpu_animation:
+                self.placeholders[index].setPos(x, y, z)  # The shader turns it
+            else:
+                self.placeholders[index].setPosHpr(x, y, z, headings[index], 0, 0)
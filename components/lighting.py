@@ -21,6 +21,7 @@ class LightingManager:
         sun.setColor(Vec4(1, 0.95, 0.85, 1))  # Warm sunlight
         self.sun_np = self.render.attachNewNode(sun)
         self.sun_np.setHpr(120, -45, 0)  # Afternoon sun angle
+        sun.setPriority(1)  # First in the shaders' light list, where shadows apply
         self.render.setLight(self.sun_np)
         
         # Secondary fill light (bounced light simulation)
@@ -0,0 +1,148 @@
+"""
+Level of detail for scenery: low-poly stand-ins and impostors baked from models
+"""
+import math
+import numpy as np
+from panda3d.core import (
+    Camera, FrameBufferProperties, Geom, GeomNode, GeomTriangles, GeomVertexData,
+    GeomVertexFormat, NodePath, OrthographicLens, SamplerState, Texture, TransparencyAttrib
+)
+
+def make_sphere(name, segments=6, rings=3):
+    """Unit sphere with segments around and rings from pole to pole.
+    
+    Like models/misc/sphere (10 x 5, 80 triangles) it has vertices only, so
+    it is lit and merged the same way; the default is 24 triangles.
+    """
+    vertices = [(0.0, 0.0, 1.0)]
+    for ring in range(1, rings):
+        polar = math.pi * ring / rings
+        for segment in range(segments):
+            angle = 2 * math.pi * segment / segments
+            vertices.append((
+                math.sin(polar) * math.cos(angle), math.sin(polar) * math.sin(angle), math.cos(polar)
+            ))
+    vertices.append((0.0, 0.0, -1.0))
+    bottom = len(vertices) - 1
+    
+    def ring_vertex(ring, segment):
+        return 1 + (ring - 1) * segments + segment % segments
+    
+    triangles = []
+    for segment in range(segments):
+        triangles.append((0, ring_vertex(1, segment), ring_vertex(1, segment + 1)))
+        for ring in range(1, rings - 1):
+            a, b = ring_vertex(ring, segment), ring_vertex(ring, segment + 1)
+            c, d = ring_vertex(ring + 1, segment), ring_vertex(ring + 1, segment + 1)
+            triangles.append((a, c, d))
+            triangles.append((a, d, b))
+        triangles.append((bottom, ring_vertex(rings - 1, segment + 1), ring_vertex(rings - 1, segment)))
+    
+    vdata = GeomVertexData(name, GeomVertexFormat.getV3(), Geom.UH_static)
+    vdata.unclean_set_num_rows(len(vertices))
+    memoryview(vdata.modifyArray(0)).cast('B')[:] = np.array(vertices, dtype=np.float32).tobytes()
+    return NodePath(_make_geom_node(name, vdata, triangles))
+
+def _make_geom_node(name, vdata, triangles):
+    """GeomNode drawing an index list of triangles from vdata"""
+    prim = GeomTriangles(Geom.UH_static)
+    for a, b, c in triangles:
+        prim.addVertices(a, b, c)
+    geom = Geom(vdata)
+    geom.addPrimitive(prim)
+    node = GeomNode(name)
+    node.addGeom(geom)
+    return node
+
+def make_impostor_card(name, texture, low, high, crossed=False):
+    """Quad showing texture over the x/z extent of the box low..high.
+    
+    The card stands in the y = 0 plane facing -Y, the way bake_impostor saw
+    the model. Its normals point up, which is how the normal-less foliage
+    it replaces is lit. Both sides are drawn. crossed adds a second quad
+    along Y, for an impostor that looks solid from any side without being
+    turned to face the camera.
+    """
+    quads = [((low.x, 0.0), (high.x, 0.0))]
+    if crossed:
+        # The model's x extent stands in for its depth as well
+        middle = (low.x + high.x) * 0.5
+        quads.append(((middle, low.x - middle), (middle, high.x - middle)))
+    
+    vdata = GeomVertexData(name, GeomVertexFormat.getV3n3t2(), Geom.UH_static)
+    rows = []
+    triangles = []
+    for (x0, y0), (x1, y1) in quads:
+        first = len(rows)
+        rows += [
+            (x0, y0, low.z, 0, 0, 1, 0, 0), (x1, y1, low.z, 0, 0, 1, 1, 0),
+            (x1, y1, high.z, 0, 0, 1, 1, 1), (x0, y0, high.z, 0, 0, 1, 0, 1),
+        ]
+        a, b, c, d = range(first, first + 4)
+        triangles += [(a, b, c), (a, c, d), (a, c, b), (a, d, c)]
+    vdata.unclean_set_num_rows(len(rows))
+    memoryview(vdata.modifyArray(0)).cast('B')[:] = np.array(rows, dtype=np.float32).tobytes()
+    
+    card = NodePath(_make_geom_node(name, vdata, triangles))
+    card.setTexture(texture)
+    card.setTransparency(TransparencyAttrib.M_binary)
+    return card
+
+def bake_impostor(window, model, size=128):
+    """Render model from the side into a texture with alpha, once.
+    
+    The model is drawn unlit with an orthographic camera looking along +Y,
+    fitted to its tight bounds, into a short-lived buffer sharing window's
+    GSG. Returns (texture, (low, high) bounds the texture covers), or None
+    if the buffer can't be made.
+    """
+    bounds = model.getTightBounds()
+    if not bounds:
+        return None
+    low, high = bounds
+    
+    name = f"{model.getName()}_impostor"
+    texture = Texture(name)
+    fbp = FrameBufferProperties()
+    fbp.setRgbaBits(8, 8, 8, 8)
+    fbp.setDepthBits(16)
+    buffer = window.makeTextureBuffer(name, size, size, texture, True, fbp)
+    if buffer is None:
+        return None
+    buffer.setClearColor((0, 0, 0, 0))
+    
+    scene = NodePath(f"{name}_scene")
+    model.instanceTo(scene)
+    scene.setLightOff(1)
+    scene.setShaderOff(1)
+    
+    lens = OrthographicLens()
+    lens.setFilmSize(high.x - low.x, high.z - low.z)
+    lens.setNearFar(0.5, high.y - low.y + 1.0)
+    camera = scene.attachNewNode(Camera(f"{name}_camera", lens))
+    camera.setPos((low.x + high.x) * 0.5, low.y - 0.5, (low.z + high.z) * 0.5)
+    buffer.makeDisplayRegion().setCamera(camera)
+    
+    engine = window.getEngine()
+    engine.renderFrame()
+    engine.removeWindow(buffer)
+    if not texture.hasRamImage():
+        return None
+    
+    _fill_transparent(texture)
+    texture.setWrapU(SamplerState.WM_clamp)
+    texture.setWrapV(SamplerState.WM_clamp)
+    texture.setMinfilter(SamplerState.FT_linear_mipmap_linear)
+    return texture, (low, high)
+
+def _fill_transparent(texture):
+    """Give empty texels the average colour of the drawn ones.
+    
+    Filtering mixes texels along the outline; with the black they were
+    cleared to, distant impostors would get dark edges.
+    """
+    texels = np.frombuffer(texture.getRamImageAs("RGBA"), dtype=np.uint8).reshape(-1, 4).copy()
+    drawn = texels[:, 3] >= 128
+    if drawn.any():
+        texels[~drawn, :3] = texels[drawn, :3].mean(axis=0)
+    texture.setRamImageAs(texels.tobytes(), "RGBA")
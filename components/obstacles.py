@@ -2,39 +2,121 @@
 Dangerous obstacles component (Crabs)
 """
 import random
+import numpy as np
 from panda3d.core import Vec3
+from components.batching import build_prototype
+from components.coins import respawn_spot
+from components.culling import CellGrid
+from components.events import EventBus, PlayerHit
+from components.instancing import EntityInstances
+from components.spatial import SpatialHash
+from components.shaders import CRAB_MOTION, set_motion
+from components.terrain import world_bounds
+
+# Closest a crab spawns to the world's edge
+EDGE_MARGIN = 20
+
+# Crab centres sit this far above the ground
+CRAB_HEIGHT = 0.5
+
+# How close a crab may get before it catches the player
+DANGER_RADIUS = 3.0
+
+# How far from the player crabs reappear in a streamed world
+RESPAWN_DISTANCE = (25.0, 60.0)
+
+def plan_obstacles(rng, num_obstacles, area, height_at):
+    """Pick crab spawns in area (low, high) and their animation phases.
+    
+    Spawns too close to the player's start are skipped, so there may be
+    fewer crabs than num_obstacles.
+    """
+    positions = []
+    animation_times = []
+    for i in range(num_obstacles):
+        x = rng.uniform(*area)
+        y = rng.uniform(*area)
+        
+        # Don't spawn too close to player start
+        if abs(x - 50) < 20 and abs(y - 50) < 20:
+            continue
+        
+        z = height_at(x, y) + CRAB_HEIGHT  # Sit on the ground
+        positions.append((x, y, z))
+        animation_times.append(rng.uniform(0, 360))
+    
+    return {
+        'positions': np.array(positions, dtype=np.float32).reshape(-1, 3),
+        'animation_time': np.array(animation_times, dtype=np.float32),
+    }
 
 class ObstacleManager:
-    def __init__(self, loader, render):
+    def __init__(self, loader, render, num_obstacles=5, terrain=None, spatial=None,
+                 instanced=False, gpu_animation=False, rng=None, events=None, layout=None,
+                 view_distance=None, seed=None):
         self.loader = loader
         self.render = render
-        self.obstacles = []
+        self.num_obstacles = num_obstacles
+        self.terrain = terrain
+        self.spatial = spatial if spatial is not None else SpatialHash()
+        self.events = events if events is not None else EventBus()
+        self.danger_radius = DANGER_RADIUS
+        self.respawn_distance = RESPAWN_DISTANCE
+        self.instanced = instanced
+        self.gpu_animation = gpu_animation  # Rock and bob in the vertex shader
+        self.rng = rng if rng is not None else random.Random(seed)  # Seeded for repeatable runs
+        self.layout = layout  # Spawn positions and animation phases; see get_layout
+        self.crab_root = render.attachNewNode("crabs")
+        self.renderer = None
+        self.view_distance = view_distance  # Cells farther than this aren't drawn
+        self._dirty = False  # Positions changed since the shader last saw them
         self._spawn_obstacles()
     
     def _spawn_obstacles(self):
         """Spawn dangerous crabs across terrain"""
-        num_obstacles = 5  # Only 5 dangerous crabs
+        if self.layout is None:
+            area = world_bounds(self.terrain, EDGE_MARGIN)
+            self.layout = plan_obstacles(self.rng, self.num_obstacles, area, self._ground_z)
         
-        for i in range(num_obstacles):
-            x = random.uniform(20, 180)
-            y = random.uniform(20, 180)
-            
-            # Don't spawn too close to player start
-            if abs(x - 50) < 20 and abs(y - 50) < 20:
-                continue
-            
-            # Create crab
-            crab = self._create_crab(x, y)
-            
-            self.obstacles.append({
-                'model': crab,
-                'position': Vec3(x, y, 1),
-                'animation_time': random.uniform(0, 360)
-            })
+        # Crab state as parallel arrays
+        self.positions = np.array(self.layout['positions'], dtype=np.float32)
+        self.animation_time = np.array(self.layout['animation_time'], dtype=np.float32)
+        self.previous_animation_time = self.animation_time.copy()
+        for i, (x, y, _) in enumerate(self.positions):
+            self.spatial.insert('crabs', i, x, y)
+        
+        # Separate crabs are grouped into cells so culling skips whole cells
+        grid = None
+        if not self.instanced:
+            grid = CellGrid(self.crab_root, 40.0, self.view_distance, "crab_cells")
+        
+        # Build the crab once and draw a copy of it per crab
+        prototype = build_prototype("crab", lambda parent: self._create_crab(0, 0, 0, parent))
+        self.renderer = EntityInstances(
+            prototype, self.crab_root, self.positions, self.animation_time,
+            hardware=self.instanced, gpu_animation=self.gpu_animation, name="crabs",
+            grid=grid
+        )
+        
+        if self.gpu_animation:
+            set_motion(self.crab_root, **CRAB_MOTION)
+    
+    def get_layout(self):
+        """Where the crabs first spawned, as arrays"""
+        return self.layout
     
-    def _create_crab(self, x, y):
+    def _ground_z(self, x, y):
+        """Height of the ground at a crab spawn"""
+        if self.terrain is None:
+            return 0.5
+        return self.terrain.height_at(x, y)
+    
+    def _create_crab(self, x, y, z, parent=None):
         """Create a dangerous crab model"""
-        crab_node = self.render.attachNewNode("crab")
+        if parent is None:
+            parent = self.crab_root
+        
+        crab_node = parent.attachNewNode("crab")
         
         # Body (main red shell)
         body = self.loader.loadModel("models/misc/sphere")
@@ -127,37 +209,108 @@ class ObstacleManager:
         danger_dot.setColor(1, 1, 0, 1)
         danger_dot.reparentTo(crab_node)
         
-        crab_node.setPos(x, y, 1)
+        crab_node.setPos(x, y, z)
         return crab_node
     
-    def update(self, player_pos, dt):
-        """Update obstacles and check collision"""
-        import math
+    def update(self, player_pos, dt, previous_pos=None):
+        """Advance obstacles one simulation step and check collision.
         
-        for obstacle in self.obstacles:
-            # Animate crab (slight movement and rotation)
-            obstacle['animation_time'] += dt * 100
-            
-            # Rock back and forth
-            rock = math.sin(obstacle['animation_time'] * 0.05) * 5
-            obstacle['model'].setH(rock)
-            
-            # Bob slightly
-            bob = math.sin(obstacle['animation_time'] * 0.03) * 0.2
-            obs_pos = obstacle['position']
-            obstacle['model'].setPos(obs_pos.x, obs_pos.y, obs_pos.z + bob)
-            
-            # Check collision with player
-            distance = self._distance_2d(player_pos, obs_pos)
-            
-            if distance < 3.0:  # Danger zone
-                return True  # Player hit obstacle
+        With previous_pos the whole path of the step is checked, so a fast
+        player can't pass through a crab between two ticks.
+        """
+        self.advance(dt)
+        hit = self.check_hit(player_pos, previous_pos)
+        if hit is not None:
+            self.events.publish(PlayerHit(hit))
+            return True  # Player hit obstacle
         
         return False  # Safe
     
-    def _distance_2d(self, pos1, pos2):
-        """Calculate 2D distance"""
-        import math
-        dx = pos1.x - pos2.x
-        dy = pos1.y - pos2.y
-        return math.sqrt(dx * dx + dy * dy)
+    def advance(self, dt):
+        """Move the crabs' idle animation on by one step"""
+        if not self.gpu_animation:
+            # Animate crabs (slight movement and rotation)
+            self.previous_animation_time[:] = self.animation_time
+            self.animation_time += dt * 100
+    
+    def check_hit(self, player_pos, previous_pos=None):
+        """Index of the first crab on a player's path this step, or None"""
+        # Check collision only against crabs in cells near the player's path
+        if previous_pos is None:
+            previous_pos = player_pos
+        hits = self.spatial.query_segment(
+            'crabs', previous_pos.x, previous_pos.y, player_pos.x, player_pos.y, self.danger_radius
+        )
+        return int(hits[0]) if hits else None
+    
+    def sync_visuals(self, alpha=1.0):
+        """CPU idle animation, alpha of the way into the last step"""
+        if self.gpu_animation:
+            # The shader animates in place, so only moved crabs need pushing
+            if self._dirty:
+                self._dirty = False
+                self.renderer.set_transforms(
+                    self.positions, np.zeros(len(self.positions)), phases=self.animation_time
+                )
+            return
+        
+        previous = self.previous_animation_time
+        animation_time = previous + (self.animation_time - previous) * alpha
+        
+        # Rock back and forth
+        rock = np.sin(animation_time * 0.05) * 5
+        
+        # Bob slightly
+        positions = self.positions.copy()
+        positions[:, 2] += np.sin(animation_time * 0.03) * 0.2
+        
+        self.renderer.set_transforms(positions, rock)
+    
+    def relocate(self, indices, near):
+        """Move crabs to random spots a respawn distance from near.
+        
+        A streamed world has no edge, so crabs left behind in chunks that
+        were dropped reappear around the player instead.
+        """
+        for index in indices:
+            x, y = respawn_spot(self.rng, near.x, near.y, self.respawn_distance)
+            self._place(index, x, y)
+        if len(indices):
+            self._dirty = True
+    
+    def _place(self, index, x, y):
+        """Put a crab on the ground at (x, y) and re-index it"""
+        self.spatial.remove('crabs', index)
+        self.positions[index] = (x, y, self._ground_z(x, y) + CRAB_HEIGHT)
+        x, y, _ = self.positions[index]
+        self.spatial.insert('crabs', index, x, y)
+    
+    def snapshot(self):
+        """Copy of the crabs' state, for restore"""
+        return {
+            'positions': self.positions.copy(),
+            'animation_time': self.animation_time.copy(),
+            'previous_animation_time': self.previous_animation_time.copy(),
+        }
+    
+    def restore(self, state):
+        """Return to a snapshot"""
+        moved = np.flatnonzero((self.positions != state['positions']).any(axis=1))
+        for index in moved:
+            self.spatial.remove('crabs', index)
+        self.positions[:] = state['positions']
+        for index in moved:
+            x, y, _ = self.positions[index]
+            self.spatial.insert('crabs', index, x, y)
+        if len(moved):
+            self._dirty = True
+        self.animation_time[:] = state['animation_time']
+        self.previous_animation_time[:] = state['previous_animation_time']
+    
+    def get_position(self, index):
+        """World position of a crab"""
+        return Vec3(*self.positions[index])
+    
+    def get_count(self):
+        """Number of crabs"""
+        return len(self.positions)
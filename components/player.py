@@ -3,25 +3,51 @@ Player character component with humanoid model
 """
 from panda3d.core import Vec3
 import math
+from components.terrain import world_bounds
+
+# Loaded through the asset cache, which keeps a converted .bam copy
+MODEL_PATH = "components/IronMan.obj"
+
+# Closest the player may walk to the world's edge
+EDGE_MARGIN = 5
+
+# Where a session starts (then snapped to the ground) and how the player moves
+START_POSITION = (50, 50, 2)
+GROUND_OFFSET = 1.0  # Model origin height above the ground
+MOVE_SPEED = 20.0
+TURN_SPEED = 120.0
 
 class Player:
-    def __init__(self, loader, render, start_pos=Vec3(50, 50, 2)):
+    def __init__(self, loader, render, start_pos=Vec3(*START_POSITION), terrain=None, build_model=True):
         self.loader = loader
         self.render = render
-        self.position = start_pos
+        self.terrain = terrain
+        self.position = Vec3(start_pos)
         self.heading = 0
-        self.move_speed = 20.0
-        self.turn_speed = 120.0
         
-        # Create player model
-        self.model = self._create_player_model()
-        self.model.setPos(self.position)
+        # Pose at the previous simulation tick, for render interpolation
+        self.previous_position = Vec3(self.position)
+        self.previous_heading = 0
+        self.ground_offset = GROUND_OFFSET
+        self.bounds = world_bounds(terrain, EDGE_MARGIN)  # None lets the player roam a streamed world
+        self.move_speed = MOVE_SPEED
+        self.turn_speed = TURN_SPEED
+        
+        # Stand on the terrain surface
+        self._snap_to_ground()
+        self.previous_position = Vec3(self.position)
+        
+        # Create player model (a server simulating many players needs none)
+        self.model = None
+        if build_model:
+            self.model = self._create_player_model()
+            self.model.setPos(self.position)
     
     def _create_player_model(self):
         """Load 3D player model from OBJ file"""
         # Load the IronMan OBJ model
         try:
-            player_model = self.loader.loadModel("components/IronMan.obj")
+            player_model = self.loader.loadModel(MODEL_PATH)
             if player_model:
                 player_model.reparentTo(self.render)
                 
@@ -54,7 +80,10 @@ class Player:
             return fallback
     
     def update(self, keys, dt):
-        """Update player position and rotation"""
+        """Advance position and rotation by one simulation step"""
+        self.previous_position = Vec3(self.position)
+        self.previous_heading = self.heading
+        
         # Handle rotation
         if keys['left']:
             self.heading += self.turn_speed * dt
@@ -78,16 +107,61 @@ class Player:
             self.position.y += dy
             
             # Keep in bounds
-            self.position.x = max(5, min(195, self.position.x))
-            self.position.y = max(5, min(195, self.position.y))
-            
-            # Walking animation (bob)
-            bob = math.sin(dt * 50) * 0.2
-            self.model.setZ(self.position.z + bob)
+            if self.bounds is not None:
+                low, high = self.bounds
+                self.position.x = max(low, min(high, self.position.x))
+                self.position.y = max(low, min(high, self.position.y))
         
-        # Update transform
-        self.model.setPos(self.position.x, self.position.y, self.position.z)
-        self.model.setH(self.heading)
+        # Follow the ground
+        self._snap_to_ground()
+    
+    def interpolate(self, alpha):
+        """Pose a fraction alpha of the way from the previous tick to this one"""
+        position = self.previous_position + (self.position - self.previous_position) * alpha
+        heading = self.previous_heading + (self.heading - self.previous_heading) * alpha
+        return position, heading
+    
+    def sync_visuals(self, alpha=1.0):
+        """Place the model between the last two simulation ticks"""
+        position, heading = self.interpolate(alpha)
+        self.model.setPos(position)
+        self.model.setH(heading)
+        return position, heading
+    
+    def reset(self, position, heading=0):
+        """Jump to a pose without interpolating from the old one"""
+        self.position = Vec3(position)
+        self.heading = heading
+        self.previous_position = Vec3(self.position)
+        self.previous_heading = heading
+        if self.model is not None:
+            self.model.setPos(self.position)
+            self.model.setH(heading)
+    
+    def snapshot(self):
+        """Everything restore needs to put the player back as it is now"""
+        return {
+            'position': tuple(self.position),
+            'heading': self.heading,
+            'previous_position': tuple(self.previous_position),
+            'previous_heading': self.previous_heading,
+        }
+    
+    def restore(self, state):
+        """Return to a snapshot"""
+        self.position = Vec3(*state['position'])
+        self.heading = state['heading']
+        self.previous_position = Vec3(*state['previous_position'])
+        self.previous_heading = state['previous_heading']
+        if self.model is not None:
+            self.model.setPos(self.position)
+            self.model.setH(self.heading)
+    
+    def _snap_to_ground(self):
+        """Put the player on the terrain surface"""
+        if self.terrain is not None:
+            x, y = self.position.x, self.position.y
+            self.position.z = self.terrain.height_at(x, y) + self.ground_offset
     
     def get_position(self):
         """Get current position"""
@@ -0,0 +1,106 @@
+"""
+Frame profiler: per-subsystem timings, a Chrome trace export and PStats hooks
+"""
+from collections import deque
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+from panda3d.core import PStatClient, PStatCollector
+
+class Profiler:
+    """Time named sections of every frame.
+    
+    Wrap each subsystem call in section(name). The profiler keeps the last
+    history frames of per-section times for the overlay, can record every
+    section as a Chrome trace event (open the export in chrome://tracing or
+    ui.perfetto.dev), and mirrors each section to a PStats collector under
+    "App" so the same names show up when a PStats server is attached.
+    """
+    
+    def __init__(self, history=60, max_events=500000):
+        self.history = history
+        self.max_events = max_events
+        self.samples = {}  # section name -> deque of per-frame milliseconds
+        self.current = {}  # section name -> seconds so far this frame
+        self.collectors = {}
+        self.frame_start = None
+        
+        # Trace recording
+        self.recording = False
+        self.events = []
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+    
+    @contextmanager
+    def section(self, name):
+        """Time the body of a with-block as one call of section name"""
+        collector = self.collectors.get(name)
+        if collector is None:
+            collector = self.collectors[name] = PStatCollector(f"App:{name}")
+        
+        collector.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            collector.stop()
+            self.current[name] = self.current.get(name, 0.0) + end - start
+            if self.recording:
+                self._record(name, start, end)
+    
+    def begin_frame(self):
+        """Close the previous frame and start timing a new one"""
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            # Frame time runs start to start, so it includes rendering
+            self.current['frame'] = now - self.frame_start
+            for name, seconds in self.current.items():
+                if name not in self.samples:
+                    self.samples[name] = deque(maxlen=self.history)
+                self.samples[name].append(seconds * 1000)
+            if self.recording:
+                self._record('frame', self.frame_start, now)
+        self.current = {}
+        self.frame_start = now
+    
+    def get_averages(self):
+        """Mean milliseconds per frame for every section over the history"""
+        return {name: sum(values) / len(values) for name, values in self.samples.items() if values}
+    
+    def _record(self, name, start, end):
+        """Add one complete ("X") event to the trace"""
+        if len(self.events) >= self.max_events:
+            return
+        self.events.append({
+            'name': name,
+            'ph': 'X',
+            'ts': (start - self.origin) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': self.pid,
+            'tid': threading.get_ident(),
+        })
+    
+    def start_trace(self):
+        """Begin recording trace events"""
+        self.events = []
+        self.recording = True
+    
+    def stop_trace(self, path=None):
+        """Stop recording and write the trace; returns the file name"""
+        self.recording = False
+        if path is None:
+            path = time.strftime("trace-%Y%m%d-%H%M%S.json")
+        self.export_trace(path)
+        return path
+    
+    def export_trace(self, path):
+        """Write recorded events in Chrome trace event format"""
+        with open(path, 'w') as out:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, out)
+    
+    def connect_pstats(self):
+        """Send timings to a running PStats server, if there is one"""
+        return PStatClient.connect()
@@ -0,0 +1,152 @@
+"""
+Network protocol: framed binary messages and delta-compressed snapshots
+"""
+import struct
+import numpy as np
+
+# Message types
+MSG_WELCOME = 1   # server -> client: your player id, tick rate, interest radius
+MSG_INPUT = 2     # client -> server: key states
+MSG_SNAPSHOT = 3  # server -> client: what changed near you since the last snapshot
+MSG_STATS = 4     # client -> server: empty request; server -> client: JSON stats
+
+FRAME = struct.Struct("<IB")             # payload length, message type
+WELCOME = struct.Struct("<HHf")          # player id, tick rate, interest radius
+INPUT = struct.Struct("<IB")             # sequence number, key bits
+SNAPSHOT = struct.Struct("<IHH")         # tick, your score, your deaths
+COUNT = struct.Struct("<H")
+
+KEY_BITS = {'forward': 1, 'backward': 2, 'left': 4, 'right': 8}
+
+# Entity layers in snapshot order
+LAYERS = ('players', 'coins', 'crabs')
+
+# One entity as sent: id, position in 1/POSITION_SCALE units, heading in
+# 1/HEADING_SCALE degrees. int16 positions cover +-1024 units at 1/32.
+RECORD = np.dtype([
+    ('id', '<u2'), ('x', '<i2'), ('y', '<i2'), ('z', '<i2'), ('heading', '<u2')
+])
+POSITION_SCALE = 32.0
+HEADING_SCALE = 65536.0 / 360.0
+
+def encode_frame(msg_type, payload=b""):
+    """One message ready to write to the stream"""
+    return FRAME.pack(len(payload), msg_type) + payload
+
+async def read_frame(reader):
+    """Next (message type, payload) from an asyncio StreamReader"""
+    length, msg_type = FRAME.unpack(await reader.readexactly(FRAME.size))
+    payload = await reader.readexactly(length) if length else b""
+    return msg_type, payload
+
+def pack_keys(keys):
+    """Key state dict as a bit mask"""
+    return sum(bit for key, bit in KEY_BITS.items() if keys.get(key))
+
+def unpack_keys(bits):
+    """Bit mask back to a key state dict"""
+    return {key: bool(bits & bit) for key, bit in KEY_BITS.items()}
+
+def quantize(ids, positions, headings=None):
+    """Records for entities with the given ids, positions (N, 3) and headings"""
+    records = np.zeros(len(ids), dtype=RECORD)
+    records['id'] = ids
+    if len(ids):
+        scaled = np.rint(np.asarray(positions, dtype=np.float64) * POSITION_SCALE)
+        scaled = np.clip(scaled, -32768, 32767).astype(np.int16)
+        records['x'] = scaled[:, 0]
+        records['y'] = scaled[:, 1]
+        records['z'] = scaled[:, 2]
+        if headings is not None:
+            wrapped = np.mod(np.asarray(headings, dtype=np.float64), 360.0)
+            records['heading'] = np.rint(wrapped * HEADING_SCALE).astype(np.int64) & 0xFFFF
+    return records
+
+def dequantize(record):
+    """(x, y, z, heading) of one received record"""
+    return (
+        float(record['x']) / POSITION_SCALE,
+        float(record['y']) / POSITION_SCALE,
+        float(record['z']) / POSITION_SCALE,
+        float(record['heading']) / HEADING_SCALE,
+    )
+
+def _as_bytes(records):
+    """Records as an (N, record size) array of bytes"""
+    return np.ascontiguousarray(records).view(np.uint8).reshape(len(records), RECORD.itemsize)
+
+class SnapshotEncoder:
+    """Server side of one client's snapshot stream.
+    
+    Remembers the records last sent for every layer and only sends entities
+    that are new or changed since then, plus the ids of the ones that left
+    the client's interest range. The stream is ordered and reliable, so the
+    last snapshot sent is always the one the client has.
+    """
+    
+    def __init__(self):
+        self.sent = {layer: np.zeros(0, dtype=RECORD) for layer in LAYERS}
+    
+    def encode(self, tick, score, deaths, visible):
+        """Snapshot payload for {layer: records sorted by id}"""
+        parts = [SNAPSHOT.pack(tick, score, deaths)]
+        for layer in LAYERS:
+            current = visible[layer]
+            previous = self.sent[layer]
+            
+            # Entities already sent with exactly these values are skipped;
+            # records compare as raw bytes, much faster than field by field
+            if len(previous):
+                slot = np.minimum(np.searchsorted(previous['id'], current['id']), len(previous) - 1)
+                unchanged = (_as_bytes(previous[slot]) == _as_bytes(current)).all(axis=1)
+            else:
+                unchanged = np.zeros(len(current), dtype=bool)
+            changed = current[~unchanged]
+            
+            # Both id lists are sorted, so a binary search finds the ones that left
+            if len(current):
+                slot = np.minimum(np.searchsorted(current['id'], previous['id']), len(current) - 1)
+                removed = previous['id'][current['id'][slot] != previous['id']]
+            else:
+                removed = previous['id']
+            
+            parts.append(COUNT.pack(len(changed)))
+            parts.append(changed.tobytes())
+            parts.append(COUNT.pack(len(removed)))
+            parts.append(removed.astype('<u2').tobytes())
+            self.sent[layer] = current
+        return b"".join(parts)
+
+class SnapshotDecoder:
+    """Client side: applies snapshots to a local copy of the visible world"""
+    
+    def __init__(self):
+        self.entities = {layer: {} for layer in LAYERS}  # layer -> id -> record
+        self.tick = 0
+        self.score = 0
+        self.deaths = 0
+    
+    def decode(self, payload):
+        """Apply one snapshot payload"""
+        self.tick, self.score, self.deaths = SNAPSHOT.unpack_from(payload)
+        offset = SNAPSHOT.size
+        for layer in LAYERS:
+            entities = self.entities[layer]
+            
+            (count,) = COUNT.unpack_from(payload, offset)
+            offset += COUNT.size
+            changed = np.frombuffer(payload, RECORD, count, offset)
+            offset += changed.nbytes
+            for record in changed:
+                entities[int(record['id'])] = record
+            
+            (count,) = COUNT.unpack_from(payload, offset)
+            offset += COUNT.size
+            for entity_id in np.frombuffer(payload, '<u2', count, offset):
+                entities.pop(int(entity_id), None)
+            offset += count * 2
+    
+    def get_position(self, layer, entity_id):
+        """(x, y, z, heading) of a visible entity, or None"""
+        record = self.entities[layer].get(entity_id)
+        return None if record is None else dequantize(record)
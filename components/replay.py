@@ -0,0 +1,181 @@
+"""
+Input logs: a session's key presses recorded per tick and played back exactly
+"""
+import json
+import os
+import struct
+import numpy as np
+from components.protocol import KEY_BITS, pack_keys, unpack_keys
+from components.simulation import Simulation
+
+MAGIC = b"KEYS"
+LOG_VERSION = 1
+
+# magic, version, tick rate, seed, ticks (UNFINISHED until closed), settings length
+HEADER = struct.Struct("<4sHHqII")
+# Final player x, y, z (as the game's float32 Vec3), heading, coins collected, alive
+FINAL = struct.Struct("<3fdI?")
+UNFINISHED = 0xFFFFFFFF
+
+# Set in a tick's byte when the session restarted just before that tick
+RESTART = 0x80
+KEY_MASK = sum(KEY_BITS.values())
+
+class ReplayDiverged(Exception):
+    """A replay stopped matching the session it was recorded from"""
+
+class InputRecorder:
+    """Writes a session's input log as it is played.
+    
+    The log is a header with the seed, tick rate and world settings, then
+    one byte per fixed tick: the keys held (protocol.KEY_BITS), plus
+    RESTART if the player restarted just before it. Those are the only
+    inputs to the game, so seed, settings and bytes replay the session.
+    close() fills in the tick count and the final state, which a replay
+    checks itself against.
+    """
+    
+    def __init__(self, path, seed, tick_rate, settings):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.seed = seed
+        self.tick_rate = tick_rate
+        self.settings = json.dumps(settings, sort_keys=True).encode()
+        self.ticks = 0
+        self.pending = 0  # Flags for the next tick
+        
+        self.out = open(path, 'wb')
+        self._write_header(UNFINISHED)
+        self.out.write(bytes(FINAL.size))
+        self.out.write(self.settings)
+    
+    def _write_header(self, ticks):
+        self.out.write(HEADER.pack(MAGIC, LOG_VERSION, self.tick_rate, self.seed, ticks, len(self.settings)))
+    
+    def record(self, keys):
+        """Log the keys used for one tick"""
+        self.out.write(bytes((pack_keys(keys) | self.pending,)))
+        self.pending = 0
+        self.ticks += 1
+    
+    def restarted(self):
+        """The session restarted; flagged on the next tick"""
+        self.pending |= RESTART
+    
+    def close(self, final):
+        """Finish the log with the session's final_state"""
+        if self.out.closed:
+            return
+        x, y, z = final['position']
+        self.out.seek(0)
+        self._write_header(self.ticks)
+        self.out.write(FINAL.pack(x, y, z, final['heading'], final['coins'], final['alive']))
+        self.out.close()
+
+def read_log(path):
+    """Load an input log.
+    
+    Returns {'seed', 'tick_rate', 'settings', 'inputs': uint8 array with a
+    byte per tick, 'final': final_state at the end, or None if the log was
+    never closed}. Raises ValueError for a file that isn't a log of this
+    version.
+    """
+    with open(path, 'rb') as source:
+        data = source.read()
+    
+    if len(data) < HEADER.size + FINAL.size:
+        raise ValueError(f"{path} is not an input log")
+    magic, version, tick_rate, seed, ticks, settings_length = HEADER.unpack_from(data)
+    if magic != MAGIC or version != LOG_VERSION:
+        raise ValueError(f"{path} is not a version {LOG_VERSION} input log")
+    start = HEADER.size + FINAL.size
+    settings = json.loads(data[start:start + settings_length])
+    inputs = np.frombuffer(data, np.uint8, offset=start + settings_length)
+    
+    final = None
+    if ticks != UNFINISHED:
+        inputs = inputs[:ticks]
+        x, y, z, heading, coins, alive = FINAL.unpack_from(data, HEADER.size)
+        final = {'position': (x, y, z), 'heading': heading, 'coins': coins, 'alive': alive}
+    
+    return {'seed': seed, 'tick_rate': tick_rate, 'settings': settings, 'inputs': inputs, 'final': final}
+
+def final_state(player, coins, alive):
+    """What a log's end is checked against: exact, not rounded"""
+    position = player.get_position()
+    return {
+        'position': (position.x, position.y, position.z),
+        'heading': player.get_heading(),
+        'coins': coins.get_collected_count(),
+        'alive': alive,
+    }
+
+def compare_final(log, state):
+    """Fields of state that differ from the log's final state, as readable lines"""
+    if log['final'] is None:
+        return []
+    return [
+        f"{name}: recorded {log['final'][name]!r}, replayed {state[name]!r}"
+        for name in log['final'] if log['final'][name] != state[name]
+    ]
+
+class InputPlayer:
+    """Feeds a log's inputs back one tick at a time.
+    
+    Also a policy for Simulation.run, which restarts after every death just
+    as a player pressing R does; a death the log didn't restart from (or a
+    restart without one) raises ReplayDiverged.
+    """
+    
+    def __init__(self, inputs):
+        self.inputs = np.asarray(inputs).tolist()
+        self.tick = 0
+        self.restarts = 0
+        self.restarted_tick = None  # Tick whose restart the game has already carried out
+    
+    def finished(self):
+        """Every tick has been played"""
+        return self.tick >= len(self.inputs)
+    
+    def restart_pending(self):
+        """The session restarted before the next tick, and the replay hasn't yet"""
+        if self.finished() or self.restarted_tick == self.tick:
+            return False
+        return bool(self.inputs[self.tick] & RESTART)
+    
+    def restarted(self):
+        """The replay has restarted as the recording did before the next tick"""
+        self.restarted_tick = self.tick
+    
+    def next_keys(self):
+        """Key states for the next tick"""
+        bits = self.inputs[self.tick]
+        self.tick += 1
+        if bits & RESTART:
+            self.restarts += 1
+        return unpack_keys(bits & KEY_MASK)
+    
+    def __call__(self, simulation):
+        keys = self.next_keys()
+        if self.restarts != simulation.deaths:
+            raise ReplayDiverged(
+                f"tick {self.tick - 1}: {simulation.deaths} deaths but {self.restarts} restarts recorded"
+            )
+        return keys
+
+def replay_headless(log):
+    """Re-run a logged session without a window, as fast as the CPU allows.
+    
+    Returns the Simulation at the end and Simulation.run's timings. Raises
+    ValueError for a streamed world, which only the game can rebuild.
+    """
+    settings = log['settings']
+    if settings.get('streaming'):
+        raise ValueError("sessions in a streamed world can only be replayed in the game")
+    simulation = Simulation(
+        seed=log['seed'], dt=1.0 / log['tick_rate'], num_coins=settings['num_coins'],
+        num_obstacles=settings['num_obstacles'], endless=settings['endless'],
+        num_tiles=settings['num_tiles'], num_trees=settings['num_trees']
+    )
+    stats = simulation.run(len(log['inputs']), InputPlayer(log['inputs']))
+    return simulation, stats
@@ -0,0 +1,318 @@
+"""
+Dedicated server: one authoritative world shared by many networked players
+"""
+import asyncio
+from collections import deque
+import json
+import random
+import time
+import numpy as np
+from panda3d.core import NodePath, Vec3
+from components.assets import AssetCache, CoreLoader
+from components.coins import CoinManager
+from components.events import EventBus
+from components.obstacles import ObstacleManager
+from components.player import Player
+from components.protocol import (
+    INPUT, LAYERS, MSG_INPUT, MSG_SNAPSHOT, MSG_STATS, MSG_WELCOME, POSITION_SCALE, WELCOME,
+    SnapshotEncoder, encode_frame, quantize, read_frame, unpack_keys
+)
+from components.spatial import SpatialHash, bucket_rows
+from components.terrain import Terrain, world_bounds
+
+# Player ids go over the wire as 16 bits (protocol.WELCOME)
+MAX_PLAYERS = 65536
+
+# Closest a player spawns to the world's edge
+SPAWN_MARGIN = 20
+
+class ServerWorld:
+    """The game rules for any number of players, without a window.
+    
+    Like Simulation, components build their scene graph under a detached
+    root and nothing is ever drawn. Coins respawn endlessly at random spots
+    so the world never runs dry; a player caught by a crab loses nothing
+    but is put back at a fresh spawn point.
+    """
+    
+    def __init__(self, seed=0, num_coins=200, num_obstacles=20):
+        self.rng = random.Random(seed)
+        self.assets = AssetCache(CoreLoader())
+        self.render = NodePath("render")
+        self.events = EventBus()
+        
+        self.terrain = Terrain(self.assets, self.render, seed=seed, rng=self.rng)
+        self.spatial = SpatialHash()
+        self.coins = CoinManager(
+            self.assets, self.render, num_coins, terrain=self.terrain, spatial=self.spatial,
+            rng=self.rng, events=self.events, endless=True
+        )
+        self.obstacles = ObstacleManager(
+            self.assets, self.render, num_obstacles, terrain=self.terrain,
+            spatial=self.spatial, rng=self.rng, events=self.events
+        )
+        
+        self.players = {}  # player id -> Player, in joining order
+        self.keys = {}     # player id -> latest key states
+        self.scores = {}
+        self.deaths = {}
+        self.next_id = 0
+        self.tick = 0
+    
+    def add_player(self):
+        """Spawn a new player; returns its id, or None if every id is taken"""
+        if len(self.players) >= MAX_PLAYERS:
+            return None
+        
+        # Ids wrap around, skipping players who are still connected
+        while self.next_id in self.players:
+            self.next_id = (self.next_id + 1) % MAX_PLAYERS
+        player_id = self.next_id
+        self.next_id = (self.next_id + 1) % MAX_PLAYERS
+        player = Player(self.assets, self.render, terrain=self.terrain, build_model=False)
+        player.reset(self._spawn_point())
+        self.players[player_id] = player
+        self.keys[player_id] = unpack_keys(0)
+        self.scores[player_id] = 0
+        self.deaths[player_id] = 0
+        return player_id
+    
+    def remove_player(self, player_id):
+        """Drop a player who left"""
+        for table in (self.players, self.keys, self.scores, self.deaths):
+            table.pop(player_id, None)
+    
+    def set_keys(self, player_id, keys):
+        """Latest input from a player, used from the next tick on"""
+        if player_id in self.keys:
+            self.keys[player_id] = keys
+    
+    def _spawn_point(self):
+        """Somewhere in the world clear of crabs"""
+        area = world_bounds(self.terrain, SPAWN_MARGIN)
+        for _ in range(20):
+            x = self.rng.uniform(*area)
+            y = self.rng.uniform(*area)
+            spot = Vec3(x, y, self.terrain.height_at(x, y) + 1.0)
+            if self.obstacles.check_hit(spot) is None:
+                break
+        return spot
+    
+    def step(self, dt):
+        """Advance every player and the shared world by one tick"""
+        self.coins.advance(dt)
+        self.obstacles.advance(dt)
+        
+        for player_id, player in self.players.items():
+            player.update(self.keys[player_id], dt)
+            position = player.get_position()
+            previous = player.previous_position
+            self.scores[player_id] += self.coins.collect(position, previous)
+            if self.obstacles.check_hit(position, previous) is not None:
+                self.deaths[player_id] += 1
+                player.reset(self._spawn_point())
+        
+        self.coins.respawn_due()
+        self.tick += 1
+    
+    def get_records(self):
+        """Quantized state of every entity, per layer, in a fixed row order"""
+        ids = np.fromiter(self.players.keys(), dtype=np.int64, count=len(self.players))
+        positions = np.array([tuple(p.get_position()) for p in self.players.values()]).reshape(-1, 3)
+        headings = [p.get_heading() for p in self.players.values()]
+        active = self.coins.get_active_count()
+        crabs = self.obstacles.get_count()
+        return {
+            'players': quantize(ids, positions, headings),
+            'coins': quantize(np.arange(active), self.coins.positions[:active]),
+            'crabs': quantize(np.arange(crabs), self.obstacles.positions),
+        }
+
+class ClientConnection:
+    """Server-side state for one connected client"""
+    
+    def __init__(self, player_id, writer):
+        self.player_id = player_id
+        self.writer = writer
+        self.encoder = SnapshotEncoder()
+        self.connected = time.perf_counter()
+        self.bytes_sent = 0
+        self.snapshots_sent = 0
+        self.snapshots_skipped = 0
+    
+    def send(self, data):
+        """Queue bytes on the connection"""
+        self.writer.write(data)
+        self.bytes_sent += len(data)
+    
+    def get_bandwidth(self):
+        """Bytes sent per second since the client connected"""
+        elapsed = time.perf_counter() - self.connected
+        return self.bytes_sent / elapsed if elapsed > 0 else 0.0
+
+class GameServer:
+    """Runs a ServerWorld at a fixed tick rate and streams it over TCP.
+    
+    Each client gets a player in the world. Its key states arrive as INPUT
+    messages; once every snapshot_interval ticks it is sent a snapshot holding
+    only the entities within interest_radius of its player, found with a
+    cell index rebuilt from the tick's state, and only those that changed
+    since its previous snapshot. A client that can't keep up has snapshots
+    skipped rather than queued without limit.
+    """
+    
+    def __init__(self, world, host="127.0.0.1", port=7777, tick_rate=30, snapshot_rate=15,
+                 interest_radius=40.0, max_buffer=256 * 1024, history=300):
+        self.world = world
+        self.host = host
+        self.port = port
+        self.tick_rate = tick_rate
+        self.tick_dt = 1.0 / tick_rate
+        self.snapshot_interval = max(1, round(tick_rate / snapshot_rate))
+        self.interest_radius = interest_radius
+        self.max_buffer = max_buffer  # Unsent bytes before a client's snapshots are skipped
+        self.clients = {}  # player id -> ClientConnection
+        self.server = None
+        self.running = False
+        
+        # Stats
+        self.tick_times = deque(maxlen=history)  # Milliseconds per tick, simulation plus sending
+    
+    async def start(self):
+        """Listen for clients and start ticking"""
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.running = True
+        self.tick_task = asyncio.create_task(self._tick_loop())
+    
+    async def stop(self):
+        """Disconnect everyone and stop"""
+        self.running = False
+        self.server.close()
+        for client in list(self.clients.values()):
+            client.writer.close()
+        await self.server.wait_closed()
+        await self.tick_task
+    
+    async def _handle_client(self, reader, writer):
+        """One client's connection, from joining to leaving"""
+        player_id = self.world.add_player()
+        if player_id is None:
+            writer.close()  # Server full
+            return
+        client = ClientConnection(player_id, writer)
+        self.clients[player_id] = client
+        client.send(encode_frame(
+            MSG_WELCOME, WELCOME.pack(player_id, self.tick_rate, self.interest_radius)
+        ))
+        
+        try:
+            while True:
+                msg_type, payload = await read_frame(reader)
+                if msg_type == MSG_INPUT:
+                    _, bits = INPUT.unpack(payload)
+                    self.world.set_keys(player_id, unpack_keys(bits))
+                elif msg_type == MSG_STATS:
+                    client.send(encode_frame(MSG_STATS, json.dumps(self.get_stats()).encode()))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # Client went away
+        finally:
+            self.clients.pop(player_id, None)
+            self.world.remove_player(player_id)
+            writer.close()
+    
+    async def _tick_loop(self):
+        """Step the world on a fixed schedule"""
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while self.running:
+            start = time.perf_counter()
+            self.world.step(self.tick_dt)
+            self._send_snapshots()
+            self.tick_times.append((time.perf_counter() - start) * 1000)
+            
+            next_tick += self.tick_dt
+            delay = next_tick - loop.time()
+            if delay < -0.25:
+                next_tick = loop.time()  # Too far behind to catch up; drop the time
+            await asyncio.sleep(max(0.0, delay))
+    
+    def _send_snapshots(self):
+        """Send the clients due a snapshot this tick the changes within their interest range.
+        
+        Clients are spread over the snapshot interval by player id, so each
+        tick encodes a share of them instead of every client at once.
+        """
+        phase = self.world.tick % self.snapshot_interval
+        ids = list(self.world.players)  # Row order of get_records
+        due = np.array([
+            player_id % self.snapshot_interval == phase and player_id in self.clients
+            for player_id in ids
+        ], dtype=bool)
+        if not due.any():
+            return
+        records = self.world.get_records()
+        visible = self._find_visible(records, due)
+        
+        for row in np.flatnonzero(due).tolist():
+            player_id = ids[row]
+            client = self.clients[player_id]
+            if client.writer.transport.get_write_buffer_size() > self.max_buffer:
+                client.snapshots_skipped += 1
+                continue
+            payload = client.encoder.encode(
+                self.world.tick, self.world.scores[player_id] & 0xFFFF,
+                self.world.deaths[player_id] & 0xFFFF,
+                {layer: records[layer][visible[layer][row]] for layer in LAYERS}
+            )
+            client.send(encode_frame(MSG_SNAPSHOT, payload))
+            client.snapshots_sent += 1
+    
+    def _find_visible(self, records, due):
+        """Rows within interest range of each due player: {layer: [sorted rows per player]}.
+        
+        Everything is bucketed into cells one interest radius wide, so all
+        that a player can see lies in the 3x3 cells around its own. Players
+        sharing a cell share those candidates and are tested against them
+        together in one NumPy pass.
+        """
+        radius = self.interest_radius
+        points = {
+            layer: np.column_stack((records[layer]['x'], records[layer]['y'])) / POSITION_SCALE
+            for layer in LAYERS
+        }
+        cells = {layer: bucket_rows(points[layer], radius) for layer in LAYERS}
+        empty = np.zeros(0, dtype=np.int64)
+        visible = {layer: [empty] * len(records['players']) for layer in LAYERS}
+        
+        for (cx, cy), viewers in cells['players'].items():
+            viewers = viewers[due[viewers]]
+            if not len(viewers):
+                continue
+            eyes = points['players'][viewers]
+            for layer in LAYERS:
+                near = [
+                    cells[layer].get((cx + dx, cy + dy), empty)
+                    for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                ]
+                candidates = np.sort(np.concatenate(near))
+                offsets = points[layer][candidates][None, :, :] - eyes[:, None, :]
+                inside = np.einsum('ijk,ijk->ij', offsets, offsets) < radius * radius
+                for viewer, mask in zip(viewers.tolist(), inside):
+                    visible[layer][viewer] = candidates[mask]
+        return visible
+    
+    def get_stats(self):
+        """Tick timings and traffic so far"""
+        times = np.array(self.tick_times) if self.tick_times else np.zeros(1)
+        bandwidth = [client.get_bandwidth() for client in self.clients.values()]
+        return {
+            'players': len(self.world.players),
+            'ticks': self.world.tick,
+            'tick_ms_mean': float(times.mean()),
+            'tick_ms_p50': float(np.percentile(times, 50)),
+            'tick_ms_p99': float(np.percentile(times, 99)),
+            'tick_budget_ms': self.tick_dt * 1000,
+            'bytes_per_client_per_s': float(np.mean(bandwidth)) if bandwidth else 0.0,
+            'snapshots_skipped': sum(c.snapshots_skipped for c in self.clients.values()),
+        }
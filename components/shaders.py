@@ -0,0 +1,344 @@
+"""
+GLSL shaders shared by the instanced and animated renderers
+"""
+from panda3d.core import Shader, ShaderInput, Vec4
+
+# Shadow passes draw each node with a depth-only version of its lit shader,
+# picked by this tag (see set_lit_shader and shadows.ShadowManager)
+SHADOW_TAG = "lit_shader"
+
+# Every instance owns INSTANCE_TEXELS consecutive RGBA32F texels in a buffer
+# texture:
+#   0: x, y, z, heading (radians)
+#   1: scale x, scale y, scale z, animation phase
+#   2: colour tint r, g, b, a
+INSTANCE_TEXELS = 3
+
+# Idle animation evaluated on the GPU. With u = phase + rate * anim_time:
+#   heading = spin * u + rock_amplitude * sin(u * rock_frequency)   (degrees)
+#   lift    = bob_amplitude * sin(u * bob_frequency)
+ANIMATION_GLSL = """
+uniform float anim_time;
+uniform vec4 anim_motion;  // rate, spin, rock amplitude, rock frequency
+uniform vec4 anim_bob;     // bob amplitude, bob frequency, unused, unused
+
+vec2 animate(float phase) {
+    float u = phase + anim_motion.x * anim_time;
+    float heading = anim_motion.y * u + anim_motion.z * sin(u * anim_motion.w);
+    return vec2(radians(heading), anim_bob.x * sin(u * anim_bob.y));
+}
+
+mat3 rotate_z(float angle) {
+    float s = sin(angle);
+    float c = cos(angle);
+    return mat3(c, s, 0.0, -s, c, 0.0, 0.0, 0.0, 1.0);
+}
+
+// Like fixed-function GL, geoms without normals are lit as if facing +Z
+vec3 vertex_normal(vec3 normal) {
+    return dot(normal, normal) > 0.0 ? normal : vec3(0.0, 0.0, 1.0);
+}
+"""
+
+VERTEX_HEADER = """
+#version 150
+
+uniform mat4 p3d_ModelViewProjectionMatrix;
+uniform mat4 p3d_ModelViewMatrix;
+uniform mat4 p3d_ModelMatrix;
+uniform mat3 p3d_NormalMatrix;
+
+in vec4 p3d_Vertex;
+in vec3 p3d_Normal;
+in vec4 p3d_Color;
+in vec2 p3d_MultiTexCoord0;
+
+out vec3 v_normal;
+out vec4 v_color;
+out vec2 v_texcoord;
+out vec3 v_view_pos;
+out vec3 v_world_pos;
+""" + ANIMATION_GLSL
+
+INSTANCED_VERTEX = VERTEX_HEADER + """
+uniform samplerBuffer instance_data;
+
+void main() {
+    int base = gl_InstanceID * 3;
+    vec4 offset = texelFetch(instance_data, base);
+    vec4 scale = texelFetch(instance_data, base + 1);
+    vec4 tint = texelFetch(instance_data, base + 2);
+    
+    vec2 anim = animate(scale.w);
+    mat3 rot = rotate_z(offset.w + anim.x);
+    
+    vec3 local = rot * (p3d_Vertex.xyz * scale.xyz);
+    vec4 pos = vec4(local + offset.xyz + vec3(0.0, 0.0, anim.y), 1.0);
+    gl_Position = p3d_ModelViewProjectionMatrix * pos;
+    
+    v_normal = normalize(p3d_NormalMatrix * (rot * (vertex_normal(p3d_Normal) / scale.xyz)));
+    v_color = p3d_Color * tint;
+    v_texcoord = p3d_MultiTexCoord0;
+    v_view_pos = (p3d_ModelViewMatrix * pos).xyz;
+    v_world_pos = (p3d_ModelMatrix * pos).xyz;
+}
+"""
+
+# Instances of a flat card turned about Z to face the camera (an impostor,
+# see lod.bake_impostor). The card faces -Y before turning.
+IMPOSTOR_VERTEX = VERTEX_HEADER + """
+uniform mat4 p3d_ModelViewMatrixInverse;
+uniform samplerBuffer instance_data;
+
+void main() {
+    int base = gl_InstanceID * 3;
+    vec4 offset = texelFetch(instance_data, base);
+    vec4 scale = texelFetch(instance_data, base + 1);
+    vec4 tint = texelFetch(instance_data, base + 2);
+    
+    vec3 eye = (p3d_ModelViewMatrixInverse * vec4(0.0, 0.0, 0.0, 1.0)).xyz;
+    vec2 to_eye = eye.xy - offset.xy;
+    mat3 rot = rotate_z(atan(to_eye.x, -to_eye.y));
+    
+    vec4 pos = vec4(rot * (p3d_Vertex.xyz * scale.xyz) + offset.xyz, 1.0);
+    gl_Position = p3d_ModelViewProjectionMatrix * pos;
+    
+    // Lit as facing up, like the normal-less foliage it was baked from
+    v_normal = normalize(p3d_NormalMatrix * vertex_normal(p3d_Normal));
+    v_color = p3d_Color * tint;
+    v_texcoord = p3d_MultiTexCoord0;
+    v_view_pos = (p3d_ModelViewMatrix * pos).xyz;
+    v_world_pos = (p3d_ModelMatrix * pos).xyz;
+}
+"""
+
+# Plain per-node transform, for everything without a shader of its own
+STATIC_VERTEX = VERTEX_HEADER + """
+void main() {
+    gl_Position = p3d_ModelViewProjectionMatrix * p3d_Vertex;
+    
+    v_normal = normalize(p3d_NormalMatrix * vertex_normal(p3d_Normal));
+    v_color = p3d_Color;
+    v_texcoord = p3d_MultiTexCoord0;
+    v_view_pos = (p3d_ModelViewMatrix * p3d_Vertex).xyz;
+    v_world_pos = (p3d_ModelMatrix * p3d_Vertex).xyz;
+}
+"""
+
+# One entity per node: the phase comes from a per-node shader input
+ANIMATED_VERTEX = VERTEX_HEADER + """
+uniform float anim_phase;
+
+void main() {
+    vec2 anim = animate(anim_phase);
+    mat3 rot = rotate_z(anim.x);
+    
+    vec4 pos = vec4(rot * p3d_Vertex.xyz + vec3(0.0, 0.0, anim.y), 1.0);
+    gl_Position = p3d_ModelViewProjectionMatrix * pos;
+    
+    v_normal = normalize(p3d_NormalMatrix * (rot * vertex_normal(p3d_Normal)));
+    v_color = p3d_Color;
+    v_texcoord = p3d_MultiTexCoord0;
+    v_view_pos = (p3d_ModelViewMatrix * pos).xyz;
+    v_world_pos = (p3d_ModelMatrix * pos).xyz;
+}
+"""
+
+# Fragment shader of every lit shader; #defines pick the variant (see get_lit_shader)
+LIT_FRAGMENT_BODY = """
+uniform sampler2D p3d_Texture0;
+uniform struct {
+    vec4 ambient;
+} p3d_LightModel;
+uniform struct {
+    vec4 diffuse;
+    vec4 position;
+} p3d_LightSource[2];
+uniform struct {
+    vec4 color;
+    float density;
+} p3d_Fog;
+
+in vec3 v_normal;
+in vec4 v_color;
+in vec2 v_texcoord;
+in vec3 v_view_pos;
+in vec3 v_world_pos;
+
+out vec4 p3d_FragColor;
+
+#ifdef SHADOWS
+// Shadow maps look down the sun's direction: a point is stored at the spot
+// on the ground plane its sun ray passes through, with its height as depth.
+// See shadows.ShadowManager for how the maps are laid out.
+uniform sampler2DShadow shadow_atlas;
+uniform sampler2D shadow_slots;
+uniform sampler2DShadow shadow_cascades;
+uniform vec4 shadow_projection;    // ground shift per unit height x, y; depth range low z, high z
+uniform vec4 shadow_atlas_layout;  // tile size, slots per side, texels per tile, depth bias
+uniform vec4 shadow_cascade[SHADOW_CASCADES];  // corner x, y, size, texels per side
+
+float static_shadow(vec2 ground, float depth) {
+    float tile_size = shadow_atlas_layout.x;
+    float slots = shadow_atlas_layout.y;
+    vec2 tile = floor(ground / tile_size);
+    vec2 slot = mod(tile, slots);
+    
+    // A slot may still hold another tile, or nothing drawn yet
+    vec4 held = texelFetch(shadow_slots, ivec2(slot), 0);
+    if (held.z == 0.0 || held.xy != tile) {
+        return 1.0;
+    }
+    
+    // Half a texel in from the edges, so filtering never reads the next slot
+    float inset = 0.5 / shadow_atlas_layout.z;
+    vec2 local = clamp(ground / tile_size - tile, inset, 1.0 - inset);
+    // The texture may be padded past the buffer drawn into it
+    vec2 texel = (slot + local) * shadow_atlas_layout.z;
+    return texture(shadow_atlas, vec3(texel / vec2(textureSize(shadow_atlas, 0)), depth));
+}
+
+float dynamic_shadow(vec2 ground, float depth) {
+    // Cascades are sorted smallest first, so the sharpest one covering the point wins
+    for (int i = 0; i < SHADOW_CASCADES; ++i) {
+        vec2 local = (ground - shadow_cascade[i].xy) / shadow_cascade[i].z;
+        float inset = 0.5 / shadow_cascade[i].w;
+        if (all(greaterThanEqual(local, vec2(inset))) && all(lessThanEqual(local, vec2(1.0 - inset)))) {
+            vec2 texel = vec2(local.x + float(i), local.y) * shadow_cascade[i].w;
+            return texture(shadow_cascades, vec3(texel / vec2(textureSize(shadow_cascades, 0)), depth));
+        }
+    }
+    return 1.0;
+}
+
+float sun_visibility(float facing) {
+    // Surfaces turned away from the sun change height fastest within a texel
+    float slope = sqrt(1.0 - facing * facing) / max(facing, 0.2);
+    float z = v_world_pos.z + shadow_atlas_layout.w * (1.0 + slope);
+    vec2 ground = v_world_pos.xy + shadow_projection.xy * v_world_pos.z;
+    float depth = (shadow_projection.w - z) / (shadow_projection.w - shadow_projection.z);
+    return min(static_shadow(ground, depth), dynamic_shadow(ground, depth));
+}
+#endif
+
+void main() {
+    vec3 normal = normalize(v_normal);
+    vec3 light = p3d_LightModel.ambient.rgb;
+    
+    // The sun is light 0 (lighting.LightingManager gives it priority)
+    float sun = 1.0;
+#ifdef SHADOWS
+    sun = sun_visibility(clamp(dot(normal, normalize(p3d_LightSource[0].position.xyz)), 0.0, 1.0));
+#endif
+    for (int i = 0; i < 2; ++i) {
+        // Directional lights have w == 0 and store the direction to the light
+        vec3 to_light = normalize(p3d_LightSource[i].position.xyz);
+        float shadow = i == 0 ? sun : 1.0;
+        light += p3d_LightSource[i].diffuse.rgb * max(dot(normal, to_light), 0.0) * shadow;
+    }
+    
+    vec4 color = v_color * texture(p3d_Texture0, v_texcoord);
+#ifdef CUTOUT
+    // Drawn opaque: texels outside the shape are dropped, not blended
+    if (color.a < 0.5) {
+        discard;
+    }
+#endif
+    color.rgb *= light;
+    
+    float fog = exp(-p3d_Fog.density * length(v_view_pos));
+    color.rgb = mix(p3d_Fog.color.rgb, color.rgb, clamp(fog, 0.0, 1.0));
+    p3d_FragColor = color;
+}
+"""
+
+# Shadow passes only need depth; cutout shapes still drop their empty texels
+DEPTH_FRAGMENT_BODY = """
+uniform sampler2D p3d_Texture0;
+
+in vec4 v_color;
+in vec2 v_texcoord;
+
+void main() {
+#ifdef CUTOUT
+    if ((v_color * texture(p3d_Texture0, v_texcoord)).a < 0.5) {
+        discard;
+    }
+#endif
+}
+"""
+
+# Vertex shader of each lit shader, and whether it cuts out empty texels
+LIT_SHADERS = {
+    'static': (STATIC_VERTEX, False),
+    'instanced': (INSTANCED_VERTEX, False),
+    'impostor': (IMPOSTOR_VERTEX, True),
+    'animated': (ANIMATED_VERTEX, False),
+}
+
+# Motion presets matching the old CPU animation code
+COIN_MOTION = {'rate': 180, 'spin': 1, 'bob_amplitude': 0.3, 'bob_frequency': 0.05}
+CRAB_MOTION = {
+    'rate': 100, 'rock_amplitude': 5, 'rock_frequency': 0.05,
+    'bob_amplitude': 0.2, 'bob_frequency': 0.03,
+}
+
+_shaders = {}
+_shadow_cascades = 0  # Cascades lit shaders sample; see enable_shadows
+
+def _get_shader(name, vertex, fragment):
+    """Compile a shader once and reuse it"""
+    if name not in _shaders:
+        _shaders[name] = Shader.make(Shader.SL_GLSL, vertex, fragment)
+    return _shaders[name]
+
+def _fragment(body, defines):
+    """A fragment shader body with #defines switching its variant"""
+    return "#version 150\n" + "".join(f"#define {define}\n" for define in defines) + body
+
+def enable_shadows(cascades):
+    """Make lit shaders handed out from now on receive the sun's shadows.
+    
+    They then need the inputs shadows.ShadowManager sets, with that many
+    cascades.
+    """
+    global _shadow_cascades
+    _shadow_cascades = cascades
+
+def get_lit_shader(name):
+    """Lit shader built on one of the LIT_SHADERS vertex shaders"""
+    vertex, cutout = LIT_SHADERS[name]
+    defines = ["CUTOUT"] if cutout else []
+    if _shadow_cascades:
+        defines += ["SHADOWS", f"SHADOW_CASCADES {_shadow_cascades}"]
+    key = f"{name}_shadowed{_shadow_cascades}" if _shadow_cascades else name
+    return _get_shader(key, vertex, _fragment(LIT_FRAGMENT_BODY, defines))
+
+def get_depth_shader(name):
+    """Depth-only counterpart of a lit shader, for shadow passes"""
+    vertex, cutout = LIT_SHADERS[name]
+    return _get_shader(f"{name}_depth", vertex, _fragment(DEPTH_FRAGMENT_BODY, ["CUTOUT"] if cutout else []))
+
+def set_lit_shader(node, name, priority=0):
+    """Draw everything under node with a lit shader, tagged for shadow passes"""
+    node.setShader(get_lit_shader(name), priority)
+    node.setTag(SHADOW_TAG, name)
+
+def set_motion(node, rate=0, spin=0, rock_amplitude=0, rock_frequency=0,
+               bob_amplitude=0, bob_frequency=0, priority=0):
+    """Configure the idle animation for everything under node"""
+    motion = Vec4(rate, spin, rock_amplitude, rock_frequency)
+    bob = Vec4(bob_amplitude, bob_frequency, 0, 0)
+    node.setShaderInput(ShaderInput("anim_motion", motion, priority))
+    node.setShaderInput(ShaderInput("anim_bob", bob, priority))
+    
+    # Fallback clock; a value set higher up the graph (see set_animation_time) wins
+    node.setShaderInput(ShaderInput("anim_time", 0.0, -1))
+
+def set_default_motion(node):
+    """No animation, unless a parent node configures some"""
+    set_motion(node, priority=-1)
+
+def set_animation_time(node, time):
+    """Drive every GPU-animated entity under node from one clock"""
+    node.setShaderInput("anim_time", time)
@@ -0,0 +1,320 @@
+"""
+Sun shadows: a cached atlas for static scenery plus cascades for what moves
+"""
+import math
+import numpy as np
+from panda3d.core import (
+    BitMask32, Camera, ColorWriteAttrib, FrameBufferProperties, GraphicsOutput, GraphicsPipe,
+    LMatrix4f, MatrixLens, PTA_LVecBase4f, RenderState, SamplerState, ShaderAttrib,
+    Texture, Vec4, WindowProperties
+)
+from components.shaders import LIT_SHADERS, SHADOW_TAG, get_depth_shader
+
+# Camera bits: set_caster hides nodes from the shadow passes they don't cast in
+MAIN_CAMERA = BitMask32.bit(0)
+STATIC_CASTERS = BitMask32.bit(1)
+DYNAMIC_CASTERS = BitMask32.bit(2)
+
+# Far enough up-sun that every shadow camera sees the world from the sun's side
+SUN_DISTANCE = 1000.0
+
+class ShadowManager:
+    """Shadows cast by a fixed directional sun, sampled by the lit shaders.
+    
+    Every shadow map here looks down the sun's direction with an oblique
+    projection: a point lands where its sun ray crosses the ground plane
+    z = 0, and its height is its depth. That one mapping is shared by all
+    the maps, so they line up with the world's chunks:
+    
+    - Static casters (terrain, trees) are drawn once per chunk into a tile
+      of the static atlas. Tiles go in slots by chunk coordinates modulo
+      the slots per side, so a streamed world reuses slots as it moves;
+      the slot table tells the shaders which tile a slot holds and whether
+      it has been drawn. Casters reach into the tiles next to their chunk,
+      so adding a chunk redraws its neighbours too, a few tiles per frame.
+    - Dynamic casters (player, crabs) are drawn into cascades around the
+      camera, smallest first, each a square of cascade_sizes metres on the
+      ground. A cascade is only redrawn on frames where it moved or the
+      caller says a dynamic caster did (see update).
+    
+    A point is lit by the sun if neither map shadows it. Shadow cameras use
+    depth-only versions of the nodes' lit shaders (shaders.SHADOW_TAG).
+    """
+    
+    def __init__(self, window, render, camera, sun, tile_size, slots, tile_resolution=256,
+                 cascade_sizes=(24.0, 72.0), cascade_resolution=1024, depth_range=(-20.0, 40.0),
+                 bias=0.3, tiles_per_frame=2):
+        self.window = window
+        self.render = render
+        self.camera = camera
+        self.tile_size = tile_size
+        self.slots = slots
+        self.tile_resolution = tile_resolution
+        self.cascade_sizes = sorted(cascade_sizes)
+        self.cascade_resolution = cascade_resolution
+        self.low_z, self.high_z = depth_range
+        self.tiles_per_frame = tiles_per_frame
+        
+        # Where a point at height z lands on the ground, per unit of z
+        direction = render.getRelativeVector(sun, sun.node().getDirection())
+        direction.normalize()
+        self.direction = direction
+        self.shift = (-direction.x / direction.z, -direction.y / direction.z)
+        
+        # The main camera draws everything, shadow cameras only their casters
+        camera.node().setCameraMask(MAIN_CAMERA)
+        
+        # Static atlas: slots x slots tiles, drawn into as they are needed
+        self.atlas, self.atlas_buffer = self._make_depth_buffer(
+            "shadow_atlas", slots * tile_resolution, slots * tile_resolution
+        )
+        self.slot_table = Texture("shadow_slots")
+        self.slot_table.setup2dTexture(slots, slots, Texture.T_float, Texture.F_rgba32)
+        self.slot_table.setMinfilter(SamplerState.FT_nearest)
+        self.slot_table.setMagfilter(SamplerState.FT_nearest)
+        self.held = np.zeros((slots, slots, 4), dtype=np.float32)  # x, y, drawn, unused per slot
+        self._upload_slots()
+        
+        self.tiles = set()    # Chunk keys whose tiles should exist
+        self.dirty = []       # Tiles waiting to be drawn, oldest first
+        self.drawing = {}     # Slot -> key being drawn this frame
+        self.slot_regions = {}  # Slot -> display region, made on first use
+        self.slot_cameras = {}
+        
+        # Cascades sit side by side in one buffer, redrawn when something in them may have moved
+        count = len(self.cascade_sizes)
+        self.cascades, self.cascade_buffer = self._make_depth_buffer(
+            "shadow_cascades", count * cascade_resolution, cascade_resolution
+        )
+        self.cascade_cameras = []
+        self.cascade_regions = []
+        for index in range(count):
+            region = self.cascade_buffer.makeDisplayRegion(index / count, (index + 1) / count, 0, 1)
+            region.setClearDepthActive(True)
+            region.setClearDepth(1.0)
+            cascade_camera = self._make_shadow_camera(f"shadow_cascade{index}", DYNAMIC_CASTERS)
+            region.setCamera(cascade_camera)
+            self.cascade_cameras.append(cascade_camera)
+            self.cascade_regions.append(region)
+        self.cascade_inputs = PTA_LVecBase4f.emptyArray(count)
+        self.cascade_corners = [None] * count  # Where each cascade was last drawn
+        self.dynamic_state = None  # What update was last told about the dynamic casters
+        self.cascade_draws = 0
+        
+        render.setShaderInput("shadow_atlas", self.atlas)
+        render.setShaderInput("shadow_slots", self.slot_table)
+        render.setShaderInput("shadow_cascades", self.cascades)
+        render.setShaderInput("shadow_projection", Vec4(self.shift[0], self.shift[1], self.low_z, self.high_z))
+        render.setShaderInput("shadow_atlas_layout", Vec4(tile_size, slots, tile_resolution, bias))
+        render.setShaderInput("shadow_cascade", self.cascade_inputs)
+    
+    def _make_depth_buffer(self, name, width, height):
+        """Offscreen buffer rendering into a depth texture that shaders compare against"""
+        texture = Texture(name)
+        texture.setFormat(Texture.F_depth_component)
+        texture.setMinfilter(SamplerState.FT_shadow)
+        texture.setMagfilter(SamplerState.FT_shadow)
+        texture.setWrapU(SamplerState.WM_clamp)
+        texture.setWrapV(SamplerState.WM_clamp)
+        
+        fbp = FrameBufferProperties()
+        fbp.setDepthBits(24)
+        engine = self.window.getEngine()
+        buffer = engine.makeOutput(
+            self.window.getPipe(), name, -10, fbp, WindowProperties.size(width, height),
+            GraphicsPipe.BF_refuse_window, self.window.getGsg(), self.window
+        )
+        if buffer is None:
+            raise RuntimeError(f"can't create the {name} buffer")
+        buffer.addRenderTexture(texture, GraphicsOutput.RTM_bind_or_copy, GraphicsOutput.RTP_depth)
+        
+        # Regions clear their own part, so the rest of an atlas survives
+        buffer.setClearColorActive(False)
+        buffer.setClearDepthActive(False)
+        buffer.getDisplayRegion(0).setActive(False)
+        return texture, buffer
+    
+    def _make_shadow_camera(self, name, mask):
+        """Camera that draws one kind of caster, depth only"""
+        node = Camera(name, MatrixLens())
+        node.getLens().setFilmSize(2, 2)  # The user matrix alone maps to the film
+        node.setCameraMask(mask)
+        
+        node.setInitialState(RenderState.make(
+            ColorWriteAttrib.make(ColorWriteAttrib.C_off),
+            ShaderAttrib.make(get_depth_shader('static'), 1000)
+        ))
+        node.setTagStateKey(SHADOW_TAG)
+        for shader in LIT_SHADERS:
+            node.setTagState(shader, RenderState.make(ShaderAttrib.make(get_depth_shader(shader), 1001)))
+        
+        camera = self.render.attachNewNode(node)
+        # Detail levels are picked as if from the ground under the map, not the sun
+        lod_center = camera.attachNewNode(f"{name}_lod_center")
+        lod_center.setPos(self.direction * SUN_DISTANCE)
+        node.setLodCenter(lod_center)
+        return camera
+    
+    def _aim(self, camera, x0, y0, size):
+        """Point a shadow camera at the ground square from (x0, y0), size metres across"""
+        cx = x0 + size * 0.5
+        cy = y0 + size * 0.5
+        eye = (cx - self.direction.x * SUN_DISTANCE, cy - self.direction.y * SUN_DISTANCE,
+               -self.direction.z * SUN_DISTANCE)
+        camera.setPos(*eye)
+        
+        # World -> clip: ground spot to x, y; height to depth, high z nearest
+        scale = 2.0 / size
+        depth = self.high_z - self.low_z
+        world_to_clip = LMatrix4f(
+            scale, 0, 0, 0,
+            0, scale, 0, 0,
+            scale * self.shift[0], scale * self.shift[1], -2.0 / depth, 0,
+            -2.0 * x0 / size - 1.0, -2.0 * y0 / size - 1.0, (self.high_z + self.low_z) / depth, 1,
+        )
+        # The lens sees positions relative to the camera
+        camera.node().getLens().setUserMat(LMatrix4f.translateMat(*eye) * world_to_clip)
+    
+    def set_caster(self, node, kind):
+        """Mark what node casts: 'static' (cached per chunk), 'dynamic' (every frame) or None"""
+        if kind != 'static':
+            node.hide(STATIC_CASTERS)
+        if kind != 'dynamic':
+            node.hide(DYNAMIC_CASTERS)
+    
+    def add_tile(self, key):
+        """A chunk's static casters arrived: draw its tile, and redraw its neighbours"""
+        self.tiles.add(key)
+        tx, ty = key
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                neighbour = (tx + dx, ty + dy)
+                if neighbour in self.tiles and neighbour not in self.dirty:
+                    self.dirty.append(neighbour)
+    
+    def remove_tile(self, key):
+        """A chunk went away: stop using its tile"""
+        self.tiles.discard(key)
+        if key in self.dirty:
+            self.dirty.remove(key)
+        sx, sy = self._slot(key)
+        if tuple(self.held[sy, sx, :2]) == key:
+            self.held[sy, sx] = 0
+            self._upload_slots()
+    
+    def _slot(self, key):
+        """Atlas slot (column, row) of a chunk's tile"""
+        return key[0] % self.slots, key[1] % self.slots
+    
+    def update(self, dynamic_state):
+        """Draw a few waiting tiles and move the cascades with the camera (once per frame).
+        
+        dynamic_state is any value that changes whenever a dynamic caster
+        moves; while it and a cascade's place stay the same, the cascade
+        keeps what it drew last.
+        """
+        self._finish_tiles()
+        self._start_tiles()
+        
+        moved = dynamic_state != self.dynamic_state
+        self.dynamic_state = dynamic_state
+        self._place_cascades(moved)
+    
+    def _finish_tiles(self):
+        """Tiles drawn last frame can be sampled now"""
+        if not self.drawing:
+            return
+        for (sx, sy), key in self.drawing.items():
+            self.slot_regions[sx, sy].setActive(False)
+            if key in self.tiles:
+                self.held[sy, sx] = (key[0], key[1], 1, 0)
+        self.drawing = {}
+        self.atlas_buffer.setActive(False)
+        self._upload_slots()
+    
+    def _start_tiles(self):
+        """Set up to tiles_per_frame waiting tiles to be drawn this frame"""
+        while self.dirty and len(self.drawing) < self.tiles_per_frame:
+            key = self.dirty.pop(0)
+            slot = self._slot(key)
+            if slot in self.drawing:
+                self.dirty.append(key)  # Its slot is busy; try again next frame
+                break
+            
+            region = self._slot_region(slot)
+            self._aim(self.slot_cameras[slot], key[0] * self.tile_size, key[1] * self.tile_size, self.tile_size)
+            region.setActive(True)
+            self.drawing[slot] = key
+            
+            # Until it's drawn, a slot that held another tile holds nothing
+            sx, sy = slot
+            if tuple(self.held[sy, sx, :2]) != key:
+                self.held[sy, sx] = 0
+        if self.drawing:
+            self.atlas_buffer.setActive(True)
+            self._upload_slots()
+    
+    def _slot_region(self, slot):
+        """Display region (and camera) drawing one slot of the atlas, made on first use"""
+        region = self.slot_regions.get(slot)
+        if region is None:
+            sx, sy = slot
+            region = self.atlas_buffer.makeDisplayRegion(
+                sx / self.slots, (sx + 1) / self.slots, sy / self.slots, (sy + 1) / self.slots
+            )
+            region.setClearDepthActive(True)
+            region.setClearDepth(1.0)
+            camera = self._make_shadow_camera(f"shadow_slot_{sx}_{sy}", STATIC_CASTERS)
+            region.setCamera(camera)
+            self.slot_regions[slot] = region
+            self.slot_cameras[slot] = camera
+        return region
+    
+    def _place_cascades(self, moved):
+        """Centre each cascade a little ahead of the camera, snapped to whole texels.
+        
+        Only cascades that moved, or all of them if a caster moved, are drawn.
+        """
+        position = self.camera.getPos(self.render)
+        forward = self.render.getRelativeVector(self.camera, (0, 1, 0))
+        heading = math.atan2(forward.y, forward.x)
+        ground_x = position.x + self.shift[0] * position.z
+        ground_y = position.y + self.shift[1] * position.z
+        
+        for index, (size, camera) in enumerate(zip(self.cascade_sizes, self.cascade_cameras)):
+            # Snapping keeps shadow edges from crawling as the camera moves
+            texel = size / self.cascade_resolution
+            ahead = size * 0.25
+            x0 = math.floor((ground_x + math.cos(heading) * ahead - size * 0.5) / texel) * texel
+            y0 = math.floor((ground_y + math.sin(heading) * ahead - size * 0.5) / texel) * texel
+            redraw = moved or self.cascade_corners[index] != (x0, y0)
+            self.cascade_regions[index].setActive(redraw)
+            if not redraw:
+                continue
+            
+            self._aim(camera, x0, y0, size)
+            self.cascade_inputs.setElement(index, Vec4(x0, y0, size, self.cascade_resolution))
+            self.cascade_corners[index] = (x0, y0)
+            self.cascade_draws += 1
+        self.cascade_buffer.setActive(any(region.isActive() for region in self.cascade_regions))
+    
+    def _upload_slots(self):
+        """Push the slot table to the GPU"""
+        # Panda keeps texels in BGRA order
+        memoryview(self.slot_table.modifyRamImage())[:] = self.held[..., [2, 1, 0, 3]].tobytes()
+    
+    def get_stats(self):
+        """Tiles drawn and waiting, the atlas and cascade sizes, and cascades drawn so far"""
+        return {
+            'tiles': int(self.held[..., 2].sum()),
+            'waiting': len(self.dirty),
+            'atlas': self.atlas_buffer.getXSize(),
+            'cascades': len(self.cascade_sizes),
+            'cascade_draws': self.cascade_draws,
+        }
+    
+    def destroy(self):
+        """Release the shadow buffers"""
+        engine = self.window.getEngine()
+        engine.removeWindow(self.atlas_buffer)
+        engine.removeWindow(self.cascade_buffer)
@@ -0,0 +1,164 @@
+"""
+Headless simulation: the game rules without a window or a renderer
+"""
+import random
+import time
+from panda3d.core import NodePath
+from components.assets import AssetCache, CoreLoader
+from components.coins import CoinManager
+from components.events import EventBus, GameRestarted, PlayerDied, PlayerHit
+from components.obstacles import ObstacleManager
+from components.player import Player
+from components.spatial import SpatialHash
+from components.terrain import Terrain
+from components.trees import NUM_TREES, TreeManager
+from components.worldfile import read_world, unpack_rng_state
+
+KEYS = ('forward', 'backward', 'left', 'right')
+
+class Simulation:
+    """Run Player, CoinManager and ObstacleManager at a fixed timestep.
+    
+    Nothing is drawn: the components still build their scene graph, but it
+    hangs off a detached root that no camera ever looks at, so no graphics
+    pipe is needed, and sync_visuals is never called, so the scene graph is
+    never updated either. Everything random comes from one generator seeded with
+    seed, so the same seed and the same inputs always replay the same game.
+    
+    world is the path of a world file written by the game; the simulation then
+    plays in exactly that world, with its coin and crab counts. Without one,
+    num_tiles and num_trees match the game's world for the same seed: trees
+    are planned but never built, as planting them moves the generator on.
+    """
+    
+    def __init__(self, seed=0, dt=1.0 / 60.0, num_coins=50, num_obstacles=5, endless=False,
+                 world=None, num_tiles=5, num_trees=NUM_TREES):
+        self.seed = seed
+        self.dt = dt
+        self.rng = random.Random(seed)
+        layouts = read_world(world) if world is not None else {}
+        if layouts:
+            num_coins = len(layouts['coins']['positions'])
+            num_obstacles = len(layouts['crabs']['positions'])
+        self.assets = AssetCache(CoreLoader())
+        self.render = NodePath("render")
+        self.events = EventBus()
+        self.events.subscribe(PlayerHit, self._on_player_hit)
+        
+        self.terrain = Terrain(
+            self.assets, self.render, num_tiles, seed=seed, rng=self.rng,
+            layout=layouts.get('terrain')
+        )
+        if num_trees and not layouts:
+            TreeManager(
+                self.assets, self.render, num_trees, terrain=self.terrain,
+                seed=self.terrain.seed, rng=self.rng, build_models=False
+            )
+        self.spatial = SpatialHash()
+        
+        self.coins = CoinManager(
+            self.assets, self.render, num_coins, terrain=self.terrain,
+            spatial=self.spatial, rng=self.rng, events=self.events, endless=endless,
+            layout=layouts.get('coins')
+        )
+        self.obstacles = ObstacleManager(
+            self.assets, self.render, num_obstacles, terrain=self.terrain,
+            spatial=self.spatial, rng=self.rng, events=self.events, layout=layouts.get('crabs')
+        )
+        if layouts:
+            unpack_rng_state(self.rng, layouts['rng'])
+        self.player = Player(self.assets, self.render, terrain=self.terrain)
+        
+        self.frame = 0
+        self.time = 0.0
+        self.is_alive = True
+        self.deaths = 0
+        self.start_state = self.snapshot()
+    
+    def step(self, keys):
+        """Advance one fixed timestep with the given key states"""
+        if not self.is_alive:
+            return
+        
+        self.player.update(keys, self.dt)
+        player_pos = self.player.get_position()
+        previous_pos = self.player.previous_position
+        self.coins.update(player_pos, self.dt, previous_pos)
+        self.obstacles.update(player_pos, self.dt, previous_pos)
+        
+        self.frame += 1
+        self.time += self.dt
+    
+    def _on_player_hit(self, event):
+        """A crab caught the player"""
+        if self.is_alive:
+            self.is_alive = False
+            self.deaths += 1
+            self.events.publish(PlayerDied("crab", self.coins.get_collected_count()))
+    
+    def restart(self):
+        """Start the session over from the initial state, like pressing R in the game"""
+        self.is_alive = True
+        self.restore(self.start_state)
+        self.events.publish(GameRestarted())
+    
+    def snapshot(self):
+        """Copy of the game state (not the run counters), for restore"""
+        return {
+            'player': self.player.snapshot(),
+            'coins': self.coins.snapshot(),
+            'obstacles': self.obstacles.snapshot(),
+            'rng': self.rng.getstate(),
+        }
+    
+    def restore(self, state):
+        """Return to a snapshot in place"""
+        self.player.restore(state['player'])
+        self.coins.restore(state['coins'])
+        self.obstacles.restore(state['obstacles'])
+        self.rng.setstate(state['rng'])
+    
+    def run(self, frames, policy=None):
+        """Step frames times, restarting after each death; returns timings"""
+        if policy is None:
+            policy = RandomPolicy(self.seed)
+        
+        start = time.perf_counter()
+        for _ in range(frames):
+            if not self.is_alive:
+                self.restart()
+            self.step(policy(self))
+        elapsed = time.perf_counter() - start
+        
+        return {
+            'frames': frames,
+            'seconds': elapsed,
+            'fps': frames / elapsed if elapsed > 0 else float('inf'),
+        }
+    
+    def get_state(self):
+        """Summary of the game state, equal between identical runs"""
+        pos = self.player.get_position()
+        return {
+            'frame': self.frame,
+            'position': (round(pos.x, 4), round(pos.y, 4), round(pos.z, 4)),
+            'heading': round(self.player.get_heading(), 4),
+            'coins': self.coins.get_collected_count(),
+            'deaths': self.deaths,
+        }
+
+class RandomPolicy:
+    """Wander: hold a random key combination for a random number of frames"""
+    
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.keys = dict.fromkeys(KEYS, False)
+        self.frames_left = 0
+    
+    def __call__(self, simulation):
+        if self.frames_left <= 0:
+            self.frames_left = self.rng.randint(10, 90)
+            self.keys = {key: self.rng.random() < 0.4 for key in KEYS}
+            self.keys['forward'] = self.keys['forward'] or not self.keys['backward']
+        self.frames_left -= 1
+        return self.keys
@@ -0,0 +1,157 @@
+"""
+Uniform grid spatial index for proximity queries
+"""
+import math
+import numpy as np
+
+# Swept queries with at least this many candidates are tested with NumPy
+BATCH_THRESHOLD = 64
+
+class SpatialHash:
+    """Buckets items into square cells so radius queries only look nearby.
+    
+    Items live in named layers (e.g. 'coins', 'crabs') so several managers
+    can share one index without seeing each other's entries.
+    """
+    
+    def __init__(self, cell_size=8.0):
+        self.cell_size = cell_size
+        self.cells = {}      # (layer, cx, cy) -> set of items
+        self.positions = {}  # (layer, item) -> (x, y)
+    
+    def _cell(self, x, y):
+        """Cell coordinates containing a position"""
+        return int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size))
+    
+    def insert(self, layer, item, x, y):
+        """Add an item at a position"""
+        cx, cy = self._cell(x, y)
+        self.cells.setdefault((layer, cx, cy), set()).add(item)
+        self.positions[(layer, item)] = (x, y)
+    
+    def remove(self, layer, item):
+        """Remove an item (no-op if it isn't indexed)"""
+        pos = self.positions.pop((layer, item), None)
+        if pos is None:
+            return
+        key = (layer,) + self._cell(*pos)
+        bucket = self.cells[key]
+        bucket.discard(item)
+        if not bucket:
+            del self.cells[key]
+    
+    def move(self, layer, item, x, y):
+        """Update an item's position, re-bucketing only when it changes cell"""
+        old = self.positions.get((layer, item))
+        if old is not None and self._cell(*old) == self._cell(x, y):
+            self.positions[(layer, item)] = (x, y)
+            return
+        self.remove(layer, item)
+        self.insert(layer, item, x, y)
+    
+    def query(self, layer, x, y, radius):
+        """Items in a layer within radius of (x, y)"""
+        found = []
+        r2 = radius * radius
+        cx0, cy0 = self._cell(x - radius, y - radius)
+        cx1, cy1 = self._cell(x + radius, y + radius)
+        
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                bucket = self.cells.get((layer, cx, cy))
+                if not bucket:
+                    continue
+                for item in bucket:
+                    ix, iy = self.positions[(layer, item)]
+                    dx = ix - x
+                    dy = iy - y
+                    if dx * dx + dy * dy < r2:
+                        found.append(item)
+        return found
+    
+    def query_segment(self, layer, x0, y0, x1, y1, radius):
+        """Items in a layer within radius of the segment (x0, y0)-(x1, y1).
+        
+        A swept version of query: anything the moving circle touched at any
+        point along the segment is found, however long the step was. Items
+        come back in the order the segment reaches them.
+        """
+        candidates = []
+        cx0, cy0 = self._cell(min(x0, x1) - radius, min(y0, y1) - radius)
+        cx1, cy1 = self._cell(max(x0, x1) + radius, max(y0, y1) + radius)
+        
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                bucket = self.cells.get((layer, cx, cy))
+                if bucket:
+                    candidates.extend(bucket)
+        if len(candidates) >= BATCH_THRESHOLD:
+            points = np.array([self.positions[(layer, item)] for item in candidates])
+            hit, t = segment_circle_hits(points, x0, y0, x1, y1, radius)
+            order = np.flatnonzero(hit)
+            order = order[np.argsort(t[order], kind='stable')]
+            return [candidates[i] for i in order]
+        
+        # A handful of candidates is cheaper to test one by one
+        dx = x1 - x0
+        dy = y1 - y0
+        length2 = dx * dx + dy * dy
+        r2 = radius * radius
+        found = []
+        for item in candidates:
+            ix, iy = self.positions[(layer, item)]
+            px = ix - x0
+            py = iy - y0
+            t = min(1.0, max(0.0, (px * dx + py * dy) / length2)) if length2 > 0 else 0.0
+            ex = px - t * dx
+            ey = py - t * dy
+            if ex * ex + ey * ey < r2:
+                found.append((t, item))
+        found.sort(key=lambda hit: hit[0])
+        return [item for _, item in found]
+    
+    def count(self, layer=None):
+        """Number of indexed items, optionally in one layer"""
+        if layer is None:
+            return len(self.positions)
+        return sum(1 for key in self.positions if key[0] == layer)
+
+def bucket_rows(points, cell_size):
+    """Row numbers of an (N, 2+) array of points grouped by cell: {(cx, cy): rows}.
+    
+    A one-shot NumPy build of the same cells a SpatialHash of that cell
+    size would use, for indexes rebuilt from scratch every time they're
+    needed. Rows within a cell stay in ascending order.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if not len(points):
+        return {}
+    cells = np.floor(points / cell_size).astype(np.int64)
+    order = np.lexsort((cells[:, 1], cells[:, 0]))
+    ordered = cells[order]
+    starts = np.flatnonzero(np.any(ordered[1:] != ordered[:-1], axis=1)) + 1
+    keys = map(tuple, ordered[np.concatenate(([0], starts))].tolist())
+    return dict(zip(keys, np.split(order, starts)))
+
+def segment_circle_hits(points, x0, y0, x1, y1, radius):
+    """Test many points at once against a segment swept by a circle.
+    
+    Returns a mask of points closer than radius to the segment, and for
+    every point the fraction t (0 to 1) along the segment of its closest
+    approach.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    dx = x1 - x0
+    dy = y1 - y0
+    length2 = dx * dx + dy * dy
+    
+    px = points[:, 0] - x0
+    py = points[:, 1] - y0
+    if length2 > 0:
+        t = np.clip((px * dx + py * dy) / length2, 0.0, 1.0)
+    else:
+        t = np.zeros(len(points))
+    
+    ex = px - t * dx
+    ey = py - t * dy
+    return ex * ex + ey * ey < radius * radius, t
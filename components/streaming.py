@@ -0,0 +1,167 @@
+"""
+World streaming: build chunks around the player on worker threads
+"""
+from concurrent.futures import ThreadPoolExecutor
+import math
+import numpy as np
+from components.events import ChunkLoaded, ChunkUnloaded, EventBus
+
+class WorldStreamer:
+    """Keep the chunks near the player loaded and drop the far ones.
+    
+    Chunk data (terrain vertices, tree placement) is pure NumPy and is built
+    on a thread pool. Only turning that data into scene graph nodes happens in
+    the main loop, and at most attach_budget chunks are attached per frame so
+    a burst of finished chunks can't cause a hitch.
+    
+    Coins and crabs are fixed pools rather than chunk data: recycle() moves
+    the ones left in dropped chunks back around the player, so the loaded
+    chunks stay populated however far the player goes.
+    """
+    
+    def __init__(self, terrain, trees=None, radius=4, attach_budget=2, workers=2, events=None,
+                 coins=None, obstacles=None):
+        self.terrain = terrain
+        self.trees = trees
+        self.coins = coins
+        self.obstacles = obstacles
+        self.radius = radius
+        self.attach_budget = attach_budget
+        self.events = events if events is not None else EventBus()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chunk")
+        
+        self.loaded = set()
+        self.pending = {}  # chunk key -> Future
+        self.center = None
+        
+        # Counters
+        self.chunks_built = 0
+        self.chunks_evicted = 0
+        self.entities_recycled = 0
+    
+    def _wanted(self, center):
+        """Chunk keys within the view radius, nearest first"""
+        cx, cy = center
+        r = self.radius
+        keys = []
+        for dx in range(-r, r + 1):
+            for dy in range(-r, r + 1):
+                if dx * dx + dy * dy <= r * r:
+                    keys.append((dx * dx + dy * dy, (cx + dx, cy + dy)))
+        keys.sort()
+        return [key for _, key in keys]
+    
+    def _build_chunk(self, key):
+        """Generate all data for one chunk (runs on a worker thread)"""
+        tx, ty = key
+        size = self.terrain.tile_size
+        data = {'terrain': self.terrain.build_chunk_vertices(tx, ty)}
+        if self.trees is not None:
+            data['trees'] = self.trees.plan_chunk(tx, ty, tx * size, ty * size, size)
+        return data
+    
+    def _attach(self, key, data):
+        """Put a finished chunk into the scene (main thread)"""
+        self.terrain.attach_chunk(key, data['terrain'])
+        if self.trees is not None:
+            self.trees.attach_chunk(key, data['trees'])
+        self.loaded.add(key)
+        self.chunks_built += 1
+        self.events.publish(ChunkLoaded(key))
+    
+    def _evict(self, key):
+        """Remove a chunk and release its memory"""
+        self.terrain.detach_chunk(key)
+        if self.trees is not None:
+            self.trees.detach_chunk(key)
+        self.loaded.discard(key)
+        self.chunks_evicted += 1
+        self.events.publish(ChunkUnloaded(key))
+    
+    def update(self, player_pos):
+        """Request, attach and evict chunks around the player"""
+        center = self.terrain.chunk_key(player_pos.x, player_pos.y)
+        if center != self.center:
+            self.center = center
+            wanted = self._wanted(center)
+            wanted_set = set(wanted)
+            
+            # Queue missing chunks, nearest first
+            for key in wanted:
+                if key not in self.loaded and key not in self.pending:
+                    self.pending[key] = self.executor.submit(self._build_chunk, key)
+            
+            # Forget queued work that is no longer needed
+            for key in list(self.pending):
+                if key not in wanted_set and self.pending[key].cancel():
+                    del self.pending[key]
+            
+            # Evict with one chunk of slack so walking along a border doesn't thrash
+            for key in list(self.loaded):
+                if self._chunk_distance(key) > self.radius + 1:
+                    self._evict(key)
+        
+        self._attach_ready(self.attach_budget)
+    
+    def recycle(self, player_pos):
+        """Respawn coins and crabs whose chunks are out of range near the player.
+        
+        Decided from the player's position alone rather than from what has
+        been built so far, so it can run in the fixed tick and a replay
+        recycles exactly as the recording did.
+        """
+        center = self.terrain.chunk_key(player_pos.x, player_pos.y)
+        if self.coins is not None:
+            far = self._out_of_range(self.coins.positions[:self.coins.active_count], center)
+            self.coins.relocate(far, player_pos)
+            self.entities_recycled += len(far)
+        if self.obstacles is not None:
+            far = self._out_of_range(self.obstacles.positions, center)
+            self.obstacles.relocate(far, player_pos)
+            self.entities_recycled += len(far)
+    
+    def _out_of_range(self, positions, center):
+        """Indices of the positions in chunks that would be evicted around center"""
+        keys = np.floor(positions[:, :2] / self.terrain.tile_size)
+        distance = np.hypot(keys[:, 0] - center[0], keys[:, 1] - center[1])
+        return np.flatnonzero(distance > self.radius + 1).tolist()
+    
+    def _chunk_distance(self, key):
+        """Distance in chunks from the current center"""
+        return math.hypot(key[0] - self.center[0], key[1] - self.center[1])
+    
+    def _attach_ready(self, budget):
+        """Attach up to budget finished chunks, nearest first"""
+        ready = [key for key, future in self.pending.items() if future.done()]
+        ready.sort(key=self._chunk_distance)
+        
+        for key in ready[:budget]:
+            future = self.pending.pop(key)
+            data = future.result()
+            
+            # The player may have walked away while it was building
+            if self._chunk_distance(key) > self.radius + 1:
+                continue
+            self._attach(key, data)
+    
+    def prime(self, player_pos):
+        """Block until every chunk around the player is loaded"""
+        self.update(player_pos)
+        while self.pending:
+            for future in list(self.pending.values()):
+                future.result()
+            self._attach_ready(len(self.pending))
+    
+    def get_stats(self):
+        """Streaming counters"""
+        return {
+            'loaded': len(self.loaded),
+            'pending': len(self.pending),
+            'built': self.chunks_built,
+            'evicted': self.chunks_evicted,
+            'recycled': self.entities_recycled,
+        }
+    
+    def shutdown(self):
+        """Stop the worker threads"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -2,104 +2,178 @@
 Terrain generation component with varied landscape
 """
 import random
-from panda3d.core import Vec3
+import numpy as np
+from components.batching import flatten_static
+from components.heightfield import HeightField, ChunkMeshBuilder
+
+# Side of the fixed world with Terrain's default 5 tiles of 40 m
+DEFAULT_SIZE = 200
+
+GRASS_COLOR = np.array([0.2, 0.55, 0.2])
+PATH_COLOR = np.array([0.6, 0.5, 0.3])
+
+FLOWER_COLORS = np.array([
+    (1, 0.3, 0.3, 1),  # Red
+    (1, 1, 0.3, 1),    # Yellow
+    (0.8, 0.3, 1, 1),  # Purple
+    (1, 0.6, 0.8, 1),  # Pink
+])
+
+def world_bounds(terrain, margin):
+    """(low, high) for x and y, margin metres in from the edges of the terrain.
+    
+    Without a terrain the world is taken to be the default size.
+    """
+    size = DEFAULT_SIZE if terrain is None else terrain.size
+    return (margin, size - margin)
+
+def plan_vegetation(rng, size, height_at, count=40):
+    """Pick flower patch spots, sizes and colours across a world size metres wide"""
+    positions = np.zeros((count, 3))
+    scales = np.zeros(count)
+    colors = np.zeros(count, dtype=np.uint8)
+    for i in range(count):
+        scales[i] = rng.uniform(0.3, 0.8)
+        x = rng.uniform(10, size - 10)
+        y = rng.uniform(10, size - 10)
+        positions[i] = (x, y, height_at(x, y) + 0.3)
+        colors[i] = rng.randrange(len(FLOWER_COLORS))
+    return {'flower_positions': positions, 'flower_scales': scales, 'flower_colors': colors}
 
 class Terrain:
-    def __init__(self, loader, render):
+    def __init__(self, loader, render, num_tiles=5, tile_size=40, cell_size=1.25,
+                 seed=None, lod_distances=(120, 300, 700, 1400), batch=True, streaming=False,
+                 rng=None, layout=None, view_distance=None):
         self.loader = loader
         self.render = render
+        self.num_tiles = num_tiles
+        self.tile_size = tile_size
+        self.cell_size = cell_size
+        self.size = num_tiles * tile_size
+        self.batch = batch
+        self.streaming = streaming
+        self.rng = rng if rng is not None else random.Random(seed)  # Seeded for repeatable runs
         self.terrain_node = render.attachNewNode("terrain")
-        self._create_terrain()
+        self.chunk_node = self.terrain_node.attachNewNode("chunks")
+        self.chunks = {}
+        self.batch_stats = None
+        self.layout = layout  # Generated arrays (heights, colours, flowers); see get_layout
+        
+        if seed is None:
+            seed = self.rng.randrange(2 ** 31)
+        self.seed = seed
+        self.heightfield = HeightField(seed, cell_size)
+        self.mesh_builder = ChunkMeshBuilder(
+            int(round(tile_size / cell_size)), cell_size, lod_distances,
+            view_distance=view_distance
+        )
+        if layout is not None:
+            # A saved world knows its own size
+            self.num_tiles = (len(layout['heights']) - 1) // self.mesh_builder.chunk_cells
+            self.size = self.num_tiles * tile_size
+        
+        # When streaming, chunks come and go around the player instead
+        if not streaming:
+            self._create_terrain()
     
     def _create_terrain(self):
         """Generate beautiful varied terrain"""
-        tile_size = 10
-        num_tiles = 20
-        
-        # Create ground with color variation
-        for x in range(num_tiles):
-            for y in range(num_tiles):
-                tile = self.loader.loadModel("models/box")
-                tile.setScale(tile_size, tile_size, 0.3)
-                
-                # Varied height for natural look
-                height = random.uniform(-0.3, 0.5)
-                
-                # Use Perlin-like noise for more natural variation
-                noise = (x % 3) * 0.2 + (y % 3) * 0.2
-                height += noise
-                
-                tile.setPos(x * tile_size, y * tile_size, height)
-                
-                # Rich grass colors with variation
-                r = random.uniform(0.15, 0.25)
-                g = random.uniform(0.45, 0.65)
-                b = random.uniform(0.15, 0.25)
-                tile.setColor(r, g, b, 1)
-                tile.reparentTo(self.terrain_node)
-        
-        # Add rolling hills for depth
-        self._create_hills()
+        # Sample the whole world once; chunks and height queries share it
+        if self.layout is None:
+            heights = self.heightfield.bake(self.size)
+            self.layout = {'heights': heights, 'colors': self.ground_colors(0, 0, heights)}
+            self.layout.update(plan_vegetation(self.rng, self.size, self.height_at))
+        self.heights = self.heightfield.use_grid(self.layout['heights'])
+        self.colors = self.layout['colors']
         
-        # Add paths/trails
-        self._create_paths()
+        # Ground chunks, each one LOD-switched on camera distance
+        for tx in range(self.num_tiles):
+            for ty in range(self.num_tiles):
+                self.attach_chunk((tx, ty), self.build_chunk_vertices(tx, ty))
         
         # Add flowers/grass patches
+        self.decoration_node = self.terrain_node.attachNewNode("decoration")
         self._create_vegetation_patches()
+        
+        # Decoration never moves, so merge it into a few big geoms
+        if self.batch:
+            self.batch_stats = flatten_static(self.decoration_node, "terrain decoration")
+    
+    def chunk_key(self, x, y):
+        """Tile coordinates containing a world position"""
+        return (int(x // self.tile_size), int(y // self.tile_size))
+    
+    def build_chunk_vertices(self, tx, ty):
+        """Vertex array for one tile (pure NumPy, safe on a worker thread)"""
+        cells = self.mesh_builder.chunk_cells
+        x0 = tx * self.tile_size
+        y0 = ty * self.tile_size
+        
+        if self.streaming:
+            heights = self.heightfield.sample_grid(x0, y0, cells, self.cell_size)
+            colors = self.ground_colors(x0, y0, heights)
+        else:
+            i0 = tx * cells
+            j0 = ty * cells
+            heights = self.heights[j0:j0 + cells + 1, i0:i0 + cells + 1]
+            colors = self.colors[j0:j0 + cells + 1, i0:i0 + cells + 1]
+        
+        return self.mesh_builder.build_vertices(heights, colors, x0, y0)
     
-    def _create_hills(self):
-        """Create rolling hills"""
-        for i in range(12):
-            hill = self.loader.loadModel("models/misc/sphere")
-            scale = random.uniform(6, 18)
-            hill.setScale(scale, scale, scale * 0.4)
-            
-            x = random.uniform(15, 185)
-            y = random.uniform(15, 185)
-            hill.setPos(x, y, -scale * 0.3)
-            
-            # Grass color for hills
-            r = random.uniform(0.2, 0.3)
-            g = random.uniform(0.5, 0.7)
-            b = random.uniform(0.2, 0.3)
-            hill.setColor(r, g, b, 1)
-            hill.reparentTo(self.terrain_node)
+    def attach_chunk(self, key, vertices):
+        """Turn a built vertex array into an LOD mesh in the scene"""
+        tx, ty = key
+        chunk = self.mesh_builder.make_chunk_node(f"chunk_{tx}_{ty}", vertices)
+        chunk.reparentTo(self.chunk_node)
+        self.chunks[key] = chunk
+        return chunk
     
-    def _create_paths(self):
-        """Create dirt paths across terrain"""
-        # Horizontal path
-        for i in range(20):
-            path = self.loader.loadModel("models/box")
-            path.setScale(10, 4, 0.1)
-            path.setPos(i * 10, 100, 0.6)
-            path.setColor(0.6, 0.5, 0.3, 1)  # Dirt brown
-            path.reparentTo(self.terrain_node)
+    def detach_chunk(self, key):
+        """Drop a tile's mesh and its vertex data"""
+        chunk = self.chunks.pop(key, None)
+        if chunk is not None:
+            chunk.removeNode()
+    
+    def ground_colors(self, x0, y0, heights):
+        """Vertex colours for a chunk: grass with variation and dirt paths"""
+        cells = heights.shape[0] - 1
+        coords = np.arange(cells + 1) * self.cell_size
+        xs, ys = np.meshgrid(x0 + coords, y0 + coords)
+        
+        # Deterministic per-vertex jitter, lighter grass higher up
+        jitter = np.sin(xs * 12.9898 + ys * 78.233) * 43758.5453
+        jitter = (jitter - np.floor(jitter) - 0.5) * 0.1
+        shade = 1.0 + (heights - self.heightfield.base_height) / self.heightfield.amplitude * 0.15
+        rgb = GRASS_COLOR[None, None, :] * shade[..., None]
+        rgb[..., 1] += jitter
+        
+        # Dirt paths crossing the middle of the world
+        middle = self.size / 2
+        on_path = (np.abs(xs - middle) < 2) | (np.abs(ys - middle) < 2)
+        rgb[on_path] = PATH_COLOR
         
-        # Vertical path
-        for i in range(20):
-            path = self.loader.loadModel("models/box")
-            path.setScale(4, 10, 0.1)
-            path.setPos(100, i * 10, 0.6)
-            path.setColor(0.6, 0.5, 0.3, 1)
-            path.reparentTo(self.terrain_node)
+        colors = np.empty(heights.shape + (4,), dtype=np.uint8)
+        colors[..., :3] = np.clip(rgb * 255, 0, 255)
+        colors[..., 3] = 255
+        return colors
+    
+    def height_at(self, x, y):
+        """Ground height at a world position"""
+        return self.heightfield.height_at(x, y)
+    
+    def get_layout(self):
+        """Everything generated for a fixed world, as arrays (None when streaming)"""
+        return self.layout
     
     def _create_vegetation_patches(self):
         """Add small vegetation details"""
-        for i in range(40):
+        layout = self.layout
+        for pos, scale, color in zip(
+            layout['flower_positions'], layout['flower_scales'], layout['flower_colors']
+        ):
             # Flower patches
             patch = self.loader.loadModel("models/misc/sphere")
-            patch.setScale(random.uniform(0.3, 0.8))
-            
-            x = random.uniform(10, 190)
-            y = random.uniform(10, 190)
-            patch.setPos(x, y, 1.5)
-            
-            # Random flower colors
-            colors = [
-                (1, 0.3, 0.3, 1),  # Red
-                (1, 1, 0.3, 1),    # Yellow
-                (0.8, 0.3, 1, 1),  # Purple
-                (1, 0.6, 0.8, 1),  # Pink
-            ]
-            patch.setColor(random.choice(colors))
-            patch.reparentTo(self.terrain_node)
+            patch.setScale(float(scale))
+            patch.setPos(*pos)
+            patch.setColor(*FLOWER_COLORS[color])
+            patch.reparentTo(self.decoration_node)
@@ -2,69 +2,398 @@
 Tree generation component with realistic trees
 """
 import random
+import numpy as np
+from panda3d.core import NodePath
+from components.instancing import InstancedBatch
+from components.batching import batch_stats, build_prototype, count_triangles, flatten_static
+from components.culling import CellGrid, view_frustum
+from components.lod import bake_impostor, make_impostor_card, make_sphere
+from components.terrain import world_bounds
+
+TREE_TYPES = ['pine', 'oak', 'birch']
+
+# Detail levels from near to far, and where each one ends by default
+TREE_DETAILS = ['full', 'low', 'impostor']
+LOD_DISTANCES = (60.0, 150.0)
+
+# Trees in the game's default world; headless runs plant as many to match it
+NUM_TREES = 40
+
+# Closest a tree grows to the world's edge
+EDGE_MARGIN = 10
+
+def instance_variety(positions, types, rng):
+    """Per-tree heading, scale and tint, on top of the part colours of the type's template"""
+    count = len(positions)
+    colors = np.ones((count, 4), dtype=np.float32)
+    colors[:, 1] = [rng.uniform(0.85, 1.15) for _ in range(count)]
+    return {
+        'positions': positions,
+        'types': types,
+        'headings': np.array([rng.uniform(0, 360) for _ in range(count)]),
+        'scales': np.array([rng.uniform(0.85, 1.15) for _ in range(count)]),
+        'colors': colors,
+    }
+
+def plan_forest(rng, num_trees, area, height_at):
+    """Choose every tree's spot in area (low, high), its type and variety"""
+    trees = []
+    types = []
+    for i in range(num_trees):
+        x = rng.uniform(*area)
+        y = rng.uniform(*area)
+        
+        # Don't spawn near center (player start)
+        if abs(x - 50) < 15 and abs(y - 50) < 15:
+            continue
+        
+        # Random tree type
+        types.append(rng.randrange(len(TREE_TYPES)))
+        trees.append((x, y, height_at(x, y)))
+    
+    positions = np.array(trees, dtype=np.float32).reshape(-1, 3)
+    plan = instance_variety(positions, np.array(types, dtype=np.uint8), rng)
+    plan['colors'] = plan['colors'].astype(np.float32)
+    return plan
 
 class TreeManager:
-    def __init__(self, loader, render):
+    def __init__(self, loader, render, num_trees=NUM_TREES, instanced=False, terrain=None,
+                 streaming=False, seed=None, rng=None, layout=None, cell_size=40.0,
+                 view_distance=None, build_models=True, lod_distances=LOD_DISTANCES, window=None):
         self.loader = loader
         self.render = render
+        self.terrain = terrain
+        self.num_trees = num_trees
+        self.instanced = instanced
+        self.streaming = streaming
         self.trees = []
-        self._create_forest()
+        self.tree_types = []
+        self.batches = {}
+        self.templates = {}
+        self.template_triangles = {}
+        self.forest_node = render.attachNewNode("forest")
+        self.view_distance = view_distance
+        self.rng = rng if rng is not None else random.Random(seed)  # Seeded for repeatable runs
+        self.layout = layout  # Generated tree plan; see get_layout
+        
+        # Streamed forests are planted per chunk at the static forest's density
+        if seed is None:
+            seed = self.rng.randrange(2 ** 31)
+        self.seed = seed
+        
+        # Part colour jitter in the templates has its own generator, so trees
+        # look the same whether their layout was just generated or loaded
+        self.part_rng = random.Random(seed)
+        self.area = world_bounds(terrain, EDGE_MARGIN)  # Where a fixed forest is planted
+        low, high = self.area
+        self.density = num_trees / float((high - low) ** 2)
+        self.chunk_trees = {}
+        self.build_models = build_models  # Off to only plan the forest, e.g. headless
+        
+        # Full trees up to lod_distances[0], low-poly ones up to lod_distances[1],
+        # then impostors baked through window. Without a window (or lod
+        # distances) the last level there is goes on to the view distance.
+        self.details = TREE_DETAILS[:1 + len(lod_distances or ())]
+        self.low_sphere = make_sphere("low_sphere")
+        self.impostors = {}  # tree type -> (texture, bounds) baked from its template
+        if 'impostor' in self.details and build_models and window is not None:
+            self.impostors = self._bake_impostors(window)
+        if not self.impostors and 'impostor' in self.details:
+            self.details.remove('impostor')
+        self.lod_distances = tuple(lod_distances or ())[:len(self.details) - 1]
+        
+        # Trees are grouped by cell so whole cells are culled at once; a
+        # streamed forest's cells are its chunks, so cell_size must match them.
+        # Each cell has a node per detail level, switched on its distance.
+        self.grid = CellGrid(self.forest_node, cell_size, view_distance, "tree_cells", self.lod_distances)
+        self.cell_triangles = {}  # (cell key, level) -> triangles drawn
+        
+        # A fixed instanced forest switches detail per tree instead (see update)
+        self.type_plans = {}
+        self.levels = {}
+        
+        if not streaming:
+            self._create_forest()
     
     def _create_forest(self):
         """Generate a forest of varied trees"""
-        num_trees = 40
+        if self.layout is None:
+            self.layout = plan_forest(self.rng, self.num_trees, self.area, self._ground_z)
+        plan = dict(self.layout)
+        plan['types'] = np.array(TREE_TYPES)[plan['types']]
+        self.trees = [(float(x), float(y)) for x, y, _ in plan['positions']]
+        self.tree_types = list(plan['types'])
+        if not self.build_models:
+            return
         
-        for i in range(num_trees):
-            x = random.uniform(10, 190)
-            y = random.uniform(10, 190)
+        if self.instanced:
+            # A handful of world-wide draw calls beats one per type per cell;
+            # every tree starts at full detail until update() sorts them
+            for tree_type in TREE_TYPES:
+                mask = plan['types'] == tree_type
+                if mask.any():
+                    self.type_plans[tree_type] = {name: values[mask] for name, values in plan.items()}
+                    self.levels[tree_type] = np.zeros(int(mask.sum()), dtype=np.int64)
+            self.batches = {
+                detail: self._attach_batches(
+                    self.forest_node, plan, f"trees_{detail}", detail, empty=detail != 'full'
+                )
+                for detail in self.details
+            }
+        else:
+            self._place_trees(plan, lambda x, y: self.grid.key(x, y))
             
-            # Don't spawn near center (player start)
-            if abs(x - 50) < 15 and abs(y - 50) < 15:
+            # Trees never move, so each cell becomes a few merged geoms
+            flatten_static(self.forest_node, "forest", groups=self.grid.get_contents())
+            for key in self.grid.cells:
+                self._count_cell(key)
+    
+    def get_layout(self):
+        """The generated forest as arrays (None when streaming)"""
+        return self.layout
+    
+    def _ground_z(self, x, y):
+        """Height of the ground under a tree"""
+        if self.terrain is None:
+            return 0.0
+        return self.terrain.height_at(x, y)
+    
+    def _build_tree(self, tree_type, x, y, parent, z=0.0, detail='full'):
+        """Build one tree of the given type out of separate models"""
+        # Lift the whole tree onto the ground
+        tree_np = parent.attachNewNode(f"{tree_type}_tree")
+        tree_np.setZ(z)
+        
+        if tree_type == 'pine':
+            self._create_pine_tree(x, y, tree_np, detail)
+        elif tree_type == 'oak':
+            self._create_oak_tree(x, y, tree_np, detail)
+        else:
+            self._create_birch_tree(x, y, tree_np, detail)
+    
+    def _place_trees(self, plan, cell_key):
+        """Copy each planned tree's templates into every detail level of its cell.
+        
+        Trees get the plan's heading, scale and tint just as instances do, so
+        a forest looks the same whether it is instanced or flattened.
+        """
+        variety = zip(plan['positions'], plan['types'], plan['headings'], plan['scales'], plan['colors'])
+        for (x, y, z), tree_type, heading, scale, color in variety:
+            key = cell_key(x, y)
+            for level, detail in enumerate(self.details):
+                tree = self._get_template(tree_type, detail).copyTo(self.grid.cell(key, level))
+                tree.setPosHprScale(x, y, z, heading, 0, 0, scale, scale, scale)
+                tree.setColorScale(*color)
+    
+    def _load_sphere(self, detail):
+        """A foliage sphere to scale and place"""
+        if detail == 'full':
+            return self.loader.loadModel("models/misc/sphere")
+        # A copy, since flattening bakes the part's transform into it
+        sphere = NodePath("low_sphere")
+        self.low_sphere.copyTo(sphere)
+        return sphere
+    
+    def _get_template(self, tree_type, detail='full'):
+        """Tree of one type at the origin at one detail level, built once.
+        
+        Full and low-poly templates are flattened prototypes with the same
+        part colours. The impostor is a card with the baked texture: upright
+        for the instanced renderer to turn towards the camera, crossed for
+        cells that are flattened and never turn.
+        """
+        if (tree_type, detail) not in self.templates:
+            if detail == 'impostor':
+                texture, (low, high) = self.impostors[tree_type]
+                built = {detail: make_impostor_card(
+                    f"{tree_type}_impostor", texture, low, high, crossed=not self.instanced
+                )}
+            else:
+                state = self.part_rng.getstate()
+                built = {}
+                for each, name in (('full', f"{tree_type}_template"), ('low', f"{tree_type}_low_template")):
+                    self.part_rng.setstate(state)
+                    built[each] = build_prototype(
+                        name, lambda parent: self._build_tree(tree_type, 0, 0, parent, detail=each)
+                    )
+            for each, template in built.items():
+                self.templates[tree_type, each] = template
+                self.template_triangles[tree_type, each] = count_triangles(template)
+        return self.templates[tree_type, detail]
+    
+    def _bake_impostors(self, window):
+        """Each tree type's impostor texture, or {} if they can't be baked"""
+        # Baking mustn't change the part colours of the trees built after it
+        state = self.part_rng.getstate()
+        impostors = {}
+        for tree_type in TREE_TYPES:
+            baked = bake_impostor(window, self._get_template(tree_type))
+            if baked is None:
+                impostors = {}
+                break
+            impostors[tree_type] = baked
+        self.part_rng.setstate(state)
+        return impostors
+    
+    def _attach_batches(self, parent, plan, name, detail='full', empty=False):
+        """One instanced batch per tree type present in the plan.
+        
+        empty leaves room for the type's trees without drawing any yet.
+        """
+        shader = 'impostor' if detail == 'impostor' else 'instanced'
+        batches = {}
+        for tree_type in TREE_TYPES:
+            mask = plan['types'] == tree_type
+            count = int(mask.sum())
+            if count == 0:
                 continue
             
-            # Random tree type
-            tree_type = random.choice(['pine', 'oak', 'birch'])
+            batch = InstancedBatch(
+                self._get_template(tree_type, detail), parent, count, f"{tree_type}_{name}", shader=shader
+            )
+            if not empty:
+                batch.set_instances(
+                    plan['positions'][mask], plan['headings'][mask],
+                    plan['scales'][mask], plan['colors'][mask]
+                )
+            batches[tree_type] = batch
+        return batches
+    
+    def update(self, camera_pos):
+        """Give each tree of a fixed instanced forest the detail its distance from camera_pos picks.
+        
+        Cells switch levels by themselves, so every other kind of forest has
+        nothing to do here. A type's instance buffers are only rewritten
+        when one of its trees changes level; trees past the view distance
+        are left out.
+        """
+        if not self.type_plans or (len(self.details) == 1 and self.view_distance is None):
+            return
+        
+        edges = list(self.lod_distances)
+        if self.view_distance is not None:
+            edges.append(self.view_distance)
+        eye = np.array([camera_pos[0], camera_pos[1], camera_pos[2]], dtype=np.float32)
+        for tree_type, plan in self.type_plans.items():
+            distances = np.linalg.norm(plan['positions'] - eye, axis=1)
+            levels = np.searchsorted(edges, distances, side='right')
+            if np.array_equal(levels, self.levels[tree_type]):
+                continue
             
-            if tree_type == 'pine':
-                self._create_pine_tree(x, y)
-            elif tree_type == 'oak':
-                self._create_oak_tree(x, y)
+            self.levels[tree_type] = levels
+            for level, detail in enumerate(self.details):
+                mask = levels == level
+                self.batches[detail][tree_type].set_instances(
+                    plan['positions'][mask], plan['headings'][mask],
+                    plan['scales'][mask], plan['colors'][mask]
+                )
+    
+    def get_triangle_count(self, camera):
+        """Triangles submitted to draw the forest through camera, per detail level.
+        
+        camera is a NodePath with a Camera node. A batch or cell outside
+        its view isn't drawn, so doesn't count; one in view counts in full.
+        """
+        counts = dict.fromkeys(self.details, 0)
+        if self.type_plans:
+            frustum = view_frustum(camera, self.forest_node)
+            for detail, batches in self.batches.items():
+                for tree_type, batch in batches.items():
+                    if batch.count and frustum.contains(batch.node.getBounds()):
+                        counts[detail] += batch.count * self.template_triangles[tree_type, detail]
+        else:
+            for key, level, _ in self.grid.drawn_contents(camera):
+                counts[self.details[level]] += self.cell_triangles.get((key, level), 0)
+        return counts
+    
+    def _count_cell(self, key, plan=None):
+        """Remember the triangles each level of a cell draws (for instanced cells, given their plan)"""
+        for level, detail in enumerate(self.details):
+            if self.instanced:
+                types, counts = np.unique(plan['types'], return_counts=True)
+                triangles = sum(
+                    int(count) * self.template_triangles[tree_type, detail]
+                    for tree_type, count in zip(types, counts)
+                )
             else:
-                self._create_birch_tree(x, y)
-            
-            self.trees.append((x, y))
+                triangles = count_triangles(self.grid.cell(key, level))
+            self.cell_triangles[key, level] = triangles
+    
+    def plan_chunk(self, tx, ty, x0, y0, size):
+        """Choose the trees for one streamed chunk (pure data, worker-thread safe)"""
+        # Seeded per chunk so a chunk always regrows the same trees
+        rng = np.random.default_rng([self.seed, tx + 2 ** 31, ty + 2 ** 31])
+        count = rng.poisson(self.density * size * size)
+        xs = x0 + rng.uniform(0, size, count)
+        ys = y0 + rng.uniform(0, size, count)
+        
+        # Don't spawn near center (player start)
+        keep = ~((np.abs(xs - 50) < 15) & (np.abs(ys - 50) < 15))
+        xs, ys = xs[keep], ys[keep]
+        
+        positions = np.zeros((len(xs), 3), dtype=np.float32)
+        positions[:, 0] = xs
+        positions[:, 1] = ys
+        if self.terrain is not None and len(xs):
+            positions[:, 2] = self.terrain.heightfield.sample(xs, ys)
+        
+        types = np.array(TREE_TYPES)[rng.integers(0, len(TREE_TYPES), len(xs))]
+        return instance_variety(positions, types, rng)
+    
+    def attach_chunk(self, key, plan):
+        """Put a planned chunk of trees into the scene"""
+        tx, ty = key
+        if self.instanced:
+            for level, detail in enumerate(self.details):
+                self._attach_batches(self.grid.cell(key, level), plan, f"trees_{tx}_{ty}_{detail}", detail)
+        else:
+            self._place_trees(plan, lambda x, y: key)
+        self._count_cell(key, plan)
+        
+        self.chunk_trees[key] = [(float(x), float(y)) for x, y, _ in plan['positions']]
+    
+    def detach_chunk(self, key):
+        """Remove a chunk's trees and free their buffers"""
+        self.grid.remove_cell(key)
+        self.chunk_trees.pop(key, None)
+        for level in range(len(self.details)):
+            self.cell_triangles.pop((key, level), None)
+    
+    def get_stats(self):
+        """Node and draw call counts for the whole forest"""
+        return batch_stats(self.forest_node)
     
-    def _create_pine_tree(self, x, y):
+    def _create_pine_tree(self, x, y, parent, detail='full'):
         """Create a pine/evergreen tree"""
         # Trunk
         trunk = self.loader.loadModel("models/box")
         trunk.setScale(0.6, 0.6, 6)
         trunk.setPos(x, y, 3)
         trunk.setColor(0.35, 0.25, 0.15, 1)  # Dark brown
-        trunk.reparentTo(self.render)
+        trunk.reparentTo(parent)
         
         # Pine foliage layers (triangular shape)
         layer_heights = [4, 6, 8, 10]
         layer_scales = [5, 4, 3, 2]
         
         for height, scale in zip(layer_heights, layer_scales):
-            layer = self.loader.loadModel("models/misc/sphere")
+            layer = self._load_sphere(detail)
             layer.setScale(scale, scale, scale * 1.2)
             layer.setPos(x, y, height)
             
             # Dark green for pine
-            g = random.uniform(0.3, 0.4)
+            g = self.part_rng.uniform(0.3, 0.4)
             layer.setColor(0.1, g, 0.15, 1)
-            layer.reparentTo(self.render)
+            layer.reparentTo(parent)
     
-    def _create_oak_tree(self, x, y):
+    def _create_oak_tree(self, x, y, parent, detail='full'):
         """Create a broad oak tree"""
         # Thick trunk
         trunk = self.loader.loadModel("models/box")
         trunk.setScale(0.9, 0.9, 5)
         trunk.setPos(x, y, 2.5)
         trunk.setColor(0.4, 0.3, 0.2, 1)  # Medium brown
-        trunk.reparentTo(self.render)
+        trunk.reparentTo(parent)
         
         # Broad canopy (multiple spheres)
         canopy_positions = [
@@ -76,48 +405,50 @@ class TreeManager:
         ]
         
         for dx, dy, dz in canopy_positions:
-            foliage = self.loader.loadModel("models/misc/sphere")
-            scale = random.uniform(2.5, 3.5)
+            foliage = self._load_sphere(detail)
+            scale = self.part_rng.uniform(2.5, 3.5)
             foliage.setScale(scale)
             foliage.setPos(x + dx, y + dy, dz)
             
             # Bright green for oak
-            g = random.uniform(0.5, 0.7)
+            g = self.part_rng.uniform(0.5, 0.7)
             foliage.setColor(0.15, g, 0.2, 1)
-            foliage.reparentTo(self.render)
+            foliage.reparentTo(parent)
     
-    def _create_birch_tree(self, x, y):
+    def _create_birch_tree(self, x, y, parent, detail='full'):
         """Create a tall birch tree"""
         # White/light trunk
         trunk = self.loader.loadModel("models/box")
         trunk.setScale(0.5, 0.5, 7)
         trunk.setPos(x, y, 3.5)
         trunk.setColor(0.9, 0.9, 0.85, 1)  # Light/white
-        trunk.reparentTo(self.render)
+        trunk.reparentTo(parent)
         
-        # Add dark stripes on trunk for birch look
-        for i in range(4):
+        # Add dark stripes on trunk for birch look (too small to see past full detail)
+        for i in range(4 if detail == 'full' else 0):
             stripe = self.loader.loadModel("models/box")
             stripe.setScale(0.55, 0.55, 0.4)
             stripe.setPos(x, y, 2 + i * 2)
             stripe.setColor(0.2, 0.2, 0.2, 1)
-            stripe.reparentTo(self.render)
+            stripe.reparentTo(parent)
         
         # Light, airy canopy at top
         for i in range(3):
-            foliage = self.loader.loadModel("models/misc/sphere")
-            scale = random.uniform(2, 3)
+            foliage = self._load_sphere(detail)
+            scale = self.part_rng.uniform(2, 3)
             foliage.setScale(scale)
             
-            dx = random.uniform(-1, 1)
-            dy = random.uniform(-1, 1)
+            dx = self.part_rng.uniform(-1, 1)
+            dy = self.part_rng.uniform(-1, 1)
             foliage.setPos(x + dx, y + dy, 8 + i * 1.5)
             
             # Light green/yellow-green for birch
-            g = random.uniform(0.65, 0.8)
+            g = self.part_rng.uniform(0.65, 0.8)
             foliage.setColor(0.4, g, 0.3, 1)
-            foliage.reparentTo(self.render)
+            foliage.reparentTo(parent)
     
     def get_tree_positions(self):
         """Return list of tree positions for collision detection"""
+        if self.streaming:
+            return [pos for trees in self.chunk_trees.values() for pos in trees]
         return self.trees
@@ -3,10 +3,46 @@ UI/HUD component for game interface
 """
 from direct.gui.DirectGui import OnscreenText
 from panda3d.core import TextNode
+from components.events import CoinCollected, CoinsReset, GameRestarted, PlayerDied
+import time
 
 class GameUI:
-    def __init__(self):
+    """Retained-mode HUD.
+    
+    The update_* methods can be called every frame: each one remembers the
+    values it last showed and only touches its OnscreenText (which
+    regenerates glyph geometry on every setText) when they change. The
+    position readout changes almost every frame while moving, so it can
+    also be limited to position_rate refreshes per second. Everything else
+    is driven by game events when an event bus is given.
+    """
+    
+    def __init__(self, position_rate=None, events=None):
+        self.position_rate = position_rate  # None refreshes on every change
+        self.shown = {'health': True}  # element -> values currently on screen
+        self.last_position_refresh = 0.0
+        self.rebuilds = 0  # Text rebuilds so far, for benchmarks
         self._create_ui()
+        
+        if events is not None:
+            events.subscribe(CoinCollected, self._on_coin_collected)
+            events.subscribe(CoinsReset, self._on_coins_reset)
+            events.subscribe(PlayerDied, self._on_player_died)
+            events.subscribe(GameRestarted, self._on_game_restarted)
+    
+    def _on_coin_collected(self, event):
+        self.update_coins(event.collected, event.total)
+    
+    def _on_coins_reset(self, event):
+        self.update_coins(event.collected, event.total)
+    
+    def _on_player_died(self, event):
+        self.show_game_over(event.coins)
+        self.update_health(False)
+    
+    def _on_game_restarted(self, event):
+        self.hide_game_over()
+        self.update_health(True)
     
     def _create_ui(self):
         """Create all UI elements with better design"""
@@ -94,16 +130,34 @@ class GameUI:
         )
         self.restart_text.hide()
     
+    def _changed(self, element, values):
+        """Record values for element; True if they differ from what is shown"""
+        if self.shown.get(element) == values:
+            return False
+        self.shown[element] = values
+        self.rebuilds += 1
+        return True
+    
     def update_position(self, x, y, heading):
         """Update position display"""
+        if self.position_rate:
+            now = time.perf_counter()
+            if now - self.last_position_refresh < 1.0 / self.position_rate:
+                return
+            self.last_position_refresh = now
+        
+        values = (int(x), int(y), int(heading) % 360)
+        if not self._changed('position', values):
+            return
         self.position_text.setText(
-            f"📍 Position: ({int(x)}, {int(y)})\n"
-            f"🧭 Heading: {int(heading) % 360}°"
+            f"📍 Position: ({values[0]}, {values[1]})\n"
+            f"🧭 Heading: {values[2]}°"
         )
     
     def update_coins(self, collected, total):
         """Update coin wallet display"""
-        self.coin_wallet.setText(f"COINS: ${collected}/{total}")
+        if self._changed('coins', (collected, total)):
+            self.coin_wallet.setText(f"COINS: ${collected}/{total}")
     
     def show_game_over(self, coins_collected):
         """Show game over screen"""
@@ -124,9 +178,67 @@ class GameUI:
     
     def update_health(self, is_alive):
         """Update health status"""
+        if not self._changed('health', is_alive):
+            return
         if is_alive:
             self.health_text.setText("STATUS: ALIVE")
             self.health_text.setFg((0.3, 1, 0.3, 1))
         else:
             self.health_text.setText("STATUS: DEAD")
             self.health_text.setFg((1, 0.2, 0.2, 1))
+
+class LoadingScreen:
+    def __init__(self):
+        self.text = OnscreenText(
+            text="LOADING...",
+            pos=(0, 0),
+            scale=0.1,
+            fg=(1, 1, 1, 1),
+            align=TextNode.ACenter,
+            mayChange=True,
+            shadow=(0, 0, 0, 1),
+            shadowOffset=(0.02, 0.02)
+        )
+    
+    def update_progress(self, done, total):
+        """Show how many assets have finished loading"""
+        self.text.setText(f"LOADING... {done}/{total}")
+    
+    def destroy(self):
+        """Remove the loading screen"""
+        self.text.destroy()
+
+class ProfilerOverlay:
+    def __init__(self):
+        self.text = OnscreenText(
+            text="",
+            pos=(-1.3, 0.65),
+            scale=0.045,
+            fg=(1, 1, 1, 1),
+            bg=(0, 0, 0, 0.5),
+            align=TextNode.ALeft,
+            mayChange=True
+        )
+        self.text.hide()
+        self.visible = False
+    
+    def toggle(self):
+        """Show or hide the overlay"""
+        self.visible = not self.visible
+        if self.visible:
+            self.text.show()
+        else:
+            self.text.hide()
+    
+    def update(self, averages, recording=False, counts=None):
+        """Show ms per frame for each subsystem, slowest first, then any per-frame counts"""
+        frame = averages.pop('frame', 0.0)
+        lines = [f"FRAME {frame:6.2f} ms ({1000 / frame if frame else 0:.0f} fps)"]
+        for name, ms in sorted(averages.items(), key=lambda item: -item[1]):
+            lines.append(f"{name:<14}{ms:6.2f} ms")
+        lines.append(f"{'render+other':<14}{frame - sum(averages.values()):6.2f} ms")
+        for name, count in (counts or {}).items():
+            lines.append(f"{name:<14}{count:>9,}")
+        if recording:
+            lines.append("[F4] RECORDING TRACE")
+        self.text.setText("\n".join(lines))
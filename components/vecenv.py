@@ -0,0 +1,467 @@
+"""
+Vector environment: thousands of independent worlds stepped as NumPy arrays
+"""
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import random
+import threading
+import time
+import numpy as np
+from components.coins import (
+    COIN_HEIGHT, COLLECT_RADIUS, EDGE_MARGIN as COIN_MARGIN, RESPAWN_DELAY, RESPAWN_DISTANCE,
+    plan_coins, respawn_spot
+)
+from components.heightfield import HeightField
+from components.obstacles import DANGER_RADIUS, EDGE_MARGIN as CRAB_MARGIN, plan_obstacles
+from components.player import (
+    EDGE_MARGIN as PLAYER_MARGIN, GROUND_OFFSET, MOVE_SPEED, START_POSITION, TURN_SPEED
+)
+from components.protocol import KEY_BITS
+from components.terrain import DEFAULT_SIZE as WORLD_SIZE, plan_vegetation, world_bounds
+from components.trees import EDGE_MARGIN as TREE_MARGIN, NUM_TREES, plan_forest
+
+# The game's rules come from Player, CoinManager and ObstacleManager; the
+# world is the default-sized one Simulation plays in
+CELL_SIZE = 1.25
+PLAYER_BOUNDS = world_bounds(None, PLAYER_MARGIN)
+COIN_BOUNDS = world_bounds(None, COIN_MARGIN)
+CRAB_BOUNDS = world_bounds(None, CRAB_MARGIN)
+TREE_BOUNDS = world_bounds(None, TREE_MARGIN)
+
+# random.Random.getstate(): 624 Mersenne Twister words, then the position in them
+RNG_WORDS = 625
+
+FORWARD = KEY_BITS['forward']
+BACKWARD = KEY_BITS['backward']
+LEFT = KEY_BITS['left']
+RIGHT = KEY_BITS['right']
+
+# Fields start on their own cache line
+ALIGNMENT = 64
+
+# Worker commands
+STEP = 0
+CLOSE = 1
+
+def state_fields(num_coins, num_obstacles):
+    """Per-world state: {name: (shape of one world's entry, dtype)}"""
+    return {
+        'actions': ((), np.uint8),              # Key bits for the next step (see KEY_BITS)
+        'position': ((3,), np.float32),         # Vec3, as Player keeps it
+        'previous_position': ((3,), np.float32),
+        'heading': ((), np.float64),
+        'time': ((), np.float64),               # Since the last restart
+        'frame': ((), np.int64),
+        'score': ((), np.int64),                # Coins collected since the last restart
+        'deaths': ((), np.int64),
+        'rewards': ((), np.int64),              # Coins collected in the last step
+        'dones': ((), np.bool_),                # Caught by a crab in the last step (then restarted)
+        'rng': ((RNG_WORDS,), np.uint32),       # random.Random state for coin respawns
+        'start_rng': ((RNG_WORDS,), np.uint32),
+        'coin_positions': ((num_coins, 3), np.float32),
+        'coin_start': ((num_coins, 3), np.float32),
+        'coin_active': ((num_coins,), np.bool_),
+        'coin_respawn': ((num_coins,), np.float64),  # When a collected coin comes back; inf if never
+        'crab_positions': ((num_obstacles, 3), np.float32),
+        'crab_active': ((num_obstacles,), np.bool_),  # Skipped spawns leave the last slots empty
+    }
+
+def _offsets(num_envs, fields):
+    """Byte offset of every field in a state buffer, and the buffer size"""
+    offsets = {}
+    offset = 0
+    for name, (shape, dtype) in fields.items():
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        offsets[name] = offset
+        offset += num_envs * int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize
+    return offsets, max(offset, 1)
+
+def state_nbytes(num_envs, fields):
+    """Size of a buffer holding the state of num_envs worlds"""
+    return _offsets(num_envs, fields)[1]
+
+def allocate_state(num_envs, fields, buffer=None):
+    """{name: array with one row per world}, laid out in buffer or in fresh memory"""
+    offsets, size = _offsets(num_envs, fields)
+    if buffer is None:
+        buffer = bytearray(size)
+    return {
+        name: np.ndarray((num_envs,) + shape, dtype, buffer, offsets[name])
+        for name, (shape, dtype) in fields.items()
+    }
+
+def swept_hits(points, start, end, radius):
+    """(worlds, N) mask of points within radius of each world's step start -> end.
+    
+    The per-world counterpart of spatial.segment_circle_hits: points is
+    (worlds, N, 2+), start and end are (worlds, 2+). Like the spatial index,
+    it works in double precision whatever the arrays hold.
+    """
+    start = start[:, :2].astype(np.float64)
+    d = end[:, :2] - start
+    p = points[..., :2] - start[:, None, :]
+    length2 = (d * d).sum(axis=1)
+    t = np.einsum('wnk,wk->wn', p, d)
+    np.divide(t, length2[:, None], out=t, where=length2[:, None] > 0)  # Standing still: t = 0
+    np.clip(t, 0.0, 1.0, out=t)
+    e = p - t[..., None] * d[:, None, :]
+    return np.einsum('wnk,wnk->wn', e, e) < radius * radius
+
+def plan_world(rng, heightfield, num_trees, num_coins, num_obstacles):
+    """Coin and crab spawns for the default world, drawn as Simulation draws them.
+    
+    The components' own planning functions are called in the order
+    Simulation builds the components, so rng first goes through Terrain's
+    flower patches and TreeManager's forest, which are thrown away here.
+    Returns (coin positions, crab positions); crab spawns too close to the
+    player's start are skipped, so there may be fewer than num_obstacles.
+    """
+    height_at = heightfield.height_at
+    plan_vegetation(rng, WORLD_SIZE, height_at)
+    plan_forest(rng, num_trees, TREE_BOUNDS, height_at)
+    coins = plan_coins(rng, num_coins, COIN_BOUNDS, height_at)
+    crabs = plan_obstacles(rng, num_obstacles, CRAB_BOUNDS, height_at)['positions']
+    return coins, crabs
+
+class VectorEnv:
+    """Step many independent worlds with one set of NumPy operations.
+    
+    The rules of Simulation (Player, CoinManager and ObstacleManager)
+    rewritten over arrays with a row per world and no scene graph. Each
+    step moves every player, collects the coins each one swept past,
+    brings pooled coins back in endless mode, and restarts every world
+    whose player a crab caught.
+    
+    All worlds share the terrain of seed. World i draws its coin and crab
+    spawns, then its coin respawns, from random.Random(seed + i) through
+    the components' own planning functions, set on that shared terrain.
+    World 0 therefore plays exactly like Simulation(seed), which
+    compare_with_simulation checks; the others are the draws of
+    Simulation(seed + i) but not its world, whose terrain would differ. A
+    world plays the same whichever process steps it.
+    
+    state is a dict made by allocate_state and rows the slice of worlds this
+    instance steps, so several processes can each step a share of one state.
+    Without a state, fresh memory is allocated and every world generated.
+    """
+    
+    def __init__(self, num_envs, seed=0, dt=1.0 / 60.0, num_coins=50, num_obstacles=5,
+                 endless=False, state=None, heights=None, rows=None, num_trees=NUM_TREES):
+        self.num_envs = num_envs
+        self.seed = seed
+        self.dt = dt
+        self.num_trees = num_trees  # Only planned, as Simulation does, to keep the draws in step
+        self.num_coins = num_coins
+        self.num_obstacles = num_obstacles
+        self.endless = endless
+        
+        self.heightfield = HeightField(seed, CELL_SIZE)
+        if heights is None:
+            heights = self.heightfield.bake(WORLD_SIZE)
+        self.heightfield.use_grid(heights)
+        
+        generate = state is None
+        if generate:
+            state = allocate_state(num_envs, state_fields(num_coins, num_obstacles))
+        self.state = state
+        self.rows = rows if rows is not None else slice(0, num_envs)
+        self.view = {name: array[self.rows] for name, array in state.items()}
+        if generate:
+            self.reset()
+    
+    def reset(self):
+        """Generate every world in rows and start it from the beginning"""
+        view = self.view
+        first = self.rows.start or 0
+        for i in range(len(view['rng'])):
+            rng = random.Random(self.seed + first + i)
+            coins, crabs = plan_world(
+                rng, self.heightfield, self.num_trees, self.num_coins, self.num_obstacles
+            )
+            view['coin_start'][i] = coins
+            view['crab_positions'][i] = 0.0
+            view['crab_positions'][i, :len(crabs)] = crabs
+            view['crab_active'][i] = np.arange(self.num_obstacles) < len(crabs)
+            view['start_rng'][i] = rng.getstate()[1]
+        view['deaths'][:] = 0
+        view['frame'][:] = 0
+        view['actions'][:] = 0
+        self._restart(np.arange(len(view['rng'])))
+    
+    def _restart(self, worlds):
+        """Put worlds (indices into rows) back at their start, like Simulation.restart"""
+        view = self.view
+        x, y, _ = START_POSITION
+        start = np.array([x, y, self.heightfield.height_at(x, y) + GROUND_OFFSET])
+        view['position'][worlds] = start
+        view['previous_position'][worlds] = start
+        view['heading'][worlds] = 0.0
+        view['time'][worlds] = 0.0
+        view['score'][worlds] = 0
+        view['coin_positions'][worlds] = view['coin_start'][worlds]
+        view['coin_active'][worlds] = True
+        view['coin_respawn'][worlds] = np.inf
+        view['rng'][worlds] = view['start_rng'][worlds]
+    
+    def step(self, actions=None):
+        """Advance every world in rows one fixed timestep; returns (rewards, dones).
+        
+        actions holds key bits per world; without it the actions already in
+        the state are used. The returned arrays are views into the state.
+        """
+        view = self.view
+        if actions is not None:
+            view['actions'][:] = actions
+        keys = view['actions']
+        dt = self.dt
+        
+        # Player
+        position = view['position']
+        view['previous_position'][:] = position
+        view['heading'] += np.where(keys & LEFT, TURN_SPEED * dt, 0.0)
+        view['heading'] -= np.where(keys & RIGHT, TURN_SPEED * dt, 0.0)
+        move = np.where(keys & BACKWARD, -MOVE_SPEED * dt, np.where(keys & FORWARD, MOVE_SPEED * dt, 0.0))
+        radians = np.radians(view['heading'])
+        position[:, 0] += move * np.sin(radians)
+        position[:, 1] += move * np.cos(radians)
+        np.clip(position[:, :2], *PLAYER_BOUNDS, out=position[:, :2])
+        position[:, 2] = self.heightfield.heights_at(position[:, 0], position[:, 1]) + GROUND_OFFSET
+        view['time'] += dt
+        
+        # Coins the player passed during the step
+        collected = view['coin_active'] & swept_hits(
+            view['coin_positions'], view['previous_position'], position, COLLECT_RADIUS
+        )
+        view['rewards'][:] = collected.sum(axis=1)
+        view['score'] += view['rewards']
+        view['coin_active'][collected] = False
+        if self.endless:
+            due = np.broadcast_to(view['time'][:, None] + RESPAWN_DELAY, collected.shape)
+            view['coin_respawn'][collected] = due[collected]
+            self._respawn_due()
+        
+        # Crabs
+        dones = (view['crab_active'] & swept_hits(
+            view['crab_positions'], view['previous_position'], position, DANGER_RADIUS
+        )).any(axis=1)
+        view['dones'][:] = dones
+        view['deaths'] += dones
+        view['frame'] += 1
+        if dones.any():
+            self._restart(np.flatnonzero(dones))
+        return view['rewards'], view['dones']
+    
+    def _respawn_due(self):
+        """Bring back every pooled coin whose delay is over, near its player.
+        
+        A world's respawns go on drawing from its random.Random stream
+        through CoinManager's respawn_spot, so they land where Simulation's
+        do. Respawns are rare next to steps, so the worlds with one due are
+        handled one at a time.
+        """
+        view = self.view
+        due = view['coin_respawn'] <= view['time'][:, None]
+        rng = random.Random()
+        for world in np.flatnonzero(due.any(axis=1)).tolist():
+            rng.setstate((3, tuple(view['rng'][world].tolist()), None))
+            near_x, near_y, _ = view['position'][world].tolist()
+            for coin in np.flatnonzero(due[world]).tolist():
+                x, y = respawn_spot(rng, near_x, near_y, RESPAWN_DISTANCE, COIN_BOUNDS)
+                z = self.heightfield.height_at(x, y) + COIN_HEIGHT
+                view['coin_positions'][world, coin] = (x, y, z)
+                view['coin_active'][world, coin] = True
+                view['coin_respawn'][world, coin] = np.inf
+            view['rng'][world] = rng.getstate()[1]
+    
+    def run(self, steps, policy=None):
+        """Step steps times; returns timings counting one frame per world per step"""
+        return _run(self, steps, policy)
+    
+    def get_state(self, world):
+        """Summary of one world, in the shape of Simulation.get_state"""
+        view = self.state
+        x, y, z = view['position'][world].tolist()
+        return {
+            'frame': int(view['frame'][world]),
+            'position': (round(x, 4), round(y, 4), round(z, 4)),
+            'heading': round(float(view['heading'][world]), 4),
+            'coins': int(view['score'][world]),
+            'deaths': int(view['deaths'][world]),
+        }
+
+class ParallelVectorEnv:
+    """A VectorEnv sharded over worker processes.
+    
+    The state of every world lives in one shared memory block; each worker
+    maps it and steps its own contiguous share of the worlds. A step is the
+    caller writing actions into the shared state and two waits on a barrier,
+    one to start the workers and one for them to finish, so nothing is
+    pickled or copied between processes per step. With workers=0 the worlds
+    are stepped in this process.
+    """
+    
+    def __init__(self, num_envs, workers=None, seed=0, dt=1.0 / 60.0, num_coins=50,
+                 num_obstacles=5, endless=False, num_trees=NUM_TREES):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.num_envs = num_envs
+        self.seed = seed
+        self.workers = max(0, min(workers, num_envs))
+        settings = {
+            'seed': seed, 'dt': dt, 'num_coins': num_coins,
+            'num_obstacles': num_obstacles, 'endless': endless, 'num_trees': num_trees,
+        }
+        
+        # Shared terrain and state, generated here once
+        fields = state_fields(num_coins, num_obstacles)
+        heights = HeightField(seed, CELL_SIZE).bake(WORLD_SIZE)
+        self.heights_memory = shared_memory.SharedMemory(create=True, size=heights.nbytes)
+        self.state_memory = shared_memory.SharedMemory(create=True, size=state_nbytes(num_envs, fields))
+        shared_heights = np.ndarray(heights.shape, heights.dtype, self.heights_memory.buf)
+        shared_heights[:] = heights
+        self.state = allocate_state(num_envs, fields, self.state_memory.buf)
+        self.local = VectorEnv(num_envs, state=self.state, heights=shared_heights, **settings)
+        self.local.reset()
+        
+        self.processes = []
+        if self.workers:
+            context = multiprocessing.get_context()
+            self.command = context.Value('b', STEP, lock=False)
+            self.barrier = context.Barrier(self.workers + 1)
+            bounds = np.linspace(0, num_envs, self.workers + 1).astype(int)
+            for lo, hi in zip(bounds[:-1], bounds[1:]):
+                process = context.Process(
+                    target=_worker, name=f"vecenv-{lo}",
+                    args=(self.state_memory, self.heights_memory, heights.shape, num_envs,
+                          slice(int(lo), int(hi)), settings, self.command, self.barrier),
+                    daemon=True,
+                )
+                process.start()
+                self.processes.append(process)
+    
+    def step(self, actions=None):
+        """Advance every world one fixed timestep; returns (rewards, dones) views"""
+        if not self.processes:
+            return self.local.step(actions)
+        if actions is not None:
+            self.state['actions'][:] = actions
+        self.barrier.wait()  # Go
+        self.barrier.wait()  # Every share stepped
+        return self.state['rewards'], self.state['dones']
+    
+    def run(self, steps, policy=None):
+        """Step steps times; returns timings counting one frame per world per step"""
+        return _run(self, steps, policy)
+    
+    def get_state(self, world):
+        """Summary of one world, in the shape of Simulation.get_state"""
+        return self.local.get_state(world)
+    
+    def close(self):
+        """Stop the workers and free the shared memory"""
+        if self.processes:
+            self.command.value = CLOSE
+            try:
+                self.barrier.wait(timeout=5.0)
+            except threading.BrokenBarrierError:
+                pass
+            for process in self.processes:
+                process.join(timeout=5.0)
+                if process.is_alive():
+                    process.terminate()
+            self.processes = []
+        
+        # Views must go before the memory they look at can be closed
+        self.state = self.local = None
+        for memory in (self.state_memory, self.heights_memory):
+            memory.close()
+            memory.unlink()
+
+def _worker(state_memory, heights_memory, heights_shape, num_envs, rows, settings, command, barrier):
+    """Worker process: step a share of the worlds whenever the barrier opens"""
+    try:
+        fields = state_fields(settings['num_coins'], settings['num_obstacles'])
+        state = allocate_state(num_envs, fields, state_memory.buf)
+        heights = np.ndarray(heights_shape, np.float64, heights_memory.buf)
+        env = VectorEnv(num_envs, state=state, heights=heights, rows=rows, **settings)
+        while True:
+            barrier.wait()
+            if command.value == CLOSE:
+                return
+            env.step()
+            barrier.wait()
+    except threading.BrokenBarrierError:
+        pass
+    except BaseException:
+        barrier.abort()  # Don't leave the other processes waiting
+        raise
+
+def _run(env, steps, policy):
+    """Time steps of a VectorEnv or ParallelVectorEnv"""
+    if policy is None:
+        policy = RandomActions(env.num_envs, env.seed)
+    
+    start = time.perf_counter()
+    for _ in range(steps):
+        env.step(policy(env))
+    elapsed = time.perf_counter() - start
+    
+    frames = steps * env.num_envs
+    return {
+        'worlds': env.num_envs,
+        'steps': steps,
+        'frames': frames,
+        'seconds': elapsed,
+        'fps': frames / elapsed if elapsed > 0 else float('inf'),
+    }
+
+class RandomActions:
+    """RandomPolicy for every world at once: hold random keys for random spells"""
+    
+    def __init__(self, num_envs, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.actions = np.zeros(num_envs, dtype=np.uint8)
+        self.frames_left = np.zeros(num_envs, dtype=np.int64)
+    
+    def __call__(self, env):
+        expired = np.flatnonzero(self.frames_left <= 0)
+        if len(expired):
+            self.frames_left[expired] = self.rng.integers(10, 91, len(expired))
+            held = self.rng.random((len(expired), 4)) < 0.4
+            held[:, 0] |= ~held[:, 1]  # Forward unless going backward
+            bits = np.array([FORWARD, BACKWARD, LEFT, RIGHT], dtype=np.uint8)
+            self.actions[expired] = (held * bits).sum(axis=1)
+        self.frames_left -= 1
+        return self.actions
+
+def compare_with_simulation(steps, seed=0, num_coins=50, num_obstacles=5, endless=False,
+                            num_trees=NUM_TREES):
+    """Play world 0 of a VectorEnv beside Simulation(seed) with the same keys.
+    
+    The keys come from RandomPolicy, and the simulation restarts right after
+    a death, as VectorEnv does within the step. Returns the first step whose
+    get_state differs as (step, simulation state, world state), or None if
+    all steps match.
+    """
+    from components.protocol import pack_keys
+    from components.simulation import RandomPolicy, Simulation
+    
+    settings = {
+        'seed': seed, 'num_coins': num_coins, 'num_obstacles': num_obstacles,
+        'endless': endless, 'num_trees': num_trees,
+    }
+    simulation = Simulation(**settings)
+    env = VectorEnv(1, **settings)
+    policy = RandomPolicy(seed)
+    for step in range(steps):
+        keys = policy(simulation)
+        simulation.step(keys)
+        if not simulation.is_alive:
+            simulation.restart()
+        env.step(pack_keys(keys))
+        expected = simulation.get_state()
+        actual = env.get_state(0)
+        if actual != expected:
+            return step, expected, actual
+    return None
@@ -0,0 +1,110 @@
+"""
+World files: a generated world saved as raw arrays and memory-mapped back
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import numpy as np
+
+# Generated worlds live here, named by seed and generation settings
+CACHE_DIR = ".world_cache"
+
+# Bump when generation changes, so stale files are regenerated
+WORLD_VERSION = 2
+
+MAGIC = b"WRLD"
+HEADER = struct.Struct("<4sII")  # magic, version, index length
+ALIGNMENT = 16
+
+def get_world_path(seed, settings, cache_dir=CACHE_DIR):
+    """Where the world for seed and generation settings is stored"""
+    key = json.dumps({'version': WORLD_VERSION, 'settings': settings}, sort_keys=True)
+    digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"world-{seed}-{digest}.world")
+
+def write_world(path, sections):
+    """Save {section: {name: array}} as one file.
+    
+    The file is a short header, a JSON index of every array's dtype, shape
+    and offset, then the raw array bytes, each aligned so it can be mapped
+    straight back into NumPy.
+    """
+    arrays = []
+    index = {}
+    offset = 0
+    for section, fields in sections.items():
+        for name, array in fields.items():
+            array = np.ascontiguousarray(array)
+            offset = -(-offset // ALIGNMENT) * ALIGNMENT
+            index[f"{section}/{name}"] = {
+                'dtype': array.dtype.str,
+                'shape': array.shape,
+                'offset': offset,
+            }
+            arrays.append((offset, array))
+            offset += array.nbytes
+    
+    # Offsets in the index count from the first aligned byte after it
+    index_bytes = json.dumps(index).encode()
+    data_start = -(-(HEADER.size + len(index_bytes)) // ALIGNMENT) * ALIGNMENT
+    
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    
+    # Write under a temporary name so a crash never leaves half a file
+    partial = path + ".partial"
+    with open(partial, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, WORLD_VERSION, len(index_bytes)))
+        out.write(index_bytes)
+        for array_offset, array in arrays:
+            out.seek(data_start + array_offset)
+            out.write(array.tobytes())
+        # An empty array last may be aligned past the final byte
+        out.truncate(data_start + offset)
+    os.replace(partial, path)
+
+def read_world(path):
+    """Map a world file; returns {section: {name: read-only array}}.
+    
+    Nothing is copied: the arrays view the mapped file and pages are read
+    in as they are touched. Raises ValueError for a file from another
+    version of the generator.
+    """
+    with open(path, 'rb') as source:
+        mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    magic, version, index_length = HEADER.unpack_from(mapped)
+    if magic != MAGIC or version != WORLD_VERSION:
+        raise ValueError(f"{path} is not a version {WORLD_VERSION} world file")
+    index = json.loads(mapped[HEADER.size:HEADER.size + index_length])
+    data_start = -(-(HEADER.size + index_length) // ALIGNMENT) * ALIGNMENT
+    
+    sections = {}
+    for key, entry in index.items():
+        section, name = key.split("/", 1)
+        dtype = np.dtype(entry['dtype'])
+        shape = tuple(entry['shape'])
+        count = int(np.prod(shape, dtype=np.int64))
+        array = np.frombuffer(mapped, dtype, count, data_start + entry['offset']).reshape(shape)
+        sections.setdefault(section, {})[name] = array
+    return sections
+
+def pack_rng_state(rng):
+    """A random.Random's whole state as a world file section.
+    
+    That is the state version, the Mersenne Twister words, and the spare
+    normal value gauss() keeps between calls (an empty array when there is
+    none), so unpack_rng_state restores the generator exactly.
+    """
+    version, words, gauss = rng.getstate()
+    return {
+        'version': np.array([version], dtype=np.int64),
+        'state': np.array(words, dtype=np.uint32),
+        'gauss': np.array([] if gauss is None else [gauss], dtype=np.float64),
+    }
+
+def unpack_rng_state(rng, section):
+    """Put a random.Random back in a state saved with pack_rng_state"""
+    gauss = float(section['gauss'][0]) if len(section['gauss']) else None
+    rng.setstate((int(section['version'][0]), tuple(int(word) for word in section['state']), gauss))
@@ -0,0 +1,51 @@
+"""
+Run a dedicated multiplayer server: one authoritative world, many TCP clients
+    
+    python server.py --port 7777 --seed 42
+"""
+import argparse
+import asyncio
+from components.server import GameServer, ServerWorld
+
+async def serve(args):
+    world = ServerWorld(seed=args.seed, num_coins=args.coins, num_obstacles=args.crabs)
+    server = GameServer(
+        world, args.host, args.port, tick_rate=args.tick_rate, snapshot_rate=args.snapshot_rate,
+        interest_radius=args.interest
+    )
+    await server.start()
+    print(f"Listening on {args.host}:{server.port}", flush=True)
+    
+    try:
+        while True:
+            await asyncio.sleep(args.report)
+            stats = server.get_stats()
+            print(
+                f"{stats['players']} players, tick {stats['tick_ms_p50']:.2f} ms p50 /"
+                f" {stats['tick_ms_p99']:.2f} ms p99 (budget {stats['tick_budget_ms']:.1f} ms),"
+                f" {stats['bytes_per_client_per_s'] / 1024:.1f} KiB/s per client",
+                flush=True
+            )
+    finally:
+        await server.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Dedicated multiplayer server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777, help="0 picks a free port")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--coins", type=int, default=200)
+    parser.add_argument("--crabs", type=int, default=20)
+    parser.add_argument("--tick-rate", type=int, default=30, help="simulation ticks per second")
+    parser.add_argument("--snapshot-rate", type=int, default=15, help="snapshots per second per client")
+    parser.add_argument("--interest", type=float, default=40.0, help="radius clients see around them")
+    parser.add_argument("--report", type=float, default=5.0, help="seconds between stats lines")
+    args = parser.parse_args()
+    
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
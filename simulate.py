@@ -0,0 +1,64 @@
+"""
+Run the game headless at a fixed timestep, as fast as the CPU allows
+    
+    python simulate.py --frames 10000 --seed 42
+    python simulate.py --replay session.keys
+"""
+import argparse
+from components.replay import ReplayDiverged, compare_final, final_state, read_log, replay_headless
+from components.simulation import Simulation
+from components.trees import NUM_TREES
+
+def run_replay(path):
+    """Re-run a session recorded with terrain_game.py --record and check it ends the same"""
+    log = read_log(path)
+    try:
+        simulation, stats = replay_headless(log)
+    except ReplayDiverged as error:
+        raise SystemExit(f"replay diverged: {error}")
+    print(f"{stats['frames']} frames in {stats['seconds']:.2f}s ({stats['fps']:.0f} frames/s)")
+    print(f"final state: {simulation.get_state()}")
+    
+    if log['final'] is None:
+        print("the log was never closed, so there is no final state to check")
+        return
+    problems = compare_final(log, final_state(simulation.player, simulation.coins, simulation.is_alive))
+    if problems:
+        raise SystemExit("replay diverged: " + "; ".join(problems))
+    print("replay matches the recording")
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless deterministic simulation")
+    parser.add_argument("--frames", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dt", type=float, default=1.0 / 60.0, help="fixed timestep in seconds")
+    parser.add_argument("--endless", action="store_true", help="collected coins respawn near the player")
+    parser.add_argument("--trees", type=int, default=NUM_TREES, help="trees planted (the game's count by default)")
+    parser.add_argument("--world", help="play in a world file saved by the game")
+    parser.add_argument("--check", action="store_true", help="run twice and verify both runs match")
+    parser.add_argument("--replay", metavar="LOG", help="re-run an input log recorded by the game")
+    args = parser.parse_args()
+    
+    if args.replay:
+        run_replay(args.replay)
+        return
+    
+    simulation = Simulation(
+        seed=args.seed, dt=args.dt, endless=args.endless, world=args.world, num_trees=args.trees
+    )
+    stats = simulation.run(args.frames)
+    state = simulation.get_state()
+    print(f"{stats['frames']} frames in {stats['seconds']:.2f}s ({stats['fps']:.0f} frames/s)")
+    print(f"final state: {state}")
+    
+    if args.check:
+        replay = Simulation(
+            seed=args.seed, dt=args.dt, endless=args.endless, world=args.world, num_trees=args.trees
+        )
+        replay.run(args.frames)
+        if replay.get_state() != state:
+            raise SystemExit(f"runs diverged: {replay.get_state()}")
+        print("replay matches")
+
+if __name__ == "__main__":
+    main()
@@ -4,22 +4,101 @@ A beautiful 3D world with terrain, trees, and character exploration
 """
 from direct.showbase.ShowBase import ShowBase
 from panda3d.core import Fog
+import argparse
+import atexit
+import math
+import os
+import random
 import sys
 
 # Import our components
-from components.player import Player
+from components.player import Player, MODEL_PATH
 from components.terrain import Terrain
-from components.trees import TreeManager
+from components.trees import LOD_DISTANCES, NUM_TREES, TreeManager
 from components.lighting import LightingManager
 from components.camera import CameraController
-from components.ui import GameUI
+from components.ui import GameUI, LoadingScreen, ProfilerOverlay
+from components.assets import AssetCache
+from components.profiler import Profiler
+from components.events import ChunkLoaded, ChunkUnloaded, EventBus, GameRestarted, PlayerDied, PlayerHit
 from components.coins import CoinManager
 from components.obstacles import ObstacleManager
+from components.streaming import WorldStreamer
+from components.spatial import SpatialHash
+from components.culling import fog_distance
+from components.shaders import enable_shadows, set_animation_time, set_lit_shader
+from components.shadows import ShadowManager
+from components.replay import InputPlayer, InputRecorder, compare_final, final_state, read_log
+from components.worldfile import (
+    CACHE_DIR as WORLD_DIR, get_world_path, pack_rng_state, read_world, unpack_rng_state, write_world
+)
+
+# Loaded in the background while the loading screen is up
+PRELOAD_MODELS = [MODEL_PATH, "models/box", "models/misc/sphere"]
+
+# Exponential fog density; it also sets how far anything is drawn
+FOG_DENSITY = 0.004
+
+# Ground metres covered by each sun shadow cascade around the camera, sharpest first
+SHADOW_CASCADES = (24.0, 72.0)
 
 class TerrainExplorer(ShowBase):
-    def __init__(self):
+    def __init__(self, streaming=False, view_radius=4, seed=None, num_tiles=5, num_trees=NUM_TREES,
+                 num_coins=50, num_obstacles=5, pstats=False, hud_rate=None, tick_rate=60,
+                 endless=False, world_dir=WORLD_DIR, record=None, replay=None,
+                 tree_lod_distances=LOD_DISTANCES, shadows=False):
         super().__init__()
         
+        # A replay plays back in the world and at the tick rate it was recorded with
+        self.replay_log = read_log(replay) if replay is not None else None
+        if self.replay_log is not None:
+            settings = self.replay_log['settings']
+            seed = self.replay_log['seed']
+            tick_rate = self.replay_log['tick_rate']
+            num_tiles = settings['num_tiles']
+            num_trees = settings['num_trees']
+            num_coins = settings['num_coins']
+            num_obstacles = settings['num_obstacles']
+            endless = settings['endless']
+            streaming = settings['streaming']
+        self.replay = None  # InputPlayer feeding the log's keys, once loaded
+        self.replay_reported = False
+        self.record_path = record  # Where to write this session's input log
+        self.input_recorder = None
+        
+        # Per-subsystem frame timings (F3 overlay, F4 trace, optional PStats)
+        self.profiler = Profiler()
+        if pstats:
+            self.profiler.connect_pstats()
+        
+        # World size and population
+        self.num_tiles = num_tiles
+        self.num_trees = num_trees
+        self.num_coins = num_coins
+        self.num_obstacles = num_obstacles
+        self.endless = endless  # Collected coins come back near the player
+        self.hud_rate = hud_rate  # Max position readout refreshes per second
+        self.tree_lod_distances = tree_lod_distances  # Where trees go low-poly, then flat
+        self.shadows_enabled = shadows  # Sun shadows (opt-in), when the GPU runs the shaders
+        self.shadow_state = None  # Changes whenever a shadow-casting thing moves
+        
+        # One generator for terrain, coin and crab placement, so a seed replays them
+        explicit_seed = seed is not None
+        if seed is None:
+            seed = random.randrange(2 ** 31)
+            print(f"World seed: {seed}")
+        self.rng = random.Random(seed)
+        self.seed = seed
+        
+        # A fixed world asked for by seed is generated once, then mapped from a file
+        self.world_path = None
+        if explicit_seed and world_dir is not None and not streaming:
+            self.world_path = get_world_path(seed, self._world_settings(), world_dir)
+        
+        # World streaming (chunks built around the player)
+        self.streaming = streaming
+        self.view_radius = view_radius
+        
         # Window configuration
         self.disableMouse()
         self.setBackgroundColor(0.53, 0.81, 0.92, 1)  # Beautiful sky blue
@@ -32,16 +111,56 @@ class TerrainExplorer(ShowBase):
             'right': False
         }
         
+        # Subsystems announce what happened here instead of being polled
+        self.events = EventBus()
+        self.events.subscribe(PlayerHit, self._on_player_hit)
+        
         # Game state
         self.is_alive = True
         self.game_over = False
+        self.anim_time = 0.0  # Clock for shader-driven idle animation
+        
+        # Gameplay runs in fixed ticks; rendering interpolates between them
+        self.tick_rate = tick_rate
+        self.tick_dt = 1.0 / tick_rate
+        self.accumulator = 0.0
+        self.max_frame_time = 0.25  # Drop time rather than spiral after a stall
+        
+        # Every component loads models through the shared cache
+        self.assets = AssetCache(self.loader)
+        self.assets.preload(PRELOAD_MODELS)
+        self.loaded = False
+        
+        # Build the world once the assets are in
+        self.loading_screen = LoadingScreen()
+        self.taskMgr.add(self._loading_task, "loading")
+    
+    def _loading_task(self, task):
+        """Keep the loading screen up until every preloaded asset is ready"""
+        self.loading_screen.update_progress(*self.assets.get_progress())
+        if not self.assets.is_ready():
+            return task.cont
+        
+        self.loading_screen.destroy()
         
         # Initialize components
         self._init_scene()
         self._init_input()
+        self.start_state = self.snapshot()  # Every restart comes back to this
+        self.loaded = True
+        
+        # Inputs are recorded or played back from the first tick on
+        if self.replay_log is not None:
+            self.replay = InputPlayer(self.replay_log['inputs'])
+        if self.record_path is not None:
+            self.input_recorder = InputRecorder(
+                self.record_path, self.seed, self.tick_rate, self._session_settings()
+            )
+            atexit.register(self._finish_recording)
         
         # Start game loop
         self.taskMgr.add(self.update, "update")
+        return task.done
     
     def _init_scene(self):
         """Initialize all scene components"""
@@ -51,33 +170,184 @@ class TerrainExplorer(ShowBase):
         # Add atmospheric fog
         self._setup_fog()
         
+        # Shadowed shaders have to be chosen before anything picks its shader
+        self.shadows = None
+        self.shadows_enabled = self.shadows_enabled and self._supports_shaders()
+        if self.shadows_enabled:
+            enable_shadows(len(SHADOW_CASCADES))
+            set_lit_shader(self.render, 'static')
+        
+        # Layouts from the world file, when this world was generated before
+        world = self._load_world()
+        
         # Create terrain
-        self.terrain = Terrain(self.loader, self.render)
+        self.terrain = Terrain(
+            self.assets, self.render, self.num_tiles, seed=self.seed,
+            streaming=self.streaming, rng=self.rng, layout=world.get('terrain'),
+            view_distance=self.draw_distance
+        )
+        
+        # The shadow inputs have to be there before trees draw their impostors
+        if self.shadows_enabled:
+            self._setup_shadows()
+        
+        # Create trees (instanced when the GPU can do it)
+        self.trees = TreeManager(
+            self.assets, self.render, self.num_trees,
+            instanced=self._supports_instancing(), terrain=self.terrain,
+            streaming=self.streaming, seed=self.terrain.seed, rng=self.rng,
+            layout=world.get('trees'), cell_size=self.terrain.tile_size,
+            view_distance=self.draw_distance, lod_distances=self.tree_lod_distances, window=self.win
+        )
         
-        # Create trees
-        self.trees = TreeManager(self.loader, self.render)
+        # Shared spatial index for pickup and collision queries
+        self.spatial = SpatialHash()
         
         # Create coins to collect
-        self.coins = CoinManager(self.loader, self.render)
+        self.coins = CoinManager(
+            self.assets, self.render, self.num_coins, terrain=self.terrain, spatial=self.spatial,
+            instanced=self._supports_instancing(), gpu_animation=self._supports_shaders(),
+            rng=self.rng, events=self.events, endless=self.endless, layout=world.get('coins'),
+            view_distance=self.draw_distance
+        )
+        if self.streaming:
+            self.coins.bounds = None  # The world goes on past the starting map
         
         # Create dangerous obstacles (crabs)
-        self.obstacles = ObstacleManager(self.loader, self.render)
+        self.obstacles = ObstacleManager(
+            self.assets, self.render, self.num_obstacles, terrain=self.terrain, spatial=self.spatial,
+            instanced=self._supports_instancing(), gpu_animation=self._supports_shaders(),
+            rng=self.rng, events=self.events, layout=world.get('crabs'),
+            view_distance=self.draw_distance
+        )
+        
+        # Carry on from where generation left the generator, either way
+        if world:
+            unpack_rng_state(self.rng, world['rng'])
+        elif self.world_path is not None:
+            self._save_world()
         
         # Create player character
-        self.player = Player(self.loader, self.render)
+        self.player = Player(self.assets, self.render, terrain=self.terrain)
+        
+        # Stream chunks around the player instead of a fixed world
+        self.streamer = None
+        if self.streaming:
+            self.player.bounds = None
+            self.streamer = WorldStreamer(
+                self.terrain, self.trees, radius=self._stream_radius(), events=self.events,
+                coins=self.coins, obstacles=self.obstacles
+            )
+            self.streamer.prime(self.player.get_position())
+        
+        # Sun shadows: terrain and trees cached per chunk, player and crabs every frame
+        if self.shadows is not None:
+            self._add_shadow_casters()
         
         # Setup camera controller
         self.camera_controller = CameraController(self.camera)
         
         # Create UI
-        self.ui = GameUI()
+        self.ui = GameUI(position_rate=self.hud_rate, events=self.events)
+        self.ui.update_coins(0, self.coins.get_total_coins())
+        self.profiler_overlay = ProfilerOverlay()
+    
+    def _stream_radius(self):
+        """Chunks streamed in around the player, in chunks"""
+        # Chunks wholly inside the fog would never be drawn, so don't build them
+        fog_radius = math.ceil(self.draw_distance / self.terrain.tile_size) + 1
+        return min(self.view_radius, fog_radius)
+    
+    def _setup_shadows(self):
+        """Shadow maps for the sun, with a slot in the static atlas per chunk"""
+        # A streamed world reuses slots as it moves; chunks are kept until
+        # they are more than radius + 1 away
+        slots = self.num_tiles
+        if self.streaming:
+            slots = 2 * self._stream_radius() + 3
+        self.shadows = ShadowManager(
+            self.win, self.render, self.cam, self.lighting.sun_np, self.terrain.tile_size, slots,
+            cascade_sizes=SHADOW_CASCADES
+        )
+    
+    def _add_shadow_casters(self):
+        """Say what casts which shadows, and queue a tile for every chunk"""
+        self.shadows.set_caster(self.terrain.terrain_node, 'static')
+        self.shadows.set_caster(self.trees.forest_node, 'static')
+        self.shadows.set_caster(self.obstacles.crab_root, 'dynamic')
+        self.shadows.set_caster(self.coins.coin_root, None)
+        if self.player.model is not None:
+            self.shadows.set_caster(self.player.model, 'dynamic')
+        
+        if self.streamer is None:
+            for tx in range(self.num_tiles):
+                for ty in range(self.num_tiles):
+                    self.shadows.add_tile((tx, ty))
+        else:
+            for key in self.streamer.loaded:
+                self.shadows.add_tile(key)
+            self.events.subscribe(ChunkLoaded, lambda event: self.shadows.add_tile(event.key))
+            self.events.subscribe(ChunkUnloaded, lambda event: self.shadows.remove_tile(event.key))
+    
+    def _world_settings(self):
+        """Everything besides the seed that changes what gets generated"""
+        return {
+            'num_tiles': self.num_tiles,
+            'num_trees': self.num_trees,
+            'num_coins': self.num_coins,
+            'num_obstacles': self.num_obstacles,
+        }
+    
+    def _session_settings(self):
+        """Everything besides the seed and inputs that a replay needs to match"""
+        return dict(self._world_settings(), endless=self.endless, streaming=self.streaming)
+    
+    def _finish_recording(self):
+        """Close the input log with how the session ended"""
+        self.input_recorder.close(final_state(self.player, self.coins, self.is_alive))
+        print(f"Input log written to {self.record_path} ({self.input_recorder.ticks} ticks)")
+    
+    def _load_world(self):
+        """Sections of this seed's world file, or {} if it needs generating"""
+        if self.world_path is None or not os.path.isfile(self.world_path):
+            return {}
+        try:
+            return read_world(self.world_path)
+        except (OSError, ValueError) as error:
+            print(f"Regenerating world: {error}")
+            return {}
+    
+    def _save_world(self):
+        """Write everything just generated to this seed's world file"""
+        write_world(self.world_path, {
+            'terrain': self.terrain.get_layout(),
+            'trees': self.trees.get_layout(),
+            'coins': self.coins.get_layout(),
+            'crabs': self.obstacles.get_layout(),
+            'rng': pack_rng_state(self.rng),
+        })
+    
+    def _supports_shaders(self):
+        """Check the GPU can run the GLSL shaders"""
+        return self.win is not None and self.win.getGsg().getSupportsGlsl()
+    
+    def _supports_instancing(self):
+        """Check the GPU can run the instanced renderers"""
+        if not self._supports_shaders():
+            return False
+        gsg = self.win.getGsg()
+        return gsg.getSupportsGeometryInstancing() and gsg.getSupportsBufferTexture()
     
     def _setup_fog(self):
         """Add atmospheric fog for depth"""
         fog = Fog("scene_fog")
         fog.setColor(0.53, 0.81, 0.92)
-        fog.setExpDensity(0.004)
+        fog.setExpDensity(FOG_DENSITY)
         self.render.setFog(fog)
+        
+        # Past this the fog hides everything, so nothing there is drawn
+        self.draw_distance = fog_distance(FOG_DENSITY)
+        self.camLens.setFar(self.draw_distance)
     
     def _init_input(self):
         """Setup keyboard controls"""
@@ -104,6 +374,10 @@ class TerrainExplorer(ShowBase):
         # Restart
         self.accept("r", self.restart_game)
         
+        # Profiling
+        self.accept("f3", self.profiler_overlay.toggle)
+        self.accept("f4", self.toggle_trace)
+        
         # Exit
         self.accept("escape", sys.exit)
     
@@ -111,65 +385,228 @@ class TerrainExplorer(ShowBase):
         """Update key state"""
         self.keys[key] = value
     
+    def toggle_trace(self):
+        """Start recording a trace, or stop and write it out"""
+        if self.profiler.recording:
+            path = self.profiler.stop_trace()
+            print(f"Trace written to {path}")
+        else:
+            self.profiler.start_trace()
+    
     def update(self, task):
         """Main game loop"""
-        dt = globalClock.getDt()
-        if dt > 0.1:
-            dt = 0.1
+        self.profiler.begin_frame()
+        
+        frame_dt = min(globalClock.getDt(), self.max_frame_time)
+        
+        if self.replay is not None:
+            self._follow_replay()
         
         if not self.game_over:
-            # Update player
-            self.player.update(self.keys, dt)
-            
-            # Get player position
-            player_pos = self.player.get_position()
-            player_heading = self.player.get_heading()
-            
-            # Update coins (check for collection)
-            self.coins.update(player_pos, dt)
-            
-            # Update obstacles and check collision
-            hit_obstacle = self.obstacles.update(player_pos, dt)
-            
-            if hit_obstacle:
-                self._handle_death()
-            
-            # Update camera
-            self.camera_controller.update(player_pos, player_heading, dt)
-            
-            # Update UI
-            self.ui.update_position(player_pos.x, player_pos.y, player_heading)
-            self.ui.update_coins(self.coins.get_collected_count(), self.coins.get_total_coins())
-            self.ui.update_health(self.is_alive)
+            self.advance(frame_dt)
+            self.update_ui()
+        
+        # Runs after game over too, so the cascades stop redrawing a still scene
+        self.update_shadows()
+        
+        if self.profiler_overlay.visible:
+            self.profiler_overlay.update(
+                self.profiler.get_averages(), self.profiler.recording, self.get_frame_counts()
+            )
         
         return task.cont
     
+    def advance(self, frame_dt):
+        """Run every whole tick frame_dt covers, then draw between the last two"""
+        self.accumulator += frame_dt
+        while self.accumulator >= self.tick_dt and self._can_tick():
+            self.update_world(self.tick_dt)
+            self.accumulator -= self.tick_dt
+        
+        self.sync_visuals(self.accumulator / self.tick_dt, frame_dt)
+    
+    def _can_tick(self):
+        """Whether the next fixed tick may run"""
+        if self.game_over:
+            return False
+        
+        # A replay stops at its end, and at a restart until the game catches up
+        return self.replay is None or not (self.replay.finished() or self.replay.restart_pending())
+    
+    def _follow_replay(self):
+        """Restart where the recording did, and report once it has played out"""
+        if self.replay_reported:
+            return
+        if self.replay.restart_pending() and self.game_over:
+            self.restart_game()
+            self.replay.restarted()
+            return
+        
+        if self.replay.restart_pending():
+            problems = [f"the recording restarted at tick {self.replay.tick}, but the player is alive"]
+        elif self.game_over and not self.replay.finished():
+            problems = [f"the player died at tick {self.replay.tick}, but the recording went on"]
+        elif self.replay.finished():
+            problems = compare_final(
+                self.replay_log, final_state(self.player, self.coins, self.is_alive)
+            )
+        else:
+            return
+        
+        self.replay_reported = True
+        if problems:
+            print("Replay diverged: " + "; ".join(problems))
+        else:
+            print(f"Replay finished: {self.replay.tick} ticks, matching the recording")
+    
+    def update_world(self, dt):
+        """Advance the game logic by one fixed tick of dt seconds"""
+        profile = self.profiler.section
+        
+        # The keys held this tick, from the keyboard or a replay
+        keys = self.keys
+        if self.replay is not None:
+            keys = self.replay.next_keys()
+        if self.input_recorder is not None:
+            self.input_recorder.record(keys)
+        
+        # Update player
+        with profile("player"):
+            self.player.update(keys, dt)
+        
+        # Where the player moved this tick; pickups and hits are swept along it
+        player_pos = self.player.get_position()
+        previous_pos = self.player.previous_position
+        
+        # Update coins (check for collection)
+        with profile("coins"):
+            self.coins.update(player_pos, dt, previous_pos)
+        
+        # Update obstacles (a hit arrives as a PlayerHit event)
+        with profile("obstacles"):
+            self.obstacles.update(player_pos, dt, previous_pos)
+        
+        # Coins and crabs left behind in dropped chunks come back around the player
+        if self.streamer is not None:
+            with profile("streaming"):
+                self.streamer.recycle(player_pos)
+        
+        # Advance shader-driven animation
+        self.anim_time += dt
+    
+    def sync_visuals(self, alpha, frame_dt):
+        """Move everything drawn to alpha of the way into the latest tick"""
+        profile = self.profiler.section
+        
+        with profile("visuals"):
+            player_pos, player_heading = self.player.sync_visuals(alpha)
+            self.coins.sync_visuals(alpha)
+            self.obstacles.sync_visuals(alpha)
+            clock = self.anim_time - (1.0 - alpha) * self.tick_dt
+            set_animation_time(self.render, clock)
+        
+        # Load and unload world chunks
+        if self.streamer is not None:
+            with profile("streaming"):
+                self.streamer.update(player_pos)
+        
+        # Update camera
+        with profile("camera"):
+            self.camera_controller.update(player_pos, player_heading, frame_dt)
+        
+        # Pick each tree's detail level for the new camera position
+        with profile("trees"):
+            self.trees.update(self.camera.getPos(self.render))
+        
+        # Crabs move and rock with the clock, so it and the player cover every dynamic caster
+        self.shadow_state = (tuple(player_pos), player_heading, clock)
+    
+    def update_shadows(self):
+        """Draw newly loaded shadow tiles, and cascades where something moved"""
+        if self.shadows is not None:
+            with self.profiler.section("shadows"):
+                self.shadows.update(self.shadow_state)
+    
+    def get_frame_counts(self):
+        """Triangles the trees submit this frame, per detail level"""
+        counts = self.trees.get_triangle_count(self.cam)
+        return {f"tris.{detail}": count for detail, count in counts.items()}
+    
+    def update_ui(self):
+        """Refresh the HUD from the current game state"""
+        # Coins and status follow game events; only the position is polled
+        player_pos = self.player.get_position()
+        with self.profiler.section("ui.position"):
+            self.ui.update_position(player_pos.x, player_pos.y, self.player.get_heading())
+    
+    def _on_player_hit(self, event):
+        """A crab caught the player"""
+        if not self.game_over:
+            self._handle_death()
+    
     def _handle_death(self):
         """Handle player death"""
         self.is_alive = False
         self.game_over = True
-        coins_collected = self.coins.get_collected_count()
-        self.ui.show_game_over(coins_collected)
-        self.ui.update_health(False)
+        self.events.publish(PlayerDied("crab", self.coins.get_collected_count()))
     
     def restart_game(self):
         """Restart the game"""
         if not self.game_over:
             return
         
-        # Reset game state
+        self.reset_session()
+        if self.input_recorder is not None:
+            self.input_recorder.restarted()
+    
+    def reset_session(self):
+        """Put every component back as it was when the world was built"""
+        self.restore(self.start_state)
         self.is_alive = True
         self.game_over = False
         
-        # Reset player position
-        self.player.model.setPos(50, 50, 2)
-        self.player.position.set(50, 50, 2)
-        self.player.heading = 0
-        
-        # Hide game over UI
-        self.ui.hide_game_over()
-        self.ui.update_health(True)
+        # Hides the game over UI
+        self.events.publish(GameRestarted())
+    
+    def snapshot(self):
+        """Copy of all session state; the scene graph itself is reused, not copied"""
+        return {
+            'player': self.player.snapshot(),
+            'coins': self.coins.snapshot(),
+            'obstacles': self.obstacles.snapshot(),
+            'camera': self.camera_controller.snapshot(),
+            'rng': self.rng.getstate(),
+            'anim_time': self.anim_time,
+        }
+    
+    def restore(self, state):
+        """Return to a snapshot in place, without reloading or rebuilding anything"""
+        self.player.restore(state['player'])
+        self.coins.restore(state['coins'])
+        self.obstacles.restore(state['obstacles'])
+        self.camera_controller.restore(state['camera'])
+        self.rng.setstate(state['rng'])
+        self.anim_time = state['anim_time']
+        self.accumulator = 0.0
 
 if __name__ == "__main__":
-    game = TerrainExplorer()
+    parser = argparse.ArgumentParser(description="3D Terrain Explorer")
+    parser.add_argument("--seed", type=int, help="world seed (random by default)")
+    parser.add_argument("--endless", action="store_true", help="collected coins respawn near the player")
+    parser.add_argument("--stream", action="store_true", help="build the world in chunks around the player")
+    parser.add_argument("--record", metavar="LOG", help="write this session's inputs to LOG")
+    parser.add_argument("--replay", metavar="LOG", help="play back a recorded session")
+    parser.add_argument("--pstats", action="store_true", help="send frame timings to a running PStats server")
+    parser.add_argument(
+        "--tree-lod", type=float, nargs=2, metavar=("LOW", "IMPOSTOR"), default=LOD_DISTANCES,
+        help="distances at which trees switch to low-poly meshes, then impostors"
+    )
+    parser.add_argument("--shadows", action="store_true", help="let the sun cast shadows (slow without a GPU)")
+    args = parser.parse_args()
+    
+    game = TerrainExplorer(
+        seed=args.seed, endless=args.endless, streaming=args.stream, record=args.record,
+        replay=args.replay, pstats=args.pstats, tree_lod_distances=tuple(args.tree_lod),
+        shadows=args.shadows
+    )
     game.run()
@@ -0,0 +1,34 @@
+"""
+Everything spawns on the terrain, whatever its size
+"""
+import pytest
+from components.player import Player
+from components.simulation import Simulation
+from components.trees import TreeManager
+
+@pytest.mark.parametrize('num_tiles', [3, 5, 8])
+def test_entities_stay_on_the_terrain(num_tiles):
+    simulation = Simulation(seed=4, num_tiles=num_tiles, num_coins=200, num_obstacles=40, num_trees=0)
+    terrain = simulation.terrain
+    size = terrain.size
+    trees = TreeManager(
+        simulation.assets, simulation.render, 200, terrain=terrain, seed=terrain.seed,
+        build_models=False
+    )
+    
+    for name, xy in (
+        ('coins', simulation.coins.positions[:, :2]),
+        ('crabs', simulation.obstacles.positions[:, :2]),
+        ('trees', trees.get_layout()['positions'][:, :2]),
+    ):
+        assert len(xy), name
+        assert xy.min() > 0 and xy.max() < size, name
+    
+    # Walking north stops short of the edge
+    player = Player(simulation.assets, simulation.render, terrain=terrain, build_model=False)
+    keys = {'forward': True, 'backward': False, 'left': False, 'right': False}
+    for _ in range(60 * size // 20):
+        player.update(keys, 1.0 / 60.0)
+    position = player.get_position()
+    assert 0 < position.y < size
+    assert position.y == player.bounds[1]
@@ -0,0 +1,115 @@
+"""
+The coin pool: live coins stay packed at the front and indexed
+"""
+import random
+import numpy as np
+from panda3d.core import NodePath, Vec3
+from components.assets import AssetCache, CoreLoader
+from components.coins import CoinManager
+from components.events import CoinCollected, CoinRespawned
+
+def make_coins(num_coins=40, endless=False, seed=7):
+    """A pool on flat ground, and the events it publishes"""
+    coins = CoinManager(
+        AssetCache(CoreLoader()), NodePath("render"), num_coins, rng=random.Random(seed),
+        endless=endless
+    )
+    published = []
+    for event_type in (CoinCollected, CoinRespawned):
+        coins.events.subscribe(event_type, published.append)
+    return coins, published
+
+def live_positions(coins):
+    """Positions of the coins in play, as a set"""
+    return {tuple(p) for p in coins.positions[:coins.active_count].tolist()}
+
+def check_pool(coins):
+    """Exactly the first active_count slots are indexed, each where its coin is"""
+    active = coins.active_count
+    assert 0 <= active <= coins.num_coins
+    assert coins.spatial.count('coins') == active
+    for i in range(active):
+        x, y, _ = coins.positions[i]
+        assert coins.spatial.positions[('coins', i)] == (x, y)
+        assert i in coins.spatial.query('coins', float(x), float(y), 0.01)
+
+def test_collecting_swaps_the_last_coin_in():
+    coins, published = make_coins()
+    check_pool(coins)
+    
+    rng = random.Random(1)
+    while coins.active_count:
+        index = rng.randrange(coins.active_count)
+        last = coins.positions[coins.active_count - 1].copy()
+        before = live_positions(coins)
+        taken = tuple(coins.positions[index].tolist())
+        x, y, _ = taken
+        
+        collected = coins.collect(Vec3(x, y, 0))
+        check_pool(coins)
+        assert collected >= 1
+        assert coins.collected_count == coins.num_coins - coins.active_count
+        if collected == 1:
+            assert live_positions(coins) == before - {taken}
+            if index < coins.active_count:
+                assert (coins.positions[index] == last).all()
+    
+    assert [event.collected for event in published] == list(range(1, coins.num_coins + 1))
+    assert coins.collect(Vec3(100, 100, 0), Vec3(0, 0, 0)) == 0
+
+def test_one_step_collects_every_coin_it_passes():
+    coins, published = make_coins(200)
+    start, end = Vec3(15, 15, 0), Vec3(185, 185, 0)
+    ahead = coins.spatial.query_segment('coins', start.x, start.y, end.x, end.y, coins.collect_radius)
+    passed = {tuple(coins.positions[i].tolist()) for i in ahead}
+    before = live_positions(coins)
+    assert passed
+    
+    assert coins.collect(end, start) == len(passed)
+    check_pool(coins)
+    assert live_positions(coins) == before - passed
+    assert len({event.index for event in published}) == len(passed)
+
+def test_endless_coins_come_back_into_freed_slots():
+    coins, published = make_coins(30, endless=True)
+    player = Vec3(100, 100, 0)
+    for i in range(10):
+        x, y, _ = coins.positions[i]
+        coins.collect(Vec3(x, y, 0))
+    collected = coins.num_coins - coins.active_count
+    assert collected >= 10
+    check_pool(coins)
+    
+    # Nothing returns before the delay is up
+    coins.update(player, coins.respawn_delay / 2)
+    assert coins.num_coins - coins.active_count == collected
+    coins.advance(coins.respawn_delay)
+    coins.respawn_due(near=player)
+    assert coins.active_count == coins.num_coins
+    assert not coins.respawn_queue
+    check_pool(coins)
+    
+    respawned = [event.index for event in published if isinstance(event, CoinRespawned)]
+    assert sorted(respawned) == list(range(coins.num_coins - collected, coins.num_coins))
+    low, high = coins.respawn_distance
+    for index in respawned:
+        distance = np.hypot(*(coins.positions[index, :2] - (player.x, player.y)))
+        assert low - 1e-3 <= distance <= high + 1e-3
+    
+    # A full pool has no slot to give
+    assert coins.respawn_coin(near=player) is None
+
+def test_restore_rebuilds_the_index():
+    coins, _ = make_coins(endless=True)
+    start = coins.snapshot()
+    for i in range(0, 20, 3):
+        x, y, _ = coins.positions[i]
+        coins.collect(Vec3(x, y, 0))
+    coins.advance(1.0)
+    
+    coins.restore(start)
+    check_pool(coins)
+    assert coins.active_count == coins.num_coins
+    assert coins.collected_count == 0
+    assert not coins.respawn_queue
+    assert (coins.positions == start['positions']).all()
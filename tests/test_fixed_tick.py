@@ -0,0 +1,74 @@
+"""
+The game's fixed tick: the same inputs play out the same at any frame rate
+"""
+import numpy as np
+import pytest
+from panda3d.core import loadPrcFileData
+
+# A software offscreen buffer, so no display or GPU is needed
+loadPrcFileData('', "window-type offscreen\naudio-library-name null\nload-display p3tinydisplay")
+
+from terrain_game import TerrainExplorer
+
+# With a power-of-two tick rate the frame times below are exact in binary,
+# so both runs cover exactly the same number of ticks
+TICK_RATE = 64
+TURN_AT = 2.0  # Seconds in, when the keys change
+DURATION = 4.0
+
+@pytest.fixture(scope="module")
+def game():
+    try:
+        game = TerrainExplorer(
+            seed=6, num_coins=300, endless=True, tick_rate=TICK_RATE, world_dir=None
+        )
+    except Exception as error:
+        pytest.skip(f"no offscreen buffer: {error}")
+    while not game.loaded:
+        game.taskMgr.step()
+    yield game
+    game.destroy()
+
+def play(game, frame_times):
+    """Run a session from the start, frame by frame; returns its final state"""
+    game.reset_session()
+    for key in game.keys:
+        game.set_key(key, False)
+    game.set_key('forward', True)
+    
+    elapsed = 0.0
+    for frame_dt in frame_times:
+        if elapsed == TURN_AT:
+            game.set_key('left', True)
+        game.advance(frame_dt)
+        elapsed += frame_dt
+    assert elapsed == DURATION
+    
+    state = game.snapshot()
+    del state['camera']  # The camera eases per frame; only the ticks must agree
+    return state
+
+def frames(pattern, duration=DURATION):
+    """Frame times repeating pattern (in 1/256ths of a second) up to duration"""
+    times = []
+    while sum(times) < duration:
+        times.append(pattern[len(times) % len(pattern)] / 256)
+    return times
+
+def test_frame_rate_does_not_change_the_game(game):
+    steady = play(game, frames([8]))  # 32 frames per second
+    uneven = play(game, frames([1, 5, 3, 7]))  # About 64, varying every frame
+    
+    assert steady['player'] == uneven['player']
+    assert steady['rng'] == uneven['rng']
+    assert steady['anim_time'] == uneven['anim_time']
+    for part in ('coins', 'obstacles'):
+        for name, value in steady[part].items():
+            if isinstance(value, np.ndarray):
+                np.testing.assert_array_equal(value, uneven[part][name])
+            else:
+                assert value == uneven[part][name]
+    
+    # The player did get somewhere and pick coins up on the way
+    assert steady['player'] != game.start_state['player']
+    assert steady['coins']['collected_count'] > 0
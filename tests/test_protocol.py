@@ -0,0 +1,92 @@
+"""
+Network messages survive encoding and decoding
+"""
+import asyncio
+import random
+import numpy as np
+import pytest
+from components.protocol import (
+    COUNT, HEADING_SCALE, INPUT, KEY_BITS, LAYERS, MSG_INPUT, MSG_SNAPSHOT, POSITION_SCALE,
+    SNAPSHOT, WELCOME, SnapshotDecoder, SnapshotEncoder, dequantize, encode_frame, pack_keys,
+    quantize, read_frame, unpack_keys
+)
+
+def read_all(data):
+    """Every (message type, payload) in a byte stream"""
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        frames = []
+        while not reader.at_eof():
+            frames.append(await read_frame(reader))
+        return frames
+    return asyncio.run(read())
+
+def test_frames_round_trip():
+    messages = [
+        (MSG_INPUT, INPUT.pack(7, 5)),
+        (MSG_SNAPSHOT, bytes(range(256)) * 3),
+        (MSG_INPUT, b""),
+    ]
+    data = b"".join(encode_frame(msg_type, payload) for msg_type, payload in messages)
+    assert read_all(data) == messages
+    assert WELCOME.unpack(WELCOME.pack(65535, 30, 40.0)) == (65535, 30, 40.0)
+
+def test_keys_round_trip():
+    for bits in range(16):
+        keys = unpack_keys(bits)
+        assert set(keys) == set(KEY_BITS)
+        assert pack_keys(keys) == bits
+
+def test_quantize_round_trip():
+    rng = np.random.default_rng(3)
+    positions = rng.uniform(-1000, 1000, size=(500, 3))
+    headings = rng.uniform(-720, 720, size=500)
+    records = quantize(np.arange(500), positions, headings)
+    for record, position, heading in zip(records, positions, headings):
+        x, y, z, h = dequantize(record)
+        assert np.allclose((x, y, z), position, atol=0.5 / POSITION_SCALE)
+        turn = (h - heading) % 360.0
+        assert min(turn, 360.0 - turn) <= 0.5 / HEADING_SCALE + 1e-9
+
+def random_view(rng, ids):
+    """Records for a random subset of ids, some of which moved"""
+    visible = np.sort(rng.sample(ids, rng.randrange(len(ids))))
+    positions = [(i % 7 + rng.choice((0.0, 0.0, 0.25)), i % 11, 1.0) for i in visible]
+    return quantize(visible, np.array(positions).reshape(-1, 3), [i * 10.0 for i in visible])
+
+@pytest.mark.parametrize('seed', range(5))
+def test_snapshots_round_trip(seed):
+    rng = random.Random(seed)
+    encoder = SnapshotEncoder()
+    decoder = SnapshotDecoder()
+    for tick in range(50):
+        visible = {layer: random_view(rng, range(40)) for layer in LAYERS}
+        decoder.decode(encoder.encode(tick, tick * 3, tick % 4, visible))
+        
+        assert (decoder.tick, decoder.score, decoder.deaths) == (tick, tick * 3, tick % 4)
+        for layer in LAYERS:
+            entities = decoder.entities[layer]
+            assert sorted(entities) == visible[layer]['id'].tolist()
+            for record in visible[layer]:
+                assert entities[int(record['id'])].tobytes() == record.tobytes()
+
+def test_unchanged_snapshot_sends_no_records():
+    rng = random.Random(1)
+    encoder = SnapshotEncoder()
+    visible = {layer: random_view(rng, range(40)) for layer in LAYERS}
+    first = encoder.encode(0, 0, 0, visible)
+    again = encoder.encode(1, 0, 0, visible)
+    assert len(again) == SNAPSHOT.size + len(LAYERS) * 2 * COUNT.size
+    
+    decoder = SnapshotDecoder()
+    decoder.decode(first)
+    decoder.decode(again)
+    assert decoder.tick == 1
+    for layer in LAYERS:
+        assert sorted(decoder.entities[layer]) == visible[layer]['id'].tolist()
+    
+    # Everything leaving range is sent as removals
+    decoder.decode(encoder.encode(2, 0, 0, {layer: quantize([], []) for layer in LAYERS}))
+    assert all(not decoder.entities[layer] for layer in LAYERS)
@@ -0,0 +1,73 @@
+"""
+Input logs replay the session they recorded
+"""
+import numpy as np
+import pytest
+from components.replay import (
+    RESTART, InputRecorder, ReplayDiverged, compare_final, final_state, read_log, replay_headless
+)
+from components.simulation import RandomPolicy, Simulation
+from components.trees import NUM_TREES
+
+# Crowded enough that the player dies and restarts during the session
+WORLD = {'num_tiles': 5, 'num_trees': NUM_TREES, 'num_coins': 300, 'num_obstacles': 40}
+SETTINGS = dict(WORLD, endless=True, streaming=False)
+SEED = 3
+TICK_RATE = 60
+TICKS = 1500
+
+def record_session(path, close=True):
+    """Play a session with random keys, logging it as the game does; returns the Simulation"""
+    simulation = Simulation(seed=SEED, dt=1.0 / TICK_RATE, endless=True, **WORLD)
+    recorder = InputRecorder(str(path), SEED, TICK_RATE, SETTINGS)
+    policy = RandomPolicy(SEED)
+    for _ in range(TICKS):
+        if not simulation.is_alive:
+            simulation.restart()
+            recorder.restarted()
+        keys = policy(simulation)
+        recorder.record(keys)
+        simulation.step(keys)
+    if close:
+        recorder.close(final_state(simulation.player, simulation.coins, simulation.is_alive))
+    else:
+        recorder.out.flush()
+    return simulation
+
+def test_log_round_trip(tmp_path):
+    path = tmp_path / "session.keys"
+    simulation = record_session(path)
+    assert simulation.deaths > 0
+    
+    log = read_log(str(path))
+    assert (log['seed'], log['tick_rate'], log['settings']) == (SEED, TICK_RATE, SETTINGS)
+    assert len(log['inputs']) == TICKS
+    assert int(np.count_nonzero(log['inputs'] & RESTART)) == simulation.deaths - (not simulation.is_alive)
+    assert log['final'] == final_state(simulation.player, simulation.coins, simulation.is_alive)
+    
+    replayed, stats = replay_headless(log)
+    assert stats['frames'] == TICKS
+    assert compare_final(log, final_state(replayed.player, replayed.coins, replayed.is_alive)) == []
+    assert replayed.get_state() == simulation.get_state()
+
+def test_unfinished_log_keeps_its_inputs(tmp_path):
+    path = tmp_path / "crashed.keys"
+    simulation = record_session(path, close=False)
+    log = read_log(str(path))
+    assert log['final'] is None
+    assert len(log['inputs']) == TICKS
+    assert compare_final(log, final_state(simulation.player, simulation.coins, False)) == []
+
+def test_missing_restart_diverges(tmp_path):
+    path = tmp_path / "session.keys"
+    record_session(path)
+    log = read_log(str(path))
+    log['inputs'] = log['inputs'] & ~np.uint8(RESTART)
+    with pytest.raises(ReplayDiverged):
+        replay_headless(log)
+
+def test_other_files_are_refused(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_bytes(b"not an input log, just some text that is long enough")
+    with pytest.raises(ValueError):
+        read_log(str(path))
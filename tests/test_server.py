@@ -0,0 +1,21 @@
+"""
+ServerWorld player bookkeeping
+"""
+from components import server
+from components.server import ServerWorld
+
+def test_ids_skip_connected_players(monkeypatch):
+    monkeypatch.setattr(server, 'MAX_PLAYERS', 4)
+    world = ServerWorld(seed=1, num_coins=10, num_obstacles=2)
+    assert [world.add_player() for _ in range(4)] == [0, 1, 2, 3]
+    assert world.add_player() is None  # Every id taken
+    
+    # Ids wrap around, past the ones still in use
+    world.remove_player(2)
+    assert world.add_player() == 2
+    world.remove_player(0)
+    world.remove_player(3)
+    assert world.add_player() == 3
+    assert world.add_player() == 0
+    assert sorted(world.players) == [0, 1, 2, 3]
+    assert world.add_player() is None
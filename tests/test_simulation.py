@@ -0,0 +1,55 @@
+"""
+Simulation snapshots: restoring one and stepping again replays the same game
+"""
+import numpy as np
+from components.simulation import RandomPolicy, Simulation
+
+def assert_same_state(a, b):
+    """Two snapshots hold equal player, coin, crab and generator state"""
+    assert a['player'] == b['player']
+    assert a['rng'] == b['rng']
+    for part in ('coins', 'obstacles'):
+        assert a[part].keys() == b[part].keys()
+        for name, value in a[part].items():
+            if isinstance(value, np.ndarray):
+                np.testing.assert_array_equal(value, b[part][name])
+            else:
+                assert value == b[part][name]
+
+def play(simulation, inputs):
+    """Step through inputs, restarting after a death as run() does"""
+    for keys in inputs:
+        if not simulation.is_alive:
+            simulation.restart()
+        simulation.step(keys)
+
+def test_restore_then_step_again_matches():
+    # Endless, so the snapshot is taken with collections and respawns under way
+    simulation = Simulation(seed=11, num_coins=300, num_obstacles=20, endless=True)
+    policy = RandomPolicy(11)
+    play(simulation, [policy(simulation) for _ in range(600)])
+    assert simulation.coins.get_collected_count() > 0
+    
+    saved = simulation.snapshot()
+    saved_alive = simulation.is_alive
+    inputs = [policy(simulation) for _ in range(900)]
+    
+    play(simulation, inputs)
+    first = simulation.snapshot()
+    first_alive = simulation.is_alive
+    assert first['coins']['collected_count'] > saved['coins']['collected_count']
+    
+    simulation.restore(saved)
+    simulation.is_alive = saved_alive
+    assert_same_state(simulation.snapshot(), saved)
+    
+    play(simulation, inputs)
+    assert_same_state(simulation.snapshot(), first)
+    assert simulation.is_alive == first_alive
+    
+    # The spatial index was rebuilt to match, not left as the first run had it
+    coins = simulation.coins
+    assert coins.spatial.count('coins') == coins.active_count
+    for i in range(coins.active_count):
+        x, y, _ = coins.positions[i]
+        assert coins.spatial.positions[('coins', i)] == (x, y)
@@ -0,0 +1,89 @@
+"""
+SpatialHash queries against testing every item
+"""
+import math
+import random
+import numpy as np
+import pytest
+from components.spatial import BATCH_THRESHOLD, SpatialHash, bucket_rows, segment_circle_hits
+
+WORLD_SIZE = 200.0
+RADIUS = 2.5
+
+def scatter(count, seed=1234):
+    """A SpatialHash of count random coins, and their positions"""
+    rng = random.Random(seed)
+    positions = [(rng.uniform(0, WORLD_SIZE), rng.uniform(0, WORLD_SIZE)) for _ in range(count)]
+    grid = SpatialHash()
+    for index, (x, y) in enumerate(positions):
+        grid.insert('coins', index, x, y)
+    return grid, positions
+
+def brute_force(positions, px, py, radius):
+    """Every item within radius of (px, py)"""
+    return [i for i, (x, y) in enumerate(positions) if math.hypot(px - x, py - y) < radius]
+
+def segments(count, seed=99):
+    """Player steps: short ones, long ones crossing many cells, and standing still"""
+    rng = random.Random(seed)
+    steps = []
+    for i in range(count):
+        x0 = rng.uniform(0, WORLD_SIZE)
+        y0 = rng.uniform(0, WORLD_SIZE)
+        length = (0.0, 0.33, 5.0, 60.0)[i % 4]
+        heading = rng.uniform(0, 2 * math.pi)
+        steps.append((x0, y0, x0 + math.sin(heading) * length, y0 + math.cos(heading) * length))
+    return steps
+
+@pytest.mark.parametrize('count', [50, 5000])
+def test_query_matches_brute_force(count):
+    grid, positions = scatter(count)
+    for x0, y0, _, _ in segments(200):
+        for radius in (RADIUS, 12.0):
+            assert sorted(grid.query('coins', x0, y0, radius)) == brute_force(positions, x0, y0, radius)
+
+@pytest.mark.parametrize('count', [50, 5000, 50000])
+def test_query_segment_matches_batched_test(count):
+    # Few items take the one-by-one path, many the NumPy one
+    grid, positions = scatter(count)
+    for x0, y0, x1, y1 in segments(200):
+        hits, _ = segment_circle_hits(positions, x0, y0, x1, y1, RADIUS)
+        found = grid.query_segment('coins', x0, y0, x1, y1, RADIUS)
+        assert sorted(found) == hits.nonzero()[0].tolist()
+
+@pytest.mark.parametrize('count', [BATCH_THRESHOLD // 2, BATCH_THRESHOLD * 4])
+def test_query_segment_order(count):
+    # Items along the segment come back in the order it reaches them
+    grid = SpatialHash()
+    for index in range(count):
+        grid.insert('coins', index, 10.0 + (count - index) * 0.5, 20.0)
+    found = grid.query_segment('coins', 5.0, 20.0, 15.0 + count * 0.5, 20.0, RADIUS)
+    assert found == list(range(count - 1, -1, -1))
+
+def test_standing_still_is_a_point_query():
+    grid, positions = scatter(500)
+    for x, y, _, _ in segments(100):
+        found = grid.query_segment('coins', x, y, x, y, RADIUS)
+        assert sorted(found) == sorted(grid.query('coins', x, y, RADIUS))
+
+def test_layers_and_moves():
+    grid, positions = scatter(500)
+    grid.insert('crabs', 0, *positions[0])
+    assert grid.count('coins') == 500
+    assert grid.count('crabs') == 1
+    
+    # Moved and removed items are found where they are now, and only there
+    grid.move('coins', 0, 150.0, 150.0)
+    grid.remove('coins', 1)
+    positions[0] = (150.0, 150.0)
+    positions[1] = (math.inf, math.inf)
+    for x, y in ((150.0, 150.0), positions[2], (20.0, 20.0)):
+        assert sorted(grid.query('coins', x, y, 12.0)) == brute_force(positions, x, y, 12.0)
+    assert grid.query('crabs', 150.0, 150.0, 1.0) == []
+
+def test_bucket_rows_matches_grid_cells():
+    grid, positions = scatter(2000)
+    cells = bucket_rows(np.array(positions), grid.cell_size)
+    assert sum(len(rows) for rows in cells.values()) == len(positions)
+    for (cx, cy), rows in cells.items():
+        assert sorted(grid.cells[('coins', cx, cy)]) == rows.tolist()
@@ -0,0 +1,81 @@
+"""
+World streaming: chunks load and evict around a moving player, and the
+coin and crab pools follow it
+"""
+import math
+import random
+from panda3d.core import NodePath, Vec3
+from components.assets import AssetCache, CoreLoader
+from components.coins import CoinManager
+from components.obstacles import ObstacleManager
+from components.spatial import SpatialHash
+from components.streaming import WorldStreamer
+from components.terrain import Terrain
+from components.trees import TreeManager
+
+def make_streamer(seed=3, radius=3):
+    """A streamed world with trees, coins and crabs, as the game builds it"""
+    assets = AssetCache(CoreLoader())
+    render = NodePath("render")
+    rng = random.Random(seed)
+    terrain = Terrain(assets, render, 5, seed=seed, streaming=True, rng=rng)
+    trees = TreeManager(assets, render, 200, terrain=terrain, streaming=True, seed=seed, rng=rng)
+    spatial = SpatialHash()
+    coins = CoinManager(assets, render, 50, terrain=terrain, spatial=spatial, rng=rng)
+    coins.bounds = None
+    obstacles = ObstacleManager(assets, render, 5, terrain=terrain, spatial=spatial, rng=rng)
+    return WorldStreamer(terrain, trees, radius=radius, coins=coins, obstacles=obstacles)
+
+def chunks_from(streamer, key, pos):
+    """Distance in chunks from the chunk under pos"""
+    cx, cy = streamer.terrain.chunk_key(pos.x, pos.y)
+    return math.hypot(key[0] - cx, key[1] - cy)
+
+def test_chunks_load_and_evict_around_the_player():
+    streamer = make_streamer()
+    try:
+        pos = Vec3(50, 50, 0)
+        streamer.prime(pos)
+        start = set(streamer.loaded)
+        assert streamer.get_stats()['evicted'] == 0
+        
+        for step in range(2000):
+            pos = Vec3(50 + step, 50 + step * 0.5, 0)
+            streamer.update(pos)
+            stats = streamer.get_stats()
+            assert stats['loaded'] == stats['built'] - stats['evicted']
+            assert all(chunks_from(streamer, key, pos) <= streamer.radius + 1 for key in streamer.loaded)
+        
+        # Walking 2 km leaves nothing behind but what's near the end
+        streamer.prime(pos)
+        stats = streamer.get_stats()
+        assert stats['pending'] == 0
+        assert not start & streamer.loaded
+        assert stats['evicted'] >= len(start)
+        assert stats['loaded'] == stats['built'] - stats['evicted']
+        assert set(streamer._wanted(streamer.center)) <= streamer.loaded
+        assert len(streamer.terrain.chunks) == stats['loaded']
+    finally:
+        streamer.shutdown()
+
+def test_coins_and_crabs_follow_the_player():
+    streamer = make_streamer()
+    coins, obstacles = streamer.coins, streamer.obstacles
+    try:
+        for step in range(2000):
+            pos = Vec3(50 + step, 50 - step * 0.5, 0)
+            streamer.recycle(pos)
+        
+        assert streamer.get_stats()['recycled'] > 0
+        assert coins.get_active_count() == coins.num_coins
+        for positions in (coins.positions[:coins.active_count], obstacles.positions):
+            for x, y, _ in positions:
+                key = streamer.terrain.chunk_key(x, y)
+                assert chunks_from(streamer, key, pos) <= streamer.radius + 1
+        
+        # Moved entities are indexed where they now are
+        assert coins.spatial.count('coins') == coins.num_coins
+        for index, (x, y, _) in enumerate(obstacles.positions):
+            assert obstacles.spatial.positions[('crabs', index)] == (x, y)
+    finally:
+        streamer.shutdown()
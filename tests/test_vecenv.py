@@ -0,0 +1,28 @@
+"""
+VectorEnv against the Simulation whose rules it rewrites
+"""
+from components.simulation import Simulation
+from components.vecenv import VectorEnv, compare_with_simulation
+
+# Crowded enough that the player dies and collects coins within the run
+CROWDED = {'num_coins': 300, 'num_obstacles': 40}
+
+def test_world_plays_like_simulation():
+    assert compare_with_simulation(1200, seed=3, **CROWDED) is None
+
+def test_endless_world_plays_like_simulation():
+    assert compare_with_simulation(1200, seed=3, endless=True, **CROWDED) is None
+
+def test_world_zero_has_simulations_layout():
+    simulation = Simulation(seed=5, num_obstacles=10)
+    env = VectorEnv(2, seed=5, num_obstacles=10)
+    crabs = simulation.obstacles.get_layout()['positions']
+    assert (env.state['coin_start'][0] == simulation.coins.get_layout()['positions']).all()
+    assert (env.state['crab_positions'][0][env.state['crab_active'][0]] == crabs).all()
+    assert env.state['start_rng'][0].tolist() == list(simulation.rng.getstate()[1])
+
+def test_skipped_crab_slots_stay_empty():
+    env = VectorEnv(64, seed=1, num_obstacles=10)
+    inactive = ~env.state['crab_active']
+    assert inactive.any()
+    assert not env.state['crab_positions'][inactive].any()
@@ -0,0 +1,70 @@
+"""
+World files: a generated world maps back exactly as it was generated
+"""
+import random
+import numpy as np
+import pytest
+from panda3d.core import NodePath
+from components.assets import AssetCache, CoreLoader
+from components.coins import CoinManager
+from components.obstacles import ObstacleManager
+from components.simulation import Simulation
+from components.terrain import Terrain
+from components.trees import NUM_TREES, TreeManager
+from components.worldfile import pack_rng_state, read_world, write_world
+
+SEED = 8
+
+def generate_world(seed=SEED):
+    """Build the world the game builds for seed; returns its world file sections"""
+    assets = AssetCache(CoreLoader())
+    render = NodePath("render")
+    rng = random.Random(seed)
+    terrain = Terrain(assets, render, 5, seed=seed, rng=rng)
+    trees = TreeManager(
+        assets, render, NUM_TREES, terrain=terrain, seed=terrain.seed, rng=rng, build_models=False
+    )
+    coins = CoinManager(assets, render, 50, terrain=terrain, rng=rng)
+    obstacles = ObstacleManager(assets, render, 5, terrain=terrain, rng=rng)
+    return {
+        'terrain': terrain.get_layout(),
+        'trees': trees.get_layout(),
+        'coins': coins.get_layout(),
+        'crabs': obstacles.get_layout(),
+        'rng': pack_rng_state(rng),
+    }
+
+def test_world_round_trip(tmp_path):
+    path = str(tmp_path / "world.world")
+    generated = generate_world()
+    write_world(path, generated)
+    
+    mapped = read_world(path)
+    assert mapped.keys() == generated.keys()
+    for section, fields in generated.items():
+        assert mapped[section].keys() == fields.keys()
+        for name, array in fields.items():
+            array = np.asarray(array)
+            assert mapped[section][name].dtype == array.dtype
+            np.testing.assert_array_equal(mapped[section][name], array)
+    
+    # The mapped arrays view the file, so nothing may write through them
+    with pytest.raises(ValueError):
+        mapped['terrain']['heights'][0, 0] = 1.0
+
+def test_simulation_in_a_saved_world_matches_a_generated_one(tmp_path):
+    path = str(tmp_path / "world.world")
+    write_world(path, generate_world())
+    
+    generated = Simulation(seed=SEED)
+    loaded = Simulation(seed=SEED, world=path)
+    np.testing.assert_array_equal(loaded.terrain.heights, generated.terrain.heights)
+    np.testing.assert_array_equal(loaded.coins.positions, generated.coins.positions)
+    np.testing.assert_array_equal(loaded.obstacles.positions, generated.obstacles.positions)
+    assert loaded.rng.getstate() == generated.rng.getstate()
+
+def test_other_versions_are_refused(tmp_path):
+    path = tmp_path / "old.world"
+    path.write_bytes(b"WRLD" + bytes(8))
+    with pytest.raises(ValueError):
+        read_world(str(path))